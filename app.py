@@ -1,25 +1,89 @@
+import time
+
+_INICIO_IMPORT = time.perf_counter()
+
 from flask import (
-    Flask, render_template, request,
-    redirect, session, Response, jsonify
+    Flask, render_template, request, abort, send_file,
+    redirect, session, Response, jsonify, make_response,
+    g, has_request_context, before_render_template, template_rendered
 )
-from openpyxl import Workbook
+import click
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+from werkzeug.middleware.proxy_fix import ProxyFix
 import io
+import csv
+import base64
+import bisect
+import binascii
+import re
+import zipfile
+import gzip
+import hashlib
 import psycopg2
 import psycopg2.extras
 from psycopg2 import pool
 import os
-import time
+import sys
+import json
 import uuid
-from datetime import datetime
+import mimetypes
+import unicodedata
+import importlib.util
+import math
+import tempfile
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date
+from decimal import Decimal
+from xml.sax.saxutils import escape
 from functools import wraps
-from supabase import create_client
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# pyarrow es opcional y pesado: solo se importa al generar un Parquet
+PARQUET_DISPONIBLE = importlib.util.find_spec("pyarrow") is not None
 
 # ==========================================================
 # CONFIGURACIÓN GENERAL
 # ==========================================================
 
 app = Flask(__name__)
-app.secret_key = 'barriada-segura'
+app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+
+
+def cargar_secret_key():
+    """SECRET_KEY del entorno o, si falta, una aleatoria guardada en instance/.
+
+    El archivo se crea una sola vez (os.link falla si otro worker ganó la
+    carrera), así todos los workers y reinicios firman con la misma clave."""
+    clave = os.environ.get("SECRET_KEY")
+    if clave:
+        return clave
+    ruta = os.path.join(app.instance_path, "secret_key")
+    if not os.path.exists(ruta):
+        os.makedirs(app.instance_path, exist_ok=True)
+        fd, temporal = tempfile.mkstemp(dir=app.instance_path)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(os.urandom(32))
+            os.link(temporal, ruta)
+            print(f"ADVERTENCIA: SECRET_KEY no definida; se generó {ruta}")
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(temporal)
+    with open(ruta, 'rb') as f:
+        return f.read()
+
+
+app.secret_key = cargar_secret_key()
 
 DATABASE_URL = os.environ.get("DATABASE_URL")
 
@@ -27,7 +91,62 @@ SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
 SUPABASE_BUCKET = os.environ.get("SUPABASE_BUCKET")
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+# 'supabase', 'local' o 'memoria'; sin Supabase configurado, disco local
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "supabase" if SUPABASE_URL else "local")
+STORAGE_LOCAL_DIR = os.environ.get("STORAGE_LOCAL_DIR", os.path.join(app.instance_path, "almacen"))
+ARCHIVOS_CACHE_DIR = os.environ.get("ARCHIVOS_CACHE_DIR", os.path.join(app.instance_path, "archivos"))
+ARCHIVOS_CACHE_MAX_MB = int(os.environ.get("ARCHIVOS_CACHE_MAX_MB", 512))
+ARCHIVOS_TIMEOUT = float(os.environ.get("ARCHIVOS_TIMEOUT", 30))
+
+TOTAL_CASAS = 250
+
+CACHE_MAX_ENTRADAS = int(os.environ.get("CACHE_MAX_ENTRADAS", 512))
+CACHE_DIR = os.environ.get("CACHE_DIR", os.path.join(tempfile.gettempdir(), "barriada-cache"))
+CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL")
+CACHE_RESPUESTAS_MAX = int(os.environ.get("CACHE_RESPUESTAS_MAX", 128))
+CACHE_FRAGMENTOS_MAX = int(os.environ.get("CACHE_FRAGMENTOS_MAX", 64))
+JINJA_CACHE_DIR = os.environ.get("JINJA_CACHE_DIR", os.path.join(app.instance_path, "jinja"))
+
+UPLOAD_WORKERS = int(os.environ.get("UPLOAD_WORKERS", 2))
+UPLOAD_SPOOL_DIR = os.environ.get("UPLOAD_SPOOL_DIR", os.path.join(app.instance_path, "subidas"))
+UPLOAD_MAX_INTENTOS = int(os.environ.get("UPLOAD_MAX_INTENTOS", 8))
+UPLOAD_REINTENTO_CADA = int(os.environ.get("UPLOAD_REINTENTO_CADA", 30))
+
+EXPORT_DIR = os.environ.get("EXPORT_DIR", os.path.join(app.instance_path, "exportes"))
+IMPORT_DIR = os.environ.get("IMPORT_DIR", os.path.join(app.instance_path, "importes"))
+IMPORT_MAX_FILAS = int(os.environ.get("IMPORT_MAX_FILAS", 5000))
+
+ASSETS_DIR = os.path.join(app.static_folder, "dist")
+ASSETS_MAPA = os.path.join(app.static_folder, "assets.json")
+MINIATURA_LADO = 480
+VISTA_PREVIA_LADO = 160
+IMAGEN_MAX_LADO = int(os.environ.get("IMAGEN_MAX_LADO", 1600))
+
+PAGINA_DEFECTO = 50
+PAGINA_MAX = 200
+
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 0))
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+
+ARGON2_TIEMPO = int(os.environ.get("ARGON2_TIEMPO", 3))
+ARGON2_MEMORIA_KB = int(os.environ.get("ARGON2_MEMORIA_KB", 65536))
+HASH_OBJETIVO_MS = float(os.environ.get("HASH_OBJETIVO_MS", 250))
+LOGIN_INTENTOS = int(os.environ.get("LOGIN_INTENTOS", 5))
+LOGIN_RECARGA_S = float(os.environ.get("LOGIN_RECARGA_S", 60))
+LOGIN_IP_INTENTOS = int(os.environ.get("LOGIN_IP_INTENTOS", 20))
+LOGIN_IP_RECARGA_S = float(os.environ.get("LOGIN_IP_RECARGA_S", 3))
+SESION_RECARGA_S = float(os.environ.get("SESION_RECARGA_S", 30))
+# Proxies de confianza delante de la app. Con 0 (el valor por defecto) se
+# ignoran X-Forwarded-For/-Proto y la IP es la de la conexión. Detrás de
+# un proxy inverso (nginx, el balanceador del hosting) poner PROXY_SALTOS
+# igual al número de proxies que agregan su salto a X-Forwarded-For, y
+# solo si gunicorn no es alcanzable sin pasar por ellos: de lo contrario
+# cualquiera elige su IP con el encabezado y esquiva el límite de logins.
+PROXY_SALTOS = int(os.environ.get("PROXY_SALTOS", 0))
+
+STARTUP_BUDGET_MS = float(os.environ.get("STARTUP_BUDGET_MS", 1500))
+MIGRAR_AL_INICIAR = os.environ.get("MIGRAR_AL_INICIAR") == "1"
 
 # ==========================================================
 # CONTEXTO GLOBAL PARA TEMPLATES
@@ -41,46 +160,211 @@ def inject_session():
 # POOL DE CONEXIONES A POSTGRESQL
 # ==========================================================
 
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 5))
+DB_POOL_VALIDAR_TRAS = float(os.environ.get("DB_POOL_VALIDAR_TRAS", 60))
+DB_CONNECT_TIMEOUT = int(os.environ.get("DB_CONNECT_TIMEOUT", 5))
+
+
+class PoolConexiones:
+    """Pool de conexiones con espera acotada, validación por edad y métricas.
+
+    Las conexiones libres se apilan en self.libres, a lo sumo minconn, y se
+    toman con self.lock. Las nuevas se abren fuera del lock, así un connect
+    lento no frena a los hilos que devuelven o toman conexiones libres.
+    self.cupos (un semáforo de maxconn) acota cuántas hay abiertas. Una
+    conexión solo se valida con SELECT 1 si estuvo ociosa más de
+    validar_tras segundos; las recién abiertas y el resto se entregan sin
+    viaje extra. Cuando todas están ocupadas se espera hasta timeout
+    segundos en lugar de fallar con PoolError al instante.
+    """
+
+    def __init__(self, dsn, minconn, maxconn, timeout, validar_tras):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.validar_tras = validar_tras
+        self.cupos = threading.BoundedSemaphore(maxconn)
+        self.lock = threading.Lock()
+        self.cerrado = False
+        self.libres = []
+        self.ultimo_uso = {}
+        self.prestadas = {}
+        self.metricas = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'descartadas': 0,
+            'validaciones': 0,
+            'espera_segundos_total': 0.0,
+            'espera_segundos_max': 0.0,
+            'uso_segundos_total': 0.0,
+            'uso_segundos_max': 0.0,
+        }
+        for _ in range(minconn):
+            conn = self._abrir()
+            self.libres.append(conn)
+            self.ultimo_uso[conn] = time.monotonic()
+
+    @property
+    def closed(self):
+        return self.cerrado
+
+    def _abrir(self):
+        return psycopg2.connect(self.dsn, connect_timeout=DB_CONNECT_TIMEOUT,
+                                cursor_factory=CursorMedido)
+
+    def _cerrar(self, conn, descartada=True):
+        with self.lock:
+            self.ultimo_uso.pop(conn, None)
+            if descartada:
+                self.metricas['descartadas'] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _sacar(self):
+        with self.lock:
+            if self.cerrado:
+                raise pool.PoolError("El pool de conexiones está cerrado")
+            conn = self.libres.pop() if self.libres else None
+            if conn is not None:
+                ahora = time.monotonic()
+                ocioso = ahora - self.ultimo_uso.get(conn, ahora)
+                if not conn.closed and ocioso >= self.validar_tras:
+                    self.metricas['validaciones'] += 1
+        if conn is None:
+            # Sin libres: se abre una nueva, fuera del lock y ya fresca
+            conn = self._abrir()
+            with self.lock:
+                self.ultimo_uso[conn] = time.monotonic()
+            return conn, 0.0
+        if conn.closed:
+            self._cerrar(conn)
+            return None, ocioso
+        return conn, ocioso
+
+    def _obtener_valida(self):
+        for intento in range(3):
+            conn, ocioso = self._sacar()
+            if conn is None:
+                continue
+            if ocioso < self.validar_tras:
+                return conn
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+                return conn
+            except Exception as e:
+                print(f"Conexión del pool inválida (intento {intento+1}/3): {e}")
+                self._cerrar(conn)
+        raise pool.PoolError("No se pudo obtener una conexión válida del pool")
+
+    def getconn(self):
+        inicio = time.monotonic()
+        if not self.cupos.acquire(timeout=self.timeout):
+            with self.lock:
+                self.metricas['timeouts'] += 1
+            raise pool.PoolError(
+                f"Pool agotado: {self.maxconn} conexiones en uso por más de {self.timeout}s"
+            )
+        try:
+            conn = self._obtener_valida()
+        except Exception:
+            self.cupos.release()
+            raise
+        ahora = time.monotonic()
+        espera = ahora - inicio
+        with self.lock:
+            self.prestadas[conn] = ahora
+            self.metricas['checkouts'] += 1
+            self.metricas['espera_segundos_total'] += espera
+            self.metricas['espera_segundos_max'] = max(self.metricas['espera_segundos_max'], espera)
+        return conn
+
+    def putconn(self, conn, close=False):
+        ahora = time.monotonic()
+        prestada = None
+        try:
+            descartar = close or conn.closed
+            if not descartar:
+                # Como hacía ThreadedConnectionPool: una transacción abierta
+                # se deshace y una conexión en estado desconocido se cierra
+                estado = conn.info.transaction_status
+                if estado == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                    descartar = True
+                elif estado != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        descartar = True
+            with self.lock:
+                prestada = self.prestadas.pop(conn, None)
+                if prestada is not None:
+                    uso = ahora - prestada
+                    self.metricas['uso_segundos_total'] += uso
+                    self.metricas['uso_segundos_max'] = max(self.metricas['uso_segundos_max'], uso)
+                guardar = (not descartar and not self.cerrado
+                           and len(self.libres) < self.minconn)
+                if guardar:
+                    self.libres.append(conn)
+                    self.ultimo_uso[conn] = ahora
+            if not guardar:
+                # Por encima de minconn libres se cierra sin contar como descartada
+                self._cerrar(conn, descartada=descartar)
+        finally:
+            if prestada is not None:
+                self.cupos.release()
+
+    def closeall(self):
+        with self.lock:
+            self.cerrado = True
+            conexiones = self.libres + list(self.prestadas)
+            self.libres = []
+        for conn in conexiones:
+            self._cerrar(conn, descartada=False)
+
+    def stats(self):
+        with self.lock:
+            datos = dict(self.metricas)
+            datos['en_uso'] = len(self.prestadas)
+            datos['ociosas'] = len(self.libres)
+        datos['max'] = self.maxconn
+        return datos
+
+
 connection_pool = None
+_pool_lock = threading.Lock()
+
 
 def init_pool():
     global connection_pool
-    for intento in range(5):
-        try:
-            connection_pool = pool.ThreadedConnectionPool(
-                minconn=1,
-                maxconn=5,
-                dsn=DATABASE_URL
-            )
-            print("Pool de conexiones creado correctamente.")
+    with _pool_lock:
+        if connection_pool is not None and not connection_pool.closed:
             return
-        except Exception as e:
-            print(f"Error al crear pool (intento {intento+1}/5): {e}")
-            time.sleep(3)
-    print("ADVERTENCIA: No se pudo crear el pool de conexiones.")
+        connection_pool = PoolConexiones(
+            DATABASE_URL,
+            minconn=DB_POOL_MIN,
+            maxconn=DB_POOL_MAX,
+            timeout=DB_POOL_TIMEOUT,
+            validar_tras=DB_POOL_VALIDAR_TRAS
+        )
+        print(f"Pool de conexiones creado correctamente (max {DB_POOL_MAX}).")
 
 
 def get_conn():
-    global connection_pool
     if connection_pool is None or connection_pool.closed:
         init_pool()
-    for intento in range(3):
-        try:
-            conn = connection_pool.getconn()
-            conn.cursor().execute("SELECT 1")
-            return conn
-        except Exception as e:
-            print(f"Conexión del pool inválida (intento {intento+1}/3): {e}")
-            try:
-                connection_pool.putconn(conn, close=True)
-            except Exception:
-                pass
-            time.sleep(1)
-    raise Exception("No se pudo obtener una conexión válida del pool")
+    inicio = time.perf_counter()
+    conn = connection_pool.getconn()
+    registrar_espera_pool(time.perf_counter() - inicio)
+    return conn
 
 
 def release_conn(conn):
-    global connection_pool
     try:
         if connection_pool and not connection_pool.closed:
             connection_pool.putconn(conn)
@@ -96,186 +380,2722 @@ def release_conn(conn):
 
 def get_cursor():
     conn = get_conn()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cur = conn.cursor(cursor_factory=CursorDictMedido)
     return cur, conn
 
 # ==========================================================
-# SUPABASE STORAGE
+# MÉTRICAS
 # ==========================================================
+# Cada petición acumula en g.medicion el tiempo en SQL (los cursores del
+# pool miden cada execute), la espera por conexión y el render de Jinja.
+# Al terminar se vuelca a histogramas por ruta que /metrics expone en
+# formato Prometheus, y a la cabecera Server-Timing. Los valores son del
+# proceso: con varios workers de gunicorn cada uno reporta los suyos.
+# Server-Timing solo va a quien puede ver /metrics: una sesión de admin o
+# quien trae METRICS_TOKEN; al resto no se le muestran los tiempos internos.
+# Con SLOW_REQUEST_MS > 0 las peticiones más lentas que eso se escriben
+# en el log con la lista de consultas que hicieron.
 
-def subir_a_supabase(file, carpeta):
-    ext = file.filename.rsplit('.', 1)[-1].lower()
-    nombre = f"{carpeta}/{uuid.uuid4()}.{ext}"
-    contenido = file.read()
-    supabase.storage.from_(SUPABASE_BUCKET).upload(
-        nombre,
-        contenido,
-        file_options={
-            "content-type": file.mimetype,
-            "upsert": False
-        }
-    )
-    return supabase.storage.from_(SUPABASE_BUCKET).get_public_url(nombre)
+LIMITES_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                    0.25, 0.5, 1, 2.5, 5, 10)
+LIMITES_CONSULTAS = (1, 2, 3, 5, 10, 20, 50, 100)
+SQL_LENTAS_MAX = 200
+
+
+def _etiquetas_prometheus(nombres, valores):
+    if not nombres:
+        return ''
+    pares = []
+    for nombre, valor in zip(nombres, valores):
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pares.append(f'{nombre}="{valor}"')
+    return '{' + ','.join(pares) + '}'
+
+
+class Histograma:
+    """Histograma con límites fijos y una serie por combinación de etiquetas."""
+
+    def __init__(self, nombre, ayuda, etiquetas=(), limites=LIMITES_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.limites = limites
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observar(self, valor, *etiquetas):
+        i = bisect.bisect_left(self.limites, valor)
+        with self.lock:
+            serie = self.series.get(etiquetas)
+            if serie is None:
+                # Una cuenta por límite más +Inf, y la suma
+                serie = self.series[etiquetas] = [0] * (len(self.limites) + 1) + [0.0]
+            serie[i] += 1
+            serie[-1] += valor
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with self.lock:
+            series = {k: list(v) for k, v in self.series.items()}
+        for valores, serie in sorted(series.items()):
+            acumulado = 0
+            for limite, cuenta in zip(self.limites + ('+Inf',), serie):
+                acumulado += cuenta
+                etiquetas = _etiquetas_prometheus(self.etiquetas + ('le',), valores + (limite,))
+                lineas.append(f"{self.nombre}_bucket{etiquetas} {acumulado}")
+            etiquetas = _etiquetas_prometheus(self.etiquetas, valores)
+            lineas.append(f"{self.nombre}_sum{etiquetas} {serie[-1]:.6f}")
+            lineas.append(f"{self.nombre}_count{etiquetas} {acumulado}")
+        return '\n'.join(lineas) + '\n'
+
+
+class Contador:
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def incrementar(self, *etiquetas):
+        with self.lock:
+            self.series[etiquetas] = self.series.get(etiquetas, 0) + 1
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        with self.lock:
+            series = dict(self.series)
+        for valores, total in sorted(series.items()):
+            lineas.append(f"{self.nombre}{_etiquetas_prometheus(self.etiquetas, valores)} {total}")
+        return '\n'.join(lineas) + '\n'
+
+
+METRICA_PETICIONES = Contador(
+    'http_requests_total', 'Peticiones atendidas.', ('ruta', 'metodo', 'estado'))
+METRICA_DURACION = Histograma(
+    'http_request_duration_seconds', 'Duración total de la petición.', ('ruta', 'metodo'))
+METRICA_DB_PETICION = Histograma(
+    'http_request_db_seconds', 'Tiempo en SQL por petición.', ('ruta',))
+METRICA_CONSULTAS_PETICION = Histograma(
+    'http_request_queries', 'Consultas SQL por petición.', ('ruta',), LIMITES_CONSULTAS)
+METRICA_ESPERA_POOL = Histograma(
+    'db_pool_wait_seconds', 'Espera por una conexión del pool.')
+METRICA_CONSULTA = Histograma(
+    'db_query_seconds', 'Duración de cada consulta SQL.')
+METRICA_RENDER = Histograma(
+    'template_render_seconds', 'Render de templates Jinja.', ('template',))
+METRICA_ALMACEN = Histograma(
+    'storage_upload_seconds', 'Subidas al almacenamiento de archivos.', ('backend', 'resultado'))
+
+METRICAS = [
+    METRICA_PETICIONES, METRICA_DURACION, METRICA_DB_PETICION,
+    METRICA_CONSULTAS_PETICION, METRICA_ESPERA_POOL, METRICA_CONSULTA,
+    METRICA_RENDER, METRICA_ALMACEN,
+]
+
+
+def _medicion_actual():
+    # Los hilos de subidas y exportes no tienen petición asociada
+    if has_request_context():
+        return g.get('medicion')
+    return None
+
+
+def registrar_espera_pool(segundos):
+    METRICA_ESPERA_POOL.observar(segundos)
+    medicion = _medicion_actual()
+    if medicion is not None:
+        medicion['pool'] += segundos
+
+
+def registrar_consulta(sql, segundos):
+    METRICA_CONSULTA.observar(segundos)
+    medicion = _medicion_actual()
+    if medicion is None:
+        return
+    medicion['db'] += segundos
+    medicion['consultas'] += 1
+    if SLOW_REQUEST_MS and len(medicion['sql']) < SQL_LENTAS_MAX:
+        medicion['sql'].append((sql, segundos))
+
+
+class _MedirConsultas:
+
+    def execute(self, query, vars=None):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            registrar_consulta(query, time.perf_counter() - inicio)
+
+    def executemany(self, query, vars_list):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            registrar_consulta(query, time.perf_counter() - inicio)
+
+
+class CursorMedido(_MedirConsultas, psycopg2.extensions.cursor):
+    pass
+
+
+class CursorDictMedido(_MedirConsultas, psycopg2.extras.RealDictCursor):
+    pass
+
+
+@before_render_template.connect_via(app)
+def _inicio_render(sender, template, context, **extra):
+    medicion = _medicion_actual()
+    if medicion is not None:
+        medicion['renders'].append(time.perf_counter())
+
+
+@template_rendered.connect_via(app)
+def _fin_render(sender, template, context, **extra):
+    medicion = _medicion_actual()
+    if medicion is None or not medicion['renders']:
+        return
+    segundos = time.perf_counter() - medicion['renders'].pop()
+    # Un render_template anidado ya está contado en el de afuera
+    if not medicion['renders']:
+        medicion['render'] += segundos
+    METRICA_RENDER.observar(segundos, template.name)
+
+
+@app.before_request
+def iniciar_medicion():
+    g.medicion = {
+        'inicio': time.perf_counter(), 'db': 0.0, 'consultas': 0,
+        'pool': 0.0, 'render': 0.0, 'renders': [], 'sql': [],
+    }
+
+
+def _texto_sql(sql):
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    return ' '.join(str(sql).split())[:300]
+
+
+def cerrar_medicion(estado):
+    medicion = g.pop('medicion', None)
+    if medicion is None:
+        return None
+    total = time.perf_counter() - medicion['inicio']
+    ruta = request.url_rule.rule if request.url_rule else 'sin_ruta'
+    METRICA_PETICIONES.incrementar(ruta, request.method, str(estado))
+    METRICA_DURACION.observar(total, ruta, request.method)
+    METRICA_DB_PETICION.observar(medicion['db'], ruta)
+    METRICA_CONSULTAS_PETICION.observar(medicion['consultas'], ruta)
+
+    if SLOW_REQUEST_MS and total * 1000 >= SLOW_REQUEST_MS:
+        print("Petición lenta: " + json.dumps({
+            'ruta': request.path,
+            'metodo': request.method,
+            'estado': estado,
+            'ms': round(total * 1000, 1),
+            'db_ms': round(medicion['db'] * 1000, 1),
+            'pool_ms': round(medicion['pool'] * 1000, 1),
+            'render_ms': round(medicion['render'] * 1000, 1),
+            'consultas': medicion['consultas'],
+            'sql': [{'ms': round(t * 1000, 2), 'sql': _texto_sql(q)}
+                    for q, t in medicion['sql']],
+        }, ensure_ascii=False))
+    return total, medicion
+
+
+def _portador_metricas():
+    return bool(METRICS_TOKEN) and \
+        request.headers.get('Authorization') == f"Bearer {METRICS_TOKEN}"
+
+
+@app.after_request
+def registrar_medicion(resp):
+    resultado = cerrar_medicion(resp.status_code)
+    if resultado and (session.get('rol') == 'admin' or _portador_metricas()):
+        total, medicion = resultado
+        resp.headers['Server-Timing'] = ', '.join(
+            f"{nombre};dur={segundos * 1000:.1f}" for nombre, segundos in (
+                ('pool', medicion['pool']), ('db', medicion['db']),
+                ('render', medicion['render']), ('total', total)))
+    return resp
+
+
+@app.teardown_request
+def medicion_con_error(error):
+    # Si hubo excepción after_request no corrió: se registra como 500
+    if error is not None:
+        cerrar_medicion(500)
+
+
+@app.route('/metrics')
+def metrics():
+    # Con METRICS_TOKEN se exige el token; sin él, solo una sesión de admin
+    if METRICS_TOKEN:
+        if not _portador_metricas():
+            abort(401)
+    elif session.get('rol') != 'admin':
+        abort(401)
+    partes = [m.exponer() for m in METRICAS]
+    if connection_pool is not None and not connection_pool.closed:
+        stats = connection_pool.stats()
+        for nombre, clave, tipo in (
+            ('db_pool_in_use', 'en_uso', 'gauge'),
+            ('db_pool_idle', 'ociosas', 'gauge'),
+            ('db_pool_max', 'max', 'gauge'),
+            ('db_pool_timeouts_total', 'timeouts', 'counter'),
+            ('db_pool_checkouts_total', 'checkouts', 'counter'),
+        ):
+            partes.append(f"# TYPE {nombre} {tipo}\n{nombre} {stats[clave]}\n")
+    resp = Response(''.join(partes), content_type='text/plain; version=0.0.4; charset=utf-8')
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
 
 # ==========================================================
-# BASE DE DATOS – INICIALIZACIÓN
+# CACHÉ DE LECTURAS
 # ==========================================================
+# Cada tabla tiene una versión (marca de tiempo en ns) que las rutas de
+# escritura incrementan con invalidar(). Las consultas públicas se guardan
+# con la versión de las tablas de las que dependen, así una entrada vieja
+# simplemente deja de encontrarse. Las versiones viven en archivos bajo
+# CACHE_DIR (compartidos por todos los workers de la máquina) o en Redis
+# si se define CACHE_REDIS_URL, que también hace de caché compartida.
+
+class CacheLRU:
+    def __init__(self, max_entradas):
+        self.max_entradas = max_entradas
+        self.datos = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, clave):
+        with self.lock:
+            if clave in self.datos:
+                self.datos.move_to_end(clave)
+                self.hits += 1
+                return True, self.datos[clave]
+            self.misses += 1
+            return False, None
+
+    def set(self, clave, valor):
+        with self.lock:
+            self.datos[clave] = valor
+            self.datos.move_to_end(clave)
+            while len(self.datos) > self.max_entradas:
+                self.datos.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entradas': len(self.datos),
+                'max_entradas': self.max_entradas,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+cache_local = CacheLRU(CACHE_MAX_ENTRADAS)
+cache_redis = None
+
+if CACHE_REDIS_URL:
+    try:
+        import redis
+        cache_redis = redis.Redis.from_url(CACHE_REDIS_URL)
+    except Exception as e:
+        print(f"ADVERTENCIA: caché Redis no disponible: {e}")
+
+
+def _ruta_version(tabla):
+    return os.path.join(CACHE_DIR, "versiones", tabla)
 
-def init_db():
+
+def version_tablas(tablas):
+    if cache_redis is not None:
+        try:
+            valores = cache_redis.mget([f"barriada:version:{t}" for t in tablas])
+            return tuple(int(v or 0) for v in valores)
+        except Exception as e:
+            print(f"Error leyendo versiones en Redis: {e}")
+    versiones = []
+    for t in tablas:
+        try:
+            versiones.append(os.stat(_ruta_version(t)).st_mtime_ns)
+        except OSError:
+            versiones.append(0)
+    return tuple(versiones)
+
+
+def invalidar(*tablas):
+    ahora = time.time_ns()
+    for t in tablas:
+        if cache_redis is not None:
+            try:
+                cache_redis.set(f"barriada:version:{t}", ahora)
+            except Exception as e:
+                print(f"Error actualizando versión en Redis: {e}")
+        ruta = _ruta_version(t)
+        try:
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            with open(ruta, 'a'):
+                pass
+            nueva = max(ahora, os.stat(ruta).st_mtime_ns + 1)
+            os.utime(ruta, ns=(nueva, nueva))
+        except OSError as e:
+            print(f"Error actualizando versión de {t}: {e}")
+    if TABLAS_EXPORTE.intersection(tablas):
+        programar_exportes()
+
+
+def _a_json(valor):
+    # Redis guarda JSON, nunca pickle: lo que lea de ahí no ejecuta código.
+    # Decimal y fechas van marcados para volver con su tipo; las tuplas
+    # vuelven como listas (los que llaman solo las desempaquetan).
+    if isinstance(valor, Decimal):
+        return {'__decimal__': str(valor)}
+    if isinstance(valor, datetime):
+        return {'__fechahora__': valor.isoformat()}
+    if isinstance(valor, date):
+        return {'__fecha__': valor.isoformat()}
+    raise TypeError(f"{type(valor).__name__} no se puede guardar en la caché")
+
+
+def _de_json(d):
+    if len(d) == 1:
+        if '__decimal__' in d:
+            return Decimal(d['__decimal__'])
+        if '__fechahora__' in d:
+            return datetime.fromisoformat(d['__fechahora__'])
+        if '__fecha__' in d:
+            return date.fromisoformat(d['__fecha__'])
+    return d
+
+
+def cache_consulta(nombre, tablas, cargar):
+    """Devuelve cargar() cacheado mientras no cambien las tablas indicadas."""
+    clave = f"{nombre}:{'-'.join(map(str, version_tablas(tablas)))}"
+    encontrado, valor = cache_local.get(clave)
+    if encontrado:
+        return valor
+
+    if cache_redis is not None:
+        try:
+            crudo = cache_redis.get(f"barriada:cache-json:{clave}")
+            if crudo is not None:
+                valor = json.loads(crudo, object_hook=_de_json)
+                cache_local.set(clave, valor)
+                return valor
+        except Exception as e:
+            print(f"Error leyendo caché Redis: {e}")
+
+    valor = cargar()
+    cache_local.set(clave, valor)
+    if cache_redis is not None:
+        try:
+            cache_redis.set(f"barriada:cache-json:{clave}",
+                            json.dumps(valor, default=_a_json), ex=86400)
+        except Exception as e:
+            print(f"Error escribiendo caché Redis: {e}")
+    return valor
+
+
+def consultar(sql, params=()):
     cur, conn = get_cursor()
     try:
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS minutas (
-            id SERIAL PRIMARY KEY,
-            titulo TEXT,
-            resumen TEXT,
-            archivo TEXT,
-            fecha DATE
-        );
+        cur.execute(sql, params)
+        return [dict(r) for r in cur.fetchall()]
+    finally:
+        release_conn(conn)
 
-        CREATE TABLE IF NOT EXISTS requerimientos (
-            id SERIAL PRIMARY KEY,
-            descripcion TEXT,
-            prioridad INTEGER,
-            estado TEXT
-        );
+# ==========================================================
+# CACHÉ DE RESPUESTAS HTTP
+# ==========================================================
+# Para visitantes sin sesión, el HTML renderizado (y sus variantes gzip y
+# brotli) se guarda por versión de datos. El ETag sale de esas versiones,
+# así una visita repetida recibe un 304 sin renderizar nada.
 
-        CREATE TABLE IF NOT EXISTS comite (
-            id SERIAL PRIMARY KEY,
-            nombre TEXT,
-            cargo TEXT,
-            casa TEXT,
-            foto TEXT
-        );
+cache_respuestas = CacheLRU(CACHE_RESPUESTAS_MAX)
 
-        CREATE TABLE IF NOT EXISTS sugerencias (
-            id SERIAL PRIMARY KEY,
-            texto TEXT,
-            fecha TIMESTAMP
-        );
+def _marca_despliegue():
+    # Cambia con cada despliegue: un template nuevo invalida los ETag viejos
+    rutas = [os.path.abspath(__file__)]
+    carpeta = os.path.join(os.path.dirname(rutas[0]), 'templates')
+    if os.path.isdir(carpeta):
+        rutas += [os.path.join(carpeta, n) for n in os.listdir(carpeta)]
+    return str(int(max(os.path.getmtime(r) for r in rutas)))
 
-        CREATE TABLE IF NOT EXISTS pagos (
-            id SERIAL PRIMARY KEY,
-            casa TEXT,
-            monto NUMERIC,
-            fecha DATE,
-            comprobante TEXT,
-            notas TEXT,
-            cuota_id INTEGER
-        );
 
-        CREATE TABLE IF NOT EXISTS gastos (
-            id SERIAL PRIMARY KEY,
-            descripcion TEXT,
-            monto NUMERIC,
-            fecha DATE,
-            factura TEXT
-        );
+DESPLIEGUE = _marca_despliegue()
+
+
+def _comprimir(cuerpo):
+    variantes = {'identity': cuerpo, 'gzip': gzip.compress(cuerpo, 6)}
+    if brotli is not None:
+        variantes['br'] = brotli.compress(cuerpo, quality=5)
+    return variantes
+
+
+def version_datos(tablas, versiones=None):
+    # Huella corta de despliegue + tablas; el service worker la compara
+    # con la de su copia para saber si vale la pena volver a pedir la página
+    if versiones is None:
+        versiones = version_tablas(tablas)
+    return hashlib.md5(f"{DESPLIEGUE}:{versiones}".encode()).hexdigest()[:16]
+
+
+def respuesta_cacheada(*tablas):
+    def decorador(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or session.get('usuario'):
+                return f(*args, **kwargs)
+
+            versiones = version_tablas(tablas)
+            firma = f"{DESPLIEGUE}:{request.full_path}:{versiones}"
+            etag = hashlib.md5(firma.encode()).hexdigest()
+            version = version_datos(tablas, versiones)
+
+            if request.if_none_match.contains_weak(etag):
+                resp = Response(status=304)
+                resp.set_etag(etag, weak=True)
+                resp.headers['X-Version-Datos'] = version
+                return resp
+
+            clave = f"resp:{firma}"
+            encontrado, entrada = cache_respuestas.get(clave)
+            if not encontrado:
+                resp = make_response(f(*args, **kwargs))
+                if resp.status_code != 200 or resp.is_streamed:
+                    return resp
+                entrada = {
+                    'mimetype': resp.mimetype,
+                    'variantes': _comprimir(resp.get_data()),
+                }
+                cache_respuestas.set(clave, entrada)
+
+            variantes = entrada['variantes']
+            codificacion = 'identity'
+            for c in ('br', 'gzip'):
+                if c in variantes and c in request.accept_encodings:
+                    codificacion = c
+                    break
+
+            resp = Response(variantes[codificacion], mimetype=entrada['mimetype'])
+            if codificacion != 'identity':
+                resp.headers['Content-Encoding'] = codificacion
+            resp.headers['Cache-Control'] = 'no-cache'
+            resp.headers['X-Version-Datos'] = version
+            resp.vary.add('Accept-Encoding')
+            resp.set_etag(etag, weak=True)
+            if any(versiones):
+                resp.last_modified = max(versiones) / 1e9
+            return resp.make_conditional(request)
+        return wrapper
+    return decorador
+
+# ==========================================================
+# TEMPLATES: PRECOMPILACIÓN Y FRAGMENTOS
+# ==========================================================
+# Los templates compilados se guardan como bytecode en instance/jinja y se
+# cargan todos en create_app(), antes del fork de gunicorn. Las partes que
+# se repiten (navbar, grilla de casas) se renderizan una vez por clave y se
+# reutilizan como HTML ya hecho, también para usuarios con sesión.
+
+cache_fragmentos = CacheLRU(CACHE_FRAGMENTOS_MAX)
+
+os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(JINJA_CACHE_DIR)
+
+
+def precompilar_templates():
+    for nombre in app.jinja_env.list_templates(extensions=('html', 'js')):
+        app.jinja_env.get_template(nombre)
+
+
+@app.template_global()
+def fragmento(plantilla, clave=None, **contexto):
+    # Sin clave explícita, el contexto (valores simples) es la clave
+    if clave is None:
+        clave = tuple(sorted(contexto.items()))
+    k = (DESPLIEGUE, plantilla, clave)
+    encontrado, html = cache_fragmentos.get(k)
+    if not encontrado:
+        html = Markup(app.jinja_env.get_template(plantilla).render(contexto))
+        cache_fragmentos.set(k, html)
+    return html
+
+# ==========================================================
+# SUPABASE STORAGE
+# ==========================================================
+
+_supabase = None
+_supabase_lock = threading.Lock()
+
+
+def cliente_supabase():
+    # El cliente (y su import, que tarda ~0.5 s) se crea en el primer uso
+    global _supabase
+    with _supabase_lock:
+        if _supabase is None:
+            from supabase import create_client
+            _supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _supabase
+
+
+# ==========================================================
+# ALMACENAMIENTO DE ARCHIVOS
+# ==========================================================
+# Los archivos se nombran por contenido, <carpeta>/<sha256>.<ext>, y la
+# tabla archivos recuerda cuáles ya se subieron y con qué URL: un
+# comprobante repetido no se vuelve a subir. STORAGE_BACKEND elige dónde
+# se guardan: Supabase Storage, disco local (STORAGE_LOCAL_DIR) o memoria
+# del proceso (pruebas). Todos se sirven a través de /files.
+
+HASH_BLOQUE = 1024 * 1024
+
+
+class AlmacenSupabase:
+    tipo = 'supabase'
+
+    def subir(self, ruta_local, nombre, mimetype):
+        bucket = cliente_supabase().storage.from_(SUPABASE_BUCKET)
+        # Se entrega el archivo abierto: httpx lo envía por bloques
+        with open(ruta_local, 'rb') as f:
+            bucket.upload(
+                nombre,
+                f,
+                file_options={
+                    "content-type": mimetype,
+                    "upsert": "true"
+                }
+            )
+        return bucket.get_public_url(nombre)
+
+
+class AlmacenLocal:
+    tipo = 'local'
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+
+    def ruta(self, nombre):
+        return os.path.join(self.directorio, *nombre.split('/'))
+
+    def subir(self, ruta_local, nombre, mimetype):
+        destino = self.ruta(nombre)
+        if not os.path.exists(destino):
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            temporal = f"{destino}.{uuid.uuid4().hex}.tmp"
+            shutil.copyfile(ruta_local, temporal)
+            os.replace(temporal, destino)
+        return f"local://{nombre}"
+
+    def abrir(self, nombre):
+        return open(self.ruta(nombre), 'rb')
+
+
+class AlmacenMemoria:
+    tipo = 'memoria'
+
+    def __init__(self):
+        self.objetos = {}
+        self.lock = threading.Lock()
+
+    def subir(self, ruta_local, nombre, mimetype):
+        with open(ruta_local, 'rb') as f:
+            datos = f.read()
+        with self.lock:
+            self.objetos.setdefault(nombre, datos)
+        return f"memoria://{nombre}"
+
+    def abrir(self, nombre):
+        with self.lock:
+            datos = self.objetos.get(nombre)
+        if datos is None:
+            raise FileNotFoundError(nombre)
+        return io.BytesIO(datos)
+
+
+_almacen = None
+_almacen_lock = threading.Lock()
+
+
+def almacen():
+    global _almacen
+    with _almacen_lock:
+        if _almacen is None:
+            if STORAGE_BACKEND == 'supabase':
+                _almacen = AlmacenSupabase()
+            elif STORAGE_BACKEND == 'local':
+                _almacen = AlmacenLocal(STORAGE_LOCAL_DIR)
+            elif STORAGE_BACKEND == 'memoria':
+                _almacen = AlmacenMemoria()
+            else:
+                raise ValueError(f"STORAGE_BACKEND desconocido: {STORAGE_BACKEND}")
+    return _almacen
+
+
+def subir_archivo(ruta_local, nombre, mimetype):
+    backend = almacen()
+    inicio = time.perf_counter()
+    resultado = 'error'
+    try:
+        url = backend.subir(ruta_local, nombre, mimetype)
+        resultado = 'ok'
+    finally:
+        METRICA_ALMACEN.observar(time.perf_counter() - inicio, backend.tipo, resultado)
+    return url
+
+
+# ==========================================================
+# PROXY DE ARCHIVOS
+# ==========================================================
+# Las columnas de archivo guardan /files/<nombre> en lugar de la URL del
+# bucket. La primera petición baja el objeto a ARCHIVOS_CACHE_DIR y las
+# siguientes salen del disco, con Range (los PDF linealizados se abren
+# página a página), ETag y Cache-Control immutable: el nombre es el hash
+# del contenido, así que nunca cambia y no se puede adivinar. El caché
+# tiene un tope de ARCHIVOS_CACHE_MAX_MB y expulsa lo usado hace más
+# tiempo (según mtime, que se actualiza en cada acierto).
+
+# Nombres por contenido y los uuid4 de las subidas anteriores
+NOMBRE_ARCHIVO = re.compile(r'[a-z]+/[0-9a-f-]{36,64}(-min)?\.[a-z0-9]+')
+
+
+def url_archivo(nombre):
+    return f"/files/{nombre}"
+
+
+class CacheDisco:
+    """Archivos en un directorio con tope de bytes y expulsión LRU."""
+
+    def __init__(self, directorio, max_bytes):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.bajando = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def ruta(self, nombre):
+        return os.path.join(self.directorio, nombre.replace('/', '_'))
+
+    def buscar(self, nombre):
+        ruta = self.ruta(nombre)
+        try:
+            os.utime(ruta)
+        except FileNotFoundError:
+            return None
+        with self.lock:
+            self.hits += 1
+        return ruta
+
+    def guardar(self, nombre, descargar):
+        # Un solo hilo baja cada objeto; los demás esperan y lo reutilizan
+        with self.lock:
+            candado = self.bajando.setdefault(nombre, threading.Lock())
+        with candado:
+            ruta = self.ruta(nombre)
+            if not os.path.exists(ruta):
+                with self.lock:
+                    self.misses += 1
+                os.makedirs(self.directorio, exist_ok=True)
+                temporal = f"{ruta}.{uuid.uuid4().hex}.tmp"
+                try:
+                    with open(temporal, 'wb') as destino:
+                        descargar(destino)
+                    os.replace(temporal, ruta)
+                finally:
+                    if os.path.exists(temporal):
+                        os.remove(temporal)
+                self.recortar()
+        with self.lock:
+            self.bajando.pop(nombre, None)
+        return ruta
+
+    def recortar(self):
+        entradas = []
+        for e in os.scandir(self.directorio):
+            if e.is_file() and not e.name.endswith('.tmp'):
+                st = e.stat()
+                entradas.append((st.st_mtime, st.st_size, e.path))
+        total = sum(tam for _, tam, _ in entradas)
+        for _, tam, ruta in sorted(entradas):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(ruta)
+            except OSError:
+                continue
+            total -= tam
+            with self.lock:
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'max_bytes': self.max_bytes,
+            }
+
+
+cache_archivos = CacheDisco(ARCHIVOS_CACHE_DIR, ARCHIVOS_CACHE_MAX_MB * 1024 * 1024)
+
+
+def _descargar_origen(nombre, url, destino):
+    if url.startswith(('http://', 'https://')):
+        from urllib.request import urlopen
+        with urlopen(url, timeout=ARCHIVOS_TIMEOUT) as resp:
+            shutil.copyfileobj(resp, destino, HASH_BLOQUE)
+    else:
+        with almacen().abrir(nombre) as origen:
+            shutil.copyfileobj(origen, destino, HASH_BLOQUE)
+
+
+def ruta_archivo(nombre):
+    """Ruta en disco del objeto, bajándolo al caché si hace falta."""
+    backend = almacen()
+    # En disco local el objeto ya está a mano: no se duplica en el caché
+    if isinstance(backend, AlmacenLocal) and os.path.exists(backend.ruta(nombre)):
+        return backend.ruta(nombre)
+    ruta = cache_archivos.buscar(nombre)
+    if ruta:
+        return ruta
+    fila = consultar("SELECT url FROM archivos WHERE nombre = %s", (nombre,))
+    if not fila:
+        raise FileNotFoundError(nombre)
+    return cache_archivos.guardar(
+        nombre, lambda destino: _descargar_origen(nombre, fila[0]['url'], destino))
+
+
+@app.route('/files/<path:nombre>')
+def servir_archivo(nombre):
+    if not NOMBRE_ARCHIVO.fullmatch(nombre):
+        abort(404)
+    # Si otro worker lo expulsó entre buscarlo y abrirlo, se baja de nuevo
+    for intento in range(2):
+        try:
+            resp = send_file(
+                ruta_archivo(nombre),
+                mimetype=mimetypes.guess_type(nombre)[0] or 'application/octet-stream',
+                etag=nombre.rsplit('/', 1)[-1],
+                max_age=31536000,
+                conditional=True,
+            )
+            break
+        except FileNotFoundError:
+            if intento:
+                abort(404)
+        except OSError as e:
+            print(f"No se pudo traer {nombre} del almacenamiento: {e}")
+            abort(502)
+    resp.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return resp
+
+
+def archivos_a_proxy(cur):
+    # Las URL públicas de Supabase guardadas antes del proxy pasan a
+    # archivos y las columnas a /files/<nombre>
+    prefijo = f"/storage/v1/object/public/{SUPABASE_BUCKET}/"
+    columnas = list(COLUMNAS_ARCHIVO.items()) + list(COLUMNAS_MINIATURA.items())
+    for tabla, columna in columnas:
+        cur.execute(f"""
+            INSERT INTO archivos (nombre, url, backend)
+            SELECT DISTINCT ON (1) split_part(split_part({columna}, %(prefijo)s, 2), '?', 1),
+                   {columna}, 'supabase'
+            FROM {tabla}
+            WHERE {columna} LIKE 'http%%' AND strpos({columna}, %(prefijo)s) > 0
+            ON CONFLICT (nombre) DO NOTHING
+        """, {'prefijo': prefijo})
+        cur.execute(f"""
+            UPDATE {tabla}
+            SET {columna} = '/files/' || split_part(split_part({columna}, %(prefijo)s, 2), '?', 1)
+            WHERE {columna} LIKE 'http%%' AND strpos({columna}, %(prefijo)s) > 0
+        """, {'prefijo': prefijo})
+        cur.execute(f"""
+            UPDATE {tabla} t SET {columna} = '/files/' || a.nombre
+            FROM archivos a WHERE t.{columna} = a.url
+        """)
+
+# ==========================================================
+# SUBIDAS EN SEGUNDO PLANO
+# ==========================================================
+# Las rutas admin guardan el archivo tal cual en UPLOAD_SPOOL_DIR, insertan
+# la fila con la columna de archivo en NULL y registran la subida en
+# subidas_pendientes dentro de la misma transacción. Un pool de hilos la
+# optimiza, genera su miniatura, la sube al almacenamiento y completa la
+# URL. Si el mismo contenido ya se subió antes, la URL se completa al
+# registrar y no se encola nada. La cola vive en Postgres, así que lo que
+# quede pendiente tras un reinicio se retoma con reintentos espaciados.
+
+# tabla -> columna que recibe la URL pública
+COLUMNAS_ARCHIVO = {
+    'pagos': 'comprobante',
+    'gastos': 'factura',
+    'minutas': 'archivo',
+    'comite': 'foto',
+}
+
+# tabla -> columna con la miniatura generada al subir
+COLUMNAS_MINIATURA = {
+    'comite': 'foto_miniatura',
+    'pagos': 'comprobante_miniatura',
+}
+
+# tabla -> lado en píxeles de esa miniatura
+LADOS_MINIATURA = {
+    'comite': MINIATURA_LADO,
+    'pagos': VISTA_PREVIA_LADO,
+}
+
+_ejecutor_subidas = None
+_subidas_lock = threading.Lock()
+
+
+def preparar_subida(archivo, carpeta):
+    ext = re.sub(r'[^a-z0-9]', '', archivo.filename.rsplit('.', 1)[-1].lower()) or 'bin'
+    os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+    # Se copia al spool por bloques calculando el SHA-256 en el camino
+    temporal = os.path.join(UPLOAD_SPOOL_DIR, f"{uuid.uuid4().hex}.tmp")
+    sha = hashlib.sha256()
+    with open(temporal, 'wb') as destino:
+        for bloque in iter(lambda: archivo.stream.read(HASH_BLOQUE), b''):
+            sha.update(bloque)
+            destino.write(bloque)
+    nombre = f"{carpeta}/{sha.hexdigest()}.{ext}"
+    ruta_local = os.path.join(UPLOAD_SPOOL_DIR, nombre.replace('/', '_'))
+    os.replace(temporal, ruta_local)
+    # El nombre queda con el hash del original: un reenvío se reconoce
+    # sin volver a procesarlo
+    return {'nombre': nombre, 'ruta_local': ruta_local, 'mimetype': archivo.mimetype}
+
+
+# ==========================================================
+# OPTIMIZACIÓN DE SUBIDAS
+# ==========================================================
+# La tarea de subida, antes de subir, reduce las imágenes a IMAGEN_MAX_LADO
+# y las recodifica sin EXIF (fecha, cámara, GPS), y reescribe los PDF con
+# pikepdf: imágenes internas reducidas, sin metadatos, streams comprimidos
+# y linealizados para que el visor muestre la primera página enseguida.
+# Las tablas muestran una vista previa WebP y el original se abre al
+# hacer clic. Todo corre en los hilos de subidas, nunca en la petición.
+# Si falta una librería o el archivo no se puede leer, se sube tal cual.
+
+FORMATOS_IMAGEN = {'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP'}
+
+
+def _optimizar_imagen(origen, destino, formato):
+    from PIL import Image, ImageOps
+
+    with Image.open(origen) as original:
+        original.draft('RGB', (IMAGEN_MAX_LADO, IMAGEN_MAX_LADO))
+        con_metadatos = 'exif' in original.info or 'xmp' in original.info
+        im = ImageOps.exif_transpose(original)
+        im.thumbnail((IMAGEN_MAX_LADO, IMAGEN_MAX_LADO))
+        opciones = {'icc_profile': original.info.get('icc_profile')}
+    if formato == 'JPEG':
+        if im.mode not in ('RGB', 'L'):
+            im = im.convert('RGB')
+        opciones.update(quality=82, optimize=True, progressive=True)
+    elif formato == 'PNG':
+        opciones.update(optimize=True)
+    else:
+        opciones.update(quality=80, method=4)
+    im.save(destino, formato, **opciones)
+    # Sin metadatos que quitar, una recodificación más pesada no sirve
+    return con_metadatos or os.path.getsize(destino) < os.path.getsize(origen)
+
+
+def _optimizar_pdf(origen, destino):
+    import pikepdf
+    from PIL import Image
+
+    with pikepdf.open(origen) as pdf:
+        vistas = set()
+        for pagina in pdf.pages:
+            for imagen in pagina.get_images().values():
+                if imagen.objgen in vistas:
+                    continue
+                vistas.add(imagen.objgen)
+                pim = pikepdf.PdfImage(imagen)
+                # Solo imágenes RGB/grises simples; máscaras y paletas se dejan
+                if (max(pim.width, pim.height) <= IMAGEN_MAX_LADO or pim.image_mask
+                        or '/SMask' in imagen or pim.bits_per_component != 8
+                        or pim.colorspace not in ('/DeviceRGB', '/DeviceGray')):
+                    continue
+                im = pim.as_pil_image()
+                im.thumbnail((IMAGEN_MAX_LADO, IMAGEN_MAX_LADO), Image.LANCZOS)
+                datos = io.BytesIO()
+                im.save(datos, 'JPEG', quality=75, optimize=True)
+                imagen.write(datos.getvalue(), filter=pikepdf.Name.DCTDecode)
+                imagen.Width, imagen.Height = im.width, im.height
+                if '/DecodeParms' in imagen:
+                    del imagen['/DecodeParms']
+        if '/Metadata' in pdf.Root:
+            del pdf.Root['/Metadata']
+        if '/Info' in pdf.trailer:
+            del pdf.trailer['/Info']
+        pdf.save(
+            destino,
+            compress_streams=True,
+            recompress_flate=True,
+            object_stream_mode=pikepdf.ObjectStreamMode.generate,
+            linearize=True,
+        )
+    return True
+
+
+def optimizar_subida(subida):
+    """Reemplaza en el spool la imagen o PDF subido por su versión optimizada."""
+    ext = subida['nombre'].rsplit('.', 1)[-1]
+    destino = f"{subida['ruta_local']}.opt"
+    try:
+        if ext == 'pdf':
+            usar = _optimizar_pdf(subida['ruta_local'], destino)
+        elif ext in FORMATOS_IMAGEN:
+            usar = _optimizar_imagen(subida['ruta_local'], destino, FORMATOS_IMAGEN[ext])
+        else:
+            return
+        if usar:
+            os.replace(destino, subida['ruta_local'])
+    except ImportError:
+        pass
+    except Exception as e:
+        print(f"No se pudo optimizar {subida['nombre']}: {e}")
+    finally:
+        if os.path.exists(destino):
+            os.remove(destino)
+
+
+def _abrir_vista(ruta_local, ext, lado):
+    from PIL import Image
+
+    if ext == 'pdf':
+        import pypdfium2
+        pdf = pypdfium2.PdfDocument(ruta_local)
+        try:
+            pagina = pdf[0]
+            escala = lado / max(pagina.get_size())
+            return pagina.render(scale=escala).to_pil()
+        finally:
+            pdf.close()
+    original = Image.open(ruta_local)
+    # draft() permite a JPEG decodificar ya reducido
+    original.draft('RGB', (lado, lado))
+    return original
+
+
+def nombre_miniatura(nombre):
+    return nombre.rsplit('.', 1)[0] + '-min.webp'
+
+
+def preparar_miniatura(subida, lado=MINIATURA_LADO):
+    """Genera en el spool una versión WebP reducida de una imagen o PDF subido."""
+    ext = subida['nombre'].rsplit('.', 1)[-1]
+    if ext != 'pdf' and ext not in FORMATOS_IMAGEN:
+        return None
+    try:
+        from PIL import ImageOps
+    except ImportError:
+        return None
+    nombre = nombre_miniatura(subida['nombre'])
+    ruta_local = os.path.join(UPLOAD_SPOOL_DIR, nombre.replace('/', '_'))
+    try:
+        with _abrir_vista(subida['ruta_local'], ext, lado) as original:
+            im = ImageOps.exif_transpose(original)
+            im.thumbnail((lado, lado))
+            if im.mode not in ('RGB', 'RGBA'):
+                im = im.convert('RGBA' if 'A' in im.getbands() else 'RGB')
+            im.save(ruta_local, 'WEBP', quality=80, method=4)
+    except ImportError:
+        return None
+    except Exception as e:
+        print(f"No se pudo generar miniatura de {subida['nombre']}: {e}")
+        return None
+    return {'nombre': nombre, 'ruta_local': ruta_local, 'mimetype': 'image/webp'}
+
+
+def _columna_archivo(tabla, columna):
+    columna = columna or COLUMNAS_ARCHIVO[tabla]
+    # Tabla y columna van al SQL: solo se aceptan las conocidas
+    if columna not in (COLUMNAS_ARCHIVO[tabla], COLUMNAS_MINIATURA.get(tabla)):
+        raise ValueError(f"Columna de archivo no permitida: {tabla}.{columna}")
+    return columna
+
+
+def _borrar_spool(ruta_local):
+    try:
+        os.remove(ruta_local)
+    except OSError:
+        pass
+
+
+def _enlazar_miniatura(cur, tabla, fila_id, nombre):
+    # Contenido ya subido: su miniatura, si existe, también está en archivos
+    columna = COLUMNAS_MINIATURA.get(tabla)
+    if columna:
+        cur.execute(f"""
+            UPDATE {tabla} SET {columna} = %(url)s
+            WHERE id = %(id)s AND EXISTS (SELECT 1 FROM archivos WHERE nombre = %(nombre)s)
+        """, {'url': url_archivo(nombre_miniatura(nombre)), 'id': fila_id,
+              'nombre': nombre_miniatura(nombre)})
+
+
+def registrar_subida(cur, tabla, fila_id, subida, columna=None, procesada=False):
+    columna = _columna_archivo(tabla, columna)
+    cur.execute("SELECT 1 FROM archivos WHERE nombre = %s", (subida['nombre'],))
+    existente = cur.fetchone()
+    if existente:
+        cur.execute(
+            f"UPDATE {tabla} SET {columna} = %s WHERE id = %s",
+            (url_archivo(subida['nombre']), fila_id)
+        )
+        if columna == COLUMNAS_ARCHIVO[tabla]:
+            _enlazar_miniatura(cur, tabla, fila_id, subida['nombre'])
+        _borrar_spool(subida['ruta_local'])
+        return
+    cur.execute("""
+        INSERT INTO subidas_pendientes
+            (tabla, fila_id, columna, nombre, ruta_local, mimetype, procesada)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """, (tabla, fila_id, columna,
+          subida['nombre'], subida['ruta_local'], subida['mimetype'], procesada))
+
+
+def _reclamar_subida():
+    # El UPDATE deja la tarea "arrendada" 10 minutos: otro worker no la toma
+    cur, conn = get_cursor()
+    try:
+        cur.execute("""
+            UPDATE subidas_pendientes
+            SET intentos = intentos + 1,
+                proximo_intento = now() + interval '10 minutes'
+            WHERE id = (
+                SELECT id FROM subidas_pendientes
+                WHERE estado = 'pendiente' AND proximo_intento <= now()
+                ORDER BY id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING *
+        """)
+        tarea = cur.fetchone()
+        conn.commit()
+        return tarea
+    finally:
+        release_conn(conn)
+
+
+def _procesar_subida(tarea):
+    """Optimiza el archivo del spool y encola su miniatura, una vez por tarea."""
+    tabla = tarea['tabla']
+    miniatura = None
+    if os.path.exists(tarea['ruta_local']):
+        optimizar_subida(tarea)
+        if tabla in COLUMNAS_MINIATURA and tarea['columna'] == COLUMNAS_ARCHIVO[tabla]:
+            miniatura = preparar_miniatura(tarea, LADOS_MINIATURA[tabla])
+    cur, conn = get_cursor()
+    try:
+        if miniatura:
+            registrar_subida(cur, tabla, tarea['fila_id'], miniatura,
+                             COLUMNAS_MINIATURA[tabla], procesada=True)
+        cur.execute("UPDATE subidas_pendientes SET procesada = true WHERE id = %s",
+                    (tarea['id'],))
+        conn.commit()
+    finally:
+        release_conn(conn)
+
+
+def _ejecutar_subida(tarea):
+    tamanio = url = None
+    try:
+        # Otra tarea con el mismo contenido pudo subirlo mientras esperaba
+        if not consultar("SELECT 1 FROM archivos WHERE nombre = %s", (tarea['nombre'],)):
+            if not tarea['procesada']:
+                _procesar_subida(tarea)
+            tamanio = os.path.getsize(tarea['ruta_local'])
+            url = subir_archivo(tarea['ruta_local'], tarea['nombre'], tarea['mimetype'])
+    except Exception as e:
+        print(f"Error subiendo {tarea['nombre']} (intento {tarea['intentos']}): {e}")
+        definitivo = tarea['intentos'] >= UPLOAD_MAX_INTENTOS or isinstance(e, FileNotFoundError)
+        cur, conn = get_cursor()
+        try:
+            cur.execute("""
+                UPDATE subidas_pendientes
+                SET estado = %s,
+                    ultimo_error = %s,
+                    proximo_intento = now() + least(3600, 30 * power(2, intentos)) * interval '1 second'
+                WHERE id = %s
+            """, ('error' if definitivo else 'pendiente', str(e), tarea['id']))
+            conn.commit()
+        finally:
+            release_conn(conn)
+        return
+
+    tabla = tarea['tabla']
+    columna = _columna_archivo(tabla, tarea['columna'])
+    cur, conn = get_cursor()
+    try:
+        cur.execute(
+            f"UPDATE {tabla} SET {columna} = %s WHERE id = %s",
+            (url_archivo(tarea['nombre']), tarea['fila_id'])
+        )
+        if not url and columna == COLUMNAS_ARCHIVO[tabla]:
+            _enlazar_miniatura(cur, tabla, tarea['fila_id'], tarea['nombre'])
+        if url:
+            cur.execute("""
+                INSERT INTO archivos (nombre, url, mimetype, bytes, backend)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (nombre) DO NOTHING
+            """, (tarea['nombre'], url, tarea['mimetype'], tamanio, almacen().tipo))
+        cur.execute("DELETE FROM subidas_pendientes WHERE id = %s", (tarea['id'],))
+        conn.commit()
+    finally:
+        release_conn(conn)
+    invalidar(tabla)
+    # Las demás tareas con este nombre ya lo encuentran en archivos
+    _borrar_spool(tarea['ruta_local'])
+
+
+def procesar_subidas():
+    try:
+        while True:
+            tarea = _reclamar_subida()
+            if tarea is None:
+                return
+            _ejecutar_subida(tarea)
+    except Exception as e:
+        print(f"Error procesando subidas pendientes: {e}")
+
+
+def _bucle_reintentos():
+    while True:
+        time.sleep(UPLOAD_REINTENTO_CADA)
+        procesar_subidas()
+
+
+def iniciar_subidas():
+    global _ejecutor_subidas
+    with _subidas_lock:
+        if _ejecutor_subidas is None:
+            _ejecutor_subidas = ThreadPoolExecutor(
+                max_workers=UPLOAD_WORKERS, thread_name_prefix="subidas"
+            )
+            threading.Thread(target=_bucle_reintentos, daemon=True).start()
+    return _ejecutor_subidas
+
+
+def encolar_subidas():
+    iniciar_subidas().submit(procesar_subidas)
+
+# ==========================================================
+# EXPORTACIÓN XLSX EN STREAMING
+# ==========================================================
+# Un .xlsx es un zip de XML. zipfile puede escribir a un destino sin seek
+# (usa descriptores de datos), así que cada hoja se escribe fila a fila y
+# los bytes comprimidos se van entregando al cliente mientras se leen las
+# filas con un cursor del lado del servidor. La memoria no crece con el
+# número de filas.
+
+XLSX_BLOQUE = 64 * 1024
+EXPORT_LOTE = 2000
+
+_XML_INVALIDO = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '{hojas}'
+    '</Types>'
+)
+_XLSX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+
+class _SalidaStream(io.RawIOBase):
+    def __init__(self):
+        self.bloques = []
+        self.tamano = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.bloques.append(bytes(b))
+        self.tamano += len(b)
+        return len(b)
+
+    def vaciar(self):
+        datos = b''.join(self.bloques)
+        self.bloques = []
+        self.tamano = 0
+        return datos
+
+
+def _celda_xlsx(valor):
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return f'<c><v>{valor!r}</v></c>'
+    texto = escape(_XML_INVALIDO.sub('', str(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def xlsx_stream(hojas):
+    """Genera un .xlsx por bloques. hojas: [(nombre, encabezados, filas)]."""
+    salida = _SalidaStream()
+    with zipfile.ZipFile(salida, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', _XLSX_CONTENT_TYPES.format(hojas=''.join(
+            f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            for i in range(1, len(hojas) + 1)
+        )))
+        zf.writestr('_rels/.rels', _XLSX_RELS)
+        zf.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+            + ''.join(
+                f'<sheet name="{escape(nombre)}" sheetId="{i}" r:id="rId{i}"/>'
+                for i, (nombre, _, _) in enumerate(hojas, 1)
+            )
+            + '</sheets></workbook>'
+        ))
+        zf.writestr('xl/_rels/workbook.xml.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + ''.join(
+                f'<Relationship Id="rId{i}" '
+                'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+                f'Target="worksheets/sheet{i}.xml"/>'
+                for i in range(1, len(hojas) + 1)
+            )
+            + '</Relationships>'
+        ))
+        yield salida.vaciar()
+
+        for i, (_, encabezados, filas) in enumerate(hojas, 1):
+            with zf.open(f'xl/worksheets/sheet{i}.xml', 'w') as hoja:
+                hoja.write(
+                    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                    b'<sheetData>'
+                )
+                pendientes = ['<row>' + ''.join(map(_celda_xlsx, encabezados)) + '</row>']
+                for fila in filas:
+                    pendientes.append('<row>' + ''.join(map(_celda_xlsx, fila)) + '</row>')
+                    if len(pendientes) >= 500:
+                        hoja.write(''.join(pendientes).encode())
+                        pendientes = []
+                        if salida.tamano >= XLSX_BLOQUE:
+                            yield salida.vaciar()
+                pendientes.append('</sheetData></worksheet>')
+                hoja.write(''.join(pendientes).encode())
+            yield salida.vaciar()
+    yield salida.vaciar()
+
+
+def filas_cursor(conn, sql, params=()):
+    # Cursor con nombre: Postgres entrega las filas por lotes de EXPORT_LOTE
+    with conn.cursor(name=f"export_{uuid.uuid4().hex}") as cur:
+        cur.itersize = EXPORT_LOTE
+        cur.execute(sql, params)
+        while True:
+            filas = cur.fetchmany(EXPORT_LOTE)
+            if not filas:
+                return
+            yield from filas
+
+# ==========================================================
+# EXPORTES PRECALCULADOS
+# ==========================================================
+# Cada exporte se genera una vez por versión de pagos/gastos, en segundo
+# plano tras la escritura, y queda en EXPORT_DIR con la versión en el
+# nombre. Las descargas lo sirven con send_file (Content-Length, ETag,
+# Range). Si aún no existe, el .xlsx se entrega en streaming desde la base.
+# Al regenerar se conserva también la versión anterior de cada exporte:
+# otro worker puede haberla elegido un instante antes y estar sirviéndola.
+
+TABLAS_EXPORTE = {'pagos', 'gastos'}
+
+EXPORTE_TABLAS = {
+    'pagos': {
+        'hoja': "Pagos",
+        'sql': """
+            SELECT casa, monto, fecha, notas, comprobante
+            FROM pagos ORDER BY fecha DESC
+        """,
+        'columnas': [
+            ("casa", "Casa", "texto"),
+            ("monto", "Monto", "numero"),
+            ("fecha", "Fecha", "fecha"),
+            ("notas", "Notas", "texto"),
+            ("comprobante", "Comprobante", "texto"),
+        ],
+    },
+    'gastos': {
+        'hoja': "Gastos",
+        'sql': """
+            SELECT descripcion, monto, fecha, factura
+            FROM gastos ORDER BY fecha DESC
+        """,
+        'columnas': [
+            ("descripcion", "Descripción", "texto"),
+            ("monto", "Monto", "numero"),
+            ("fecha", "Fecha", "fecha"),
+            ("factura", "Factura", "texto"),
+        ],
+    },
+}
+
+_ejecutor_exportes = None
+_exportes_lock = threading.Lock()
+_exporte_programado = threading.Event()
+
+
+def filas_exporte(conn, tabla):
+    # Formato de hoja de cálculo: montos como float, fechas como texto
+    for fila in filas_cursor(conn, EXPORTE_TABLAS[tabla]['sql']):
+        yield [
+            float(v) if isinstance(v, Decimal) else
+            "" if v is None else
+            v if isinstance(v, (str, int, float)) else str(v)
+            for v in fila
+        ]
+
+
+def _hojas_xlsx(conn):
+    return [
+        (t['hoja'], [c[1] for c in t['columnas']], filas_exporte(conn, nombre))
+        for nombre, t in EXPORTE_TABLAS.items()
+    ]
+
+
+def _escribir_xlsx(conn, destino):
+    with open(destino, 'wb') as f:
+        for bloque in xlsx_stream(_hojas_xlsx(conn)):
+            f.write(bloque)
+
+
+def _escritor_csv(tabla):
+    def escribir(conn, destino):
+        with open(destino, 'w', newline='', encoding='utf-8-sig') as f:
+            w = csv.writer(f)
+            w.writerow([c[1] for c in EXPORTE_TABLAS[tabla]['columnas']])
+            w.writerows(filas_exporte(conn, tabla))
+    return escribir
+
+
+def _escritor_parquet(tabla):
+    columnas = EXPORTE_TABLAS[tabla]['columnas']
+
+    def escribir(conn, destino):
+        import pyarrow
+        import pyarrow.parquet
+        tipos = {'texto': pyarrow.string(), 'numero': pyarrow.float64(), 'fecha': pyarrow.date32()}
+        esquema = pyarrow.schema([(c[0], tipos[c[2]]) for c in columnas])
+        with pyarrow.parquet.ParquetWriter(destino, esquema) as w:
+            lote = []
+            for fila in filas_cursor(conn, EXPORTE_TABLAS[tabla]['sql']):
+                lote.append(fila)
+                if len(lote) >= EXPORT_LOTE:
+                    w.write_batch(_lote_arrow(lote, columnas, esquema))
+                    lote = []
+            w.write_batch(_lote_arrow(lote, columnas, esquema))
+    return escribir
+
+
+def _lote_arrow(lote, columnas, esquema):
+    import pyarrow
+    datos = [
+        [float(f[i]) if isinstance(f[i], Decimal) else f[i] for f in lote]
+        for i in range(len(columnas))
+    ]
+    return pyarrow.RecordBatch.from_arrays(
+        [pyarrow.array(d, type=esquema.field(i).type) for i, d in enumerate(datos)],
+        schema=esquema
+    )
+
+
+EXPORTES = {
+    'estado_cuenta.xlsx': _escribir_xlsx,
+    'pagos.csv': _escritor_csv('pagos'),
+    'gastos.csv': _escritor_csv('gastos'),
+}
+if PARQUET_DISPONIBLE:
+    EXPORTES['pagos.parquet'] = _escritor_parquet('pagos')
+    EXPORTES['gastos.parquet'] = _escritor_parquet('gastos')
+
+
+def version_exportes():
+    versiones = version_tablas(sorted(TABLAS_EXPORTE))
+    return hashlib.md5(repr(versiones).encode()).hexdigest()[:16]
+
+
+def _ruta_exporte(nombre, version):
+    base, ext = nombre.rsplit('.', 1)
+    return os.path.join(EXPORT_DIR, f"{base}-{version}.{ext}")
+
+
+def _generar_exporte(nombre, version):
+    ruta = _ruta_exporte(nombre, version)
+    if os.path.exists(ruta):
+        return ruta
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    temporal = f"{ruta}.{uuid.uuid4().hex}.tmp"
+    conn = get_conn()
+    try:
+        EXPORTES[nombre](conn, temporal)
+        os.replace(temporal, ruta)
+    finally:
+        conn.rollback()
+        release_conn(conn)
+        if os.path.exists(temporal):
+            os.remove(temporal)
+    return ruta
+
+
+def regenerar_exportes():
+    _exporte_programado.clear()
+    version = version_exportes()
+    try:
+        for nombre in EXPORTES:
+            _generar_exporte(nombre, version)
+    except Exception as e:
+        print(f"Error generando exportes: {e}")
+        return
+    _podar_exportes(version)
+
+
+def _podar_exportes(version):
+    # De cada exporte quedan la versión vigente y la más reciente de las
+    # otras; los .tmp son de generaciones en curso y no se tocan
+    archivos = os.listdir(EXPORT_DIR)
+    for nombre in EXPORTES:
+        base, ext = nombre.rsplit('.', 1)
+        patron = re.compile(rf"{re.escape(base)}-[0-9a-f]{{16}}\.{re.escape(ext)}")
+        vigente = os.path.basename(_ruta_exporte(nombre, version))
+        viejos = []
+        for archivo in archivos:
+            if archivo == vigente or not patron.fullmatch(archivo):
+                continue
+            ruta = os.path.join(EXPORT_DIR, archivo)
+            try:
+                viejos.append((os.path.getmtime(ruta), ruta))
+            except OSError:
+                continue
+        viejos.sort(reverse=True)
+        for _, ruta in viejos[1:]:
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+
+def programar_exportes():
+    global _ejecutor_exportes
+    # Varias escrituras seguidas se resuelven con una sola regeneración
+    if not _exporte_programado.is_set():
+        _exporte_programado.set()
+        with _exportes_lock:
+            if _ejecutor_exportes is None:
+                _ejecutor_exportes = ThreadPoolExecutor(max_workers=1, thread_name_prefix="exportes")
+        _ejecutor_exportes.submit(regenerar_exportes)
+
+
+def servir_exporte(nombre, descarga):
+    version = version_exportes()
+    ruta = _ruta_exporte(nombre, version)
+    if not os.path.exists(ruta):
+        programar_exportes()
+        if nombre != 'estado_cuenta.xlsx':
+            ruta = _generar_exporte(nombre, version)
+        else:
+            return Response(
+                _generar_excel_estado_cuenta(),
+                mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                headers={"Content-Disposition": f"attachment; filename={descarga}"}
+            )
+    resp = send_file(
+        ruta,
+        as_attachment=True,
+        download_name=descarga,
+        conditional=True,
+        etag=f"{nombre}-{version}",
+        max_age=0
+    )
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
+
+
+def _generar_excel_estado_cuenta():
+    # La conexión se pide dentro del generador: si la respuesta nunca se
+    # consume no queda prestada, y se libera aunque el cliente corte
+    conn = get_conn()
+    try:
+        yield from xlsx_stream(_hojas_xlsx(conn))
+    finally:
+        conn.rollback()
+        release_conn(conn)
+
+# ==========================================================
+# SALDOS MATERIALIZADOS
+# ==========================================================
+# saldos_casa guarda el acumulado de pagos por casa y totales_finanzas
+# los ingresos/egresos globales. Se actualizan en la misma transacción
+# que el INSERT/DELETE correspondiente, así /estado-cuenta no recorre
+# todo el historial de pagos en cada visita.
+
+def saldo_registrar_pago(cur, casa, monto, fecha):
+    cur.execute("""
+        INSERT INTO saldos_casa (casa, total_pagado, num_pagos, ultimo_pago)
+        VALUES (%s, %s, 1, %s)
+        ON CONFLICT (casa) DO UPDATE SET
+            total_pagado = saldos_casa.total_pagado + EXCLUDED.total_pagado,
+            num_pagos    = saldos_casa.num_pagos + 1,
+            ultimo_pago  = GREATEST(saldos_casa.ultimo_pago, EXCLUDED.ultimo_pago)
+    """, (casa, monto, fecha))
+    cur.execute("UPDATE totales_finanzas SET ingresos = ingresos + %s", (monto,))
+
+
+def saldo_revertir_pago(cur, casa, monto):
+    # Se llama después del DELETE: el MAX(fecha) ya no incluye el pago borrado
+    cur.execute("""
+        UPDATE saldos_casa SET
+            total_pagado = total_pagado - %s,
+            num_pagos    = num_pagos - 1,
+            ultimo_pago  = (SELECT MAX(fecha) FROM pagos WHERE casa = %s)
+        WHERE casa = %s
+    """, (monto, casa, casa))
+    cur.execute("DELETE FROM saldos_casa WHERE casa = %s AND num_pagos <= 0", (casa,))
+    cur.execute("UPDATE totales_finanzas SET ingresos = ingresos - %s", (monto,))
+
+
+def saldo_registrar_pagos(cur, pagos):
+    # Versión por lotes: un UPSERT con una fila por casa
+    por_casa = {}
+    for p in pagos:
+        total, n, ultimo = por_casa.get(p['casa'], (0, 0, p['fecha']))
+        por_casa[p['casa']] = (total + p['monto'], n + 1, max(ultimo, p['fecha']))
+    psycopg2.extras.execute_values(cur, """
+        INSERT INTO saldos_casa (casa, total_pagado, num_pagos, ultimo_pago)
+        VALUES %s
+        ON CONFLICT (casa) DO UPDATE SET
+            total_pagado = saldos_casa.total_pagado + EXCLUDED.total_pagado,
+            num_pagos    = saldos_casa.num_pagos + EXCLUDED.num_pagos,
+            ultimo_pago  = GREATEST(saldos_casa.ultimo_pago, EXCLUDED.ultimo_pago)
+    """, [(casa, *v) for casa, v in sorted(por_casa.items())])
+    cur.execute("UPDATE totales_finanzas SET ingresos = ingresos + %s",
+                (sum(p['monto'] for p in pagos),))
+
+
+def saldo_registrar_gasto(cur, monto):
+    cur.execute("UPDATE totales_finanzas SET egresos = egresos + %s", (monto,))
+
+
+def saldo_revertir_gasto(cur, monto):
+    cur.execute("UPDATE totales_finanzas SET egresos = egresos - %s", (monto,))
+
+
+def reconstruir_saldos(cur):
+    # Bloquea escrituras en pagos/gastos mientras se recalcula desde cero
+    cur.execute("LOCK TABLE pagos, gastos IN SHARE MODE")
+    cur.execute("DELETE FROM saldos_casa")
+    cur.execute("""
+        INSERT INTO saldos_casa (casa, total_pagado, num_pagos, ultimo_pago)
+        SELECT casa, COALESCE(SUM(monto),0), COUNT(*), MAX(fecha)
+        FROM pagos
+        WHERE casa IS NOT NULL
+        GROUP BY casa
+    """)
+    cur.execute("DELETE FROM totales_finanzas")
+    cur.execute("""
+        INSERT INTO totales_finanzas (id, ingresos, egresos)
+        VALUES (
+            TRUE,
+            (SELECT COALESCE(SUM(monto),0) FROM pagos),
+            (SELECT COALESCE(SUM(monto),0) FROM gastos)
+        )
+    """)
+
+
+@app.cli.command('reconstruir-saldos')
+def reconstruir_saldos_command():
+    """Recalcula saldos, totales y la conciliación de cuotas desde cero."""
+    cur, conn = get_cursor()
+    try:
+        bloquear_cuotas(cur)
+        reconstruir_saldos(cur)
+        reconstruir_cuotas(cur)
+        conn.commit()
+    finally:
+        release_conn(conn)
+    print("Saldos reconstruidos correctamente.")
+
+# ==========================================================
+# CONCILIACIÓN DE CUOTAS
+# ==========================================================
+# SQL_MATRIZ_CUOTAS arma en una sola consulta la matriz casas x cuotas
+# activas. A cada cuota se le aplica primero lo pagado con ese cuota_id y
+# después el crédito de los pagos sin cuota, en orden de vencimiento.
+# La matriz queda materializada en cuota_casa y sus totales por cuota en
+# cuota_resumen: cada pago recalcula sólo las celdas de su casa y ajusta
+# los totales por diferencia, en la misma transacción. Crear o borrar una
+# cuota cambia el reparto de todas las casas y reconstruye las dos tablas.
+
+PAGADA, PARCIAL, PENDIENTE = 'pagada', 'parcial', 'pendiente'
+
+SQL_MATRIZ_CUOTAS = """
+    WITH activas AS (
+        SELECT id, monto, fecha_vencimiento FROM cuotas WHERE activa = TRUE
+    ),
+    casas AS (
+        SELECT n FROM generate_series(%(desde)s, %(hasta)s) n
+    ),
+    pagos_casas AS (
+        SELECT casa, monto, cuota_id FROM pagos
+        WHERE casa IN (SELECT n::text FROM casas)
+    ),
+    ligados AS (
+        SELECT p.casa, p.cuota_id, SUM(p.monto) AS monto
+        FROM pagos_casas p JOIN activas a ON a.id = p.cuota_id
+        GROUP BY p.casa, p.cuota_id
+    ),
+    credito AS (
+        SELECT casa, SUM(monto) AS monto
+        FROM pagos_casas WHERE cuota_id IS NULL
+        GROUP BY casa
+    ),
+    celdas AS (
+        SELECT c.n AS casa, a.id AS cuota_id, a.monto, a.fecha_vencimiento,
+               LEAST(a.monto, COALESCE(l.monto, 0)) AS ligado,
+               COALESCE(cr.monto, 0) AS credito
+        FROM casas c
+        CROSS JOIN activas a
+        LEFT JOIN ligados l ON l.casa = c.n::text AND l.cuota_id = a.id
+        LEFT JOIN credito cr ON cr.casa = c.n::text
+    ),
+    repartido AS (
+        SELECT casa, cuota_id, monto, fecha_vencimiento, ligado, credito,
+               SUM(monto - ligado) OVER (
+                   PARTITION BY casa ORDER BY fecha_vencimiento, cuota_id
+                   ROWS UNBOUNDED PRECEDING
+               ) - (monto - ligado) AS falta_antes
+        FROM celdas
+    )
+    SELECT casa, cuota_id, monto,
+           ligado + LEAST(monto - ligado, GREATEST(0, credito - falta_antes)) AS aplicado
+    FROM repartido
+"""
+
+
+def estado_celda(aplicado, monto):
+    if aplicado >= monto:
+        return PAGADA
+    return PARCIAL if aplicado > 0 else PENDIENTE
+
+
+def bloquear_cuotas(cur):
+    # SHARE ROW EXCLUSIVE choca consigo mismo y con cualquier escritura en
+    # pagos/cuotas, pero deja leer. Va antes del primer INSERT o DELETE de
+    # la transacción: pedirlo después sería subir un lock ya tomado y dos
+    # transacciones iguales se bloquearían entre sí (deadlock).
+    cur.execute("LOCK TABLE pagos, cuotas IN SHARE ROW EXCLUSIVE MODE")
+
+
+def reconstruir_cuotas(cur):
+    """Rehace cuota_casa y cuota_resumen; la transacción ya tomó bloquear_cuotas()."""
+    cur.execute("DELETE FROM cuota_casa")
+    cur.execute(f"""
+        INSERT INTO cuota_casa (cuota_id, casa, aplicado)
+        SELECT cuota_id, casa, aplicado FROM ({SQL_MATRIZ_CUOTAS}) m
+    """, {'desde': 1, 'hasta': TOTAL_CASAS})
+    cur.execute("DELETE FROM cuota_resumen")
+    cur.execute("""
+        INSERT INTO cuota_resumen (cuota_id, recaudado, pagadas, parciales, pendientes)
+        SELECT c.id,
+               COALESCE(SUM(cc.aplicado), 0),
+               COUNT(*) FILTER (WHERE cc.aplicado >= c.monto),
+               COUNT(*) FILTER (WHERE cc.aplicado > 0 AND cc.aplicado < c.monto),
+               COUNT(*) FILTER (WHERE cc.aplicado = 0)
+        FROM cuotas c
+        JOIN cuota_casa cc ON cc.cuota_id = c.id
+        GROUP BY c.id
+    """)
+
+
+def cuotas_refrescar_casa(cur, casa):
+    # Se llama después de saldo_registrar_pago/saldo_revertir_pago: el
+    # UPSERT sobre saldos_casa ya tomó el lock de la fila de esta casa, así
+    # que dos pagos simultáneos de la misma casa se recalculan en orden.
+    try:
+        n = int(casa)
+    except (TypeError, ValueError):
+        return
+    if not 1 <= n <= TOTAL_CASAS:
+        return
+    cur.execute(SQL_MATRIZ_CUOTAS, {'desde': n, 'hasta': n})
+    nuevas = cur.fetchall()
+    cur.execute("SELECT cuota_id, aplicado FROM cuota_casa WHERE casa = %s", (n,))
+    viejas = {f['cuota_id']: f['aplicado'] for f in cur.fetchall()}
+    for f in nuevas:
+        antes = viejas.get(f['cuota_id'], Decimal(0))
+        if f['aplicado'] == antes:
+            continue
+        e0 = estado_celda(antes, f['monto'])
+        e1 = estado_celda(f['aplicado'], f['monto'])
+        cur.execute("""
+            UPDATE cuota_resumen SET
+                recaudado  = recaudado + %s,
+                pagadas    = pagadas + %s,
+                parciales  = parciales + %s,
+                pendientes = pendientes + %s
+            WHERE cuota_id = %s
+        """, (f['aplicado'] - antes,
+              (e1 == PAGADA) - (e0 == PAGADA),
+              (e1 == PARCIAL) - (e0 == PARCIAL),
+              (e1 == PENDIENTE) - (e0 == PENDIENTE),
+              f['cuota_id']))
+        cur.execute("""
+            INSERT INTO cuota_casa (cuota_id, casa, aplicado) VALUES (%s, %s, %s)
+            ON CONFLICT (cuota_id, casa) DO UPDATE SET aplicado = EXCLUDED.aplicado
+        """, (f['cuota_id'], n, f['aplicado']))
+
+
+def conciliar_cuotas():
+    """Matriz casas x cuotas activas con conteos por casa y por cuota.
+
+    Devuelve un dict columnar: la posición i de las listas por casa
+    corresponde a la casa i + 1 y la j de cada fila a cuotas[j].
+    """
+    cur, conn = get_cursor()
+    try:
+        # Las dos lecturas ven la misma foto de la base
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+        cur.execute("""
+            SELECT c.id, c.descripcion, c.monto, c.fecha_vencimiento, c.tipo,
+                   r.recaudado, r.pagadas, r.parciales, r.pendientes
+            FROM cuotas c
+            JOIN cuota_resumen r ON r.cuota_id = c.id
+            WHERE c.activa = TRUE
+            ORDER BY c.fecha_vencimiento, c.id
+        """)
+        cuotas = [dict(c) for c in cur.fetchall()]
+        cur.execute("""
+            SELECT cc.casa, cc.cuota_id, cc.aplicado, c.monto
+            FROM cuota_casa cc JOIN cuotas c ON c.id = cc.cuota_id
+            WHERE c.activa = TRUE
+        """)
+        celdas = cur.fetchall()
+        conn.rollback()
+    finally:
+        release_conn(conn)
+
+    k = len(cuotas)
+    aplicado = [[0.0] * k for _ in range(TOTAL_CASAS)]
+    estado = [[PENDIENTE] * k for _ in range(TOTAL_CASAS)]
+    debe = [0.0] * TOTAL_CASAS
+    conteos = {PAGADA: [0] * TOTAL_CASAS, PARCIAL: [0] * TOTAL_CASAS,
+               PENDIENTE: [0] * TOTAL_CASAS}
+
+    indice = {c['id']: j for j, c in enumerate(cuotas)}
+    for fila in celdas:
+        j = indice.get(fila['cuota_id'])
+        if j is None:
+            continue
+        i = fila['casa'] - 1
+        e = estado_celda(fila['aplicado'], fila['monto'])
+        aplicado[i][j] = float(fila['aplicado'])
+        estado[i][j] = e
+        debe[i] += float(fila['monto'] - fila['aplicado'])
+        conteos[e][i] += 1
+
+    for c in cuotas:
+        c['monto'] = float(c['monto'])
+        c['recaudado'] = float(c['recaudado'])
+        c['fecha_vencimiento'] = c['fecha_vencimiento'].isoformat()
+
+    return {
+        'cuotas': cuotas,
+        'total_cuotas': sum(c['monto'] for c in cuotas),
+        'aplicado': aplicado,
+        'estado': estado,
+        'debe': [round(d, 2) for d in debe],
+        'pagadas': conteos[PAGADA],
+        'parciales': conteos[PARCIAL],
+        'pendientes': conteos[PENDIENTE],
+    }
+
+
+def conciliacion():
+    return cache_consulta('conciliacion', ('pagos', 'cuotas'), conciliar_cuotas)
+
+
+# ==========================================================
+# CONTRASEÑAS
+# ==========================================================
+# Las contraseñas se guardan con argon2id. ARGON2_TIEMPO y
+# ARGON2_MEMORIA_KB fijan el costo; `flask calibrar-hash` mide cuántas
+# pasadas hacen falta en esta máquina para llegar a HASH_OBJETIVO_MS.
+# Cada hash lleva sus parámetros: al cambiarlos, los viejos siguen
+# validando y se re-hashean en el siguiente login.
+
+hasher = PasswordHasher(time_cost=ARGON2_TIEMPO, memory_cost=ARGON2_MEMORIA_KB, parallelism=1)
+_hash_relleno = None
+
+
+def verificar_password(hash_guardado, password):
+    """True si password corresponde a hash_guardado.
+
+    Sin hash (usuario inexistente o sin contraseña) se verifica igual
+    contra uno de relleno: tarda lo mismo y no delata qué usuarios existen."""
+    global _hash_relleno
+    if _hash_relleno is None:
+        _hash_relleno = hasher.hash(os.urandom(16).hex())
+    try:
+        hasher.verify(hash_guardado or _hash_relleno, password)
+    except (VerificationError, InvalidHashError):
+        return False
+    return hash_guardado is not None
+
+
+def version_sesion(hash_guardado):
+    # Va en la cookie: cambiar la contraseña cierra las demás sesiones
+    return hashlib.sha256((hash_guardado or '').encode()).hexdigest()[:16]
+
+
+def hashear_passwords(cur):
+    # Las contraseñas en texto plano pasan a argon2 una sola vez
+    cur.execute("ALTER TABLE usuarios RENAME COLUMN password TO password_hash")
+    cur.execute("SELECT id, password_hash FROM usuarios WHERE password_hash IS NOT NULL")
+    filas = [(hasher.hash(f['password_hash']), f['id']) for f in cur.fetchall()
+             if not f['password_hash'].startswith('$argon2')]
+    psycopg2.extras.execute_batch(
+        cur, "UPDATE usuarios SET password_hash=%s WHERE id=%s", filas)
+    return ('usuarios',)
+
+
+def normalizar_casas_pagos(cur):
+    # Pagos viejos guardaron la casa como '07': saldos_casa los separaba de
+    # la casa 7 y cuota_casa (solo '1'..'250') no los veía. Se pasan a la
+    # forma canónica y se rehacen saldos y conciliación.
+    bloquear_cuotas(cur)
+    cur.execute("""
+        UPDATE pagos SET casa = ltrim(btrim(casa), '0')
+        WHERE btrim(casa) ~ '^0*[1-9][0-9]*$' AND casa <> ltrim(btrim(casa), '0')
+    """)
+    if not cur.rowcount:
+        return ()
+    reconstruir_saldos(cur)
+    reconstruir_cuotas(cur)
+    return ('pagos',)
+
+
+@app.cli.command('calibrar-hash')
+@click.option('--objetivo', default=HASH_OBJETIVO_MS, help='Milisegundos por hash.')
+def calibrar_hash_command(objetivo):
+    """Busca el ARGON2_TIEMPO que llega al objetivo con ARGON2_MEMORIA_KB."""
+    tiempo = 1
+    while True:
+        prueba = PasswordHasher(time_cost=tiempo, memory_cost=ARGON2_MEMORIA_KB, parallelism=1)
+        muestras = []
+        for _ in range(3):
+            inicio = time.perf_counter()
+            prueba.hash('calibracion')
+            muestras.append((time.perf_counter() - inicio) * 1000)
+        ms = sorted(muestras)[1]
+        print(f"ARGON2_TIEMPO={tiempo}: {ms:.0f} ms")
+        if ms >= objetivo or tiempo >= 32:
+            break
+        tiempo += 1
+    print(f"Sugerido: ARGON2_TIEMPO={tiempo} ARGON2_MEMORIA_KB={ARGON2_MEMORIA_KB}")
+
+
+@app.cli.command('cambiar-password')
+@click.argument('usuario')
+@click.password_option()
+def cambiar_password_command(usuario, password):
+    """Cambia la contraseña de USUARIO y cierra sus sesiones abiertas."""
+    cur, conn = get_cursor()
+    try:
+        cur.execute("UPDATE usuarios SET password_hash=%s WHERE usuario=%s",
+                    (hasher.hash(password), usuario))
+        if cur.rowcount == 0:
+            print(f"No existe el usuario {usuario}.")
+            sys.exit(1)
+        conn.commit()
+    finally:
+        release_conn(conn)
+    invalidar('usuarios')
+    print("Contraseña actualizada.")
+
+# ==========================================================
+# BASE DE DATOS – MIGRACIONES
+# ==========================================================
+# Cada migración se aplica una sola vez y queda registrada en
+# schema_migraciones. Un paso es SQL o una función que recibe el cursor;
+# la función devuelve las tablas cuya caché hay que invalidar, y migrar()
+# las invalida recién después del commit (antes, otro worker podría volver
+# a cachear los datos viejos con la versión nueva).
+# Todas corren en una transacción bajo un advisory lock, así varios
+# workers arrancando a la vez no las aplican dos veces. Las nuevas van
+# siempre al final de la lista con el siguiente número.
+
+LOCK_MIGRACIONES = 7310001
+
+MIGRACIONES = [
+    (1, "esquema inicial", """
+        CREATE TABLE IF NOT EXISTS minutas (
+            id SERIAL PRIMARY KEY,
+            titulo TEXT,
+            resumen TEXT,
+            archivo TEXT,
+            fecha DATE
+        );
+
+        CREATE TABLE IF NOT EXISTS requerimientos (
+            id SERIAL PRIMARY KEY,
+            descripcion TEXT,
+            prioridad INTEGER,
+            estado TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS comite (
+            id SERIAL PRIMARY KEY,
+            nombre TEXT,
+            cargo TEXT,
+            casa TEXT,
+            foto TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS sugerencias (
+            id SERIAL PRIMARY KEY,
+            texto TEXT,
+            fecha TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS pagos (
+            id SERIAL PRIMARY KEY,
+            casa TEXT,
+            monto NUMERIC,
+            fecha DATE,
+            comprobante TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS gastos (
+            id SERIAL PRIMARY KEY,
+            descripcion TEXT,
+            monto NUMERIC,
+            fecha DATE,
+            factura TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id SERIAL PRIMARY KEY,
+            usuario TEXT UNIQUE,
+            password TEXT,
+            rol TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS cuotas (
+            id SERIAL PRIMARY KEY,
+            descripcion TEXT NOT NULL,
+            monto NUMERIC NOT NULL,
+            fecha_vencimiento DATE NOT NULL,
+            tipo TEXT DEFAULT 'mensual',
+            activa BOOLEAN DEFAULT TRUE
+        );
+    """),
+    (2, "notas y cuota_id en pagos", """
+        ALTER TABLE pagos ADD COLUMN IF NOT EXISTS notas TEXT;
+        ALTER TABLE pagos ADD COLUMN IF NOT EXISTS cuota_id INTEGER;
+    """),
+    (3, "saldos materializados", """
+        CREATE TABLE IF NOT EXISTS saldos_casa (
+            casa TEXT PRIMARY KEY,
+            total_pagado NUMERIC NOT NULL DEFAULT 0,
+            num_pagos INTEGER NOT NULL DEFAULT 0,
+            ultimo_pago DATE
+        );
+
+        CREATE TABLE IF NOT EXISTS totales_finanzas (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            ingresos NUMERIC NOT NULL DEFAULT 0,
+            egresos NUMERIC NOT NULL DEFAULT 0
+        );
+    """),
+    (4, "poblar saldos desde el historial", reconstruir_saldos),
+    (5, "cola de subidas", """
+        CREATE TABLE IF NOT EXISTS subidas_pendientes (
+            id SERIAL PRIMARY KEY,
+            tabla TEXT NOT NULL,
+            fila_id INTEGER NOT NULL,
+            nombre TEXT NOT NULL,
+            ruta_local TEXT NOT NULL,
+            mimetype TEXT,
+            estado TEXT NOT NULL DEFAULT 'pendiente',
+            intentos INTEGER NOT NULL DEFAULT 0,
+            ultimo_error TEXT,
+            proximo_intento TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """),
+    # Índices según las consultas reales: historial por casa ordenado por
+    # fecha, cuotas pagadas por casa, cuotas activas y listados por fecha.
+    # Las tablas son chicas, así que un CREATE INDEX normal (que bloquea
+    # escrituras unos instantes) es aceptable dentro de la transacción.
+    (6, "índices para consultas frecuentes", """
+        CREATE INDEX IF NOT EXISTS pagos_casa_fecha_idx ON pagos (casa, fecha DESC, id DESC);
+        CREATE INDEX IF NOT EXISTS pagos_cuota_id_idx ON pagos (cuota_id, casa) WHERE cuota_id IS NOT NULL;
+        CREATE INDEX IF NOT EXISTS pagos_fecha_idx ON pagos (fecha DESC, id DESC);
+        CREATE INDEX IF NOT EXISTS gastos_fecha_idx ON gastos (fecha DESC, id DESC);
+        CREATE INDEX IF NOT EXISTS minutas_fecha_idx ON minutas (fecha DESC, id DESC);
+        CREATE INDEX IF NOT EXISTS sugerencias_fecha_idx ON sugerencias (fecha DESC, id DESC);
+        CREATE INDEX IF NOT EXISTS cuotas_activas_idx ON cuotas (fecha_vencimiento) WHERE activa;
+        CREATE INDEX IF NOT EXISTS subidas_pendientes_cola_idx ON subidas_pendientes (proximo_intento)
+            WHERE estado = 'pendiente';
+        CREATE INDEX IF NOT EXISTS subidas_pendientes_fila_idx ON subidas_pendientes (tabla, fila_id);
+    """),
+    (7, "miniaturas de fotos del comité", """
+        ALTER TABLE comite ADD COLUMN IF NOT EXISTS foto_miniatura TEXT;
+        ALTER TABLE subidas_pendientes ADD COLUMN IF NOT EXISTS columna TEXT;
+    """),
+    (8, "conciliación de cuotas materializada", """
+        CREATE TABLE IF NOT EXISTS cuota_casa (
+            cuota_id INTEGER NOT NULL REFERENCES cuotas (id) ON DELETE CASCADE,
+            casa INTEGER NOT NULL,
+            aplicado NUMERIC NOT NULL DEFAULT 0,
+            PRIMARY KEY (cuota_id, casa)
+        );
+        CREATE INDEX IF NOT EXISTS cuota_casa_casa_idx ON cuota_casa (casa);
+
+        CREATE TABLE IF NOT EXISTS cuota_resumen (
+            cuota_id INTEGER PRIMARY KEY REFERENCES cuotas (id) ON DELETE CASCADE,
+            recaudado NUMERIC NOT NULL DEFAULT 0,
+            pagadas INTEGER NOT NULL DEFAULT 0,
+            parciales INTEGER NOT NULL DEFAULT 0,
+            pendientes INTEGER NOT NULL DEFAULT 0
+        );
+    """),
+    (9, "poblar conciliación de cuotas", reconstruir_cuotas),
+    (10, "archivos por contenido", """
+        CREATE TABLE IF NOT EXISTS archivos (
+            nombre TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            mimetype TEXT,
+            bytes BIGINT,
+            backend TEXT NOT NULL,
+            creado TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """),
+    (11, "vista previa de comprobantes", """
+        ALTER TABLE pagos ADD COLUMN IF NOT EXISTS comprobante_miniatura TEXT;
+    """),
+    (12, "archivos servidos por /files", archivos_a_proxy),
+    # Columnas generadas: Postgres las mantiene en cada INSERT/UPDATE, sea
+    # desde las rutas admin, /sugerencias o la importación masiva. Los
+    # acentos se quitan con translate() para no depender de la extensión
+    # unaccent, que no todos los servidores tienen instalada.
+    (13, "búsqueda de texto", """
+        CREATE OR REPLACE FUNCTION sin_acentos(texto TEXT) RETURNS TEXT
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+            SELECT translate(texto, 'áéíóúüàèìòùÁÉÍÓÚÜÀÈÌÒÙ', 'aeiouuaeiouAEIOUUAEIOU')
+        $$;
+
+        ALTER TABLE minutas ADD COLUMN IF NOT EXISTS busqueda tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('spanish', sin_acentos(coalesce(titulo, ''))), 'A') ||
+                setweight(to_tsvector('spanish', sin_acentos(coalesce(resumen, ''))), 'B')
+            ) STORED;
+        ALTER TABLE sugerencias ADD COLUMN IF NOT EXISTS busqueda tsvector
+            GENERATED ALWAYS AS (to_tsvector('spanish', sin_acentos(coalesce(texto, '')))) STORED;
+        ALTER TABLE pagos ADD COLUMN IF NOT EXISTS busqueda tsvector
+            GENERATED ALWAYS AS (to_tsvector('spanish', sin_acentos(coalesce(notas, '')))) STORED;
+
+        CREATE INDEX IF NOT EXISTS minutas_busqueda_idx ON minutas USING GIN (busqueda);
+        CREATE INDEX IF NOT EXISTS sugerencias_busqueda_idx ON sugerencias USING GIN (busqueda);
+        CREATE INDEX IF NOT EXISTS pagos_busqueda_idx ON pagos USING GIN (busqueda);
+    """),
+    (14, "contraseñas con argon2", hashear_passwords),
+    # Optimización y miniatura pasan a la cola de subidas; lo que ya estaba
+    # pendiente se procesó en la petición que lo subió
+    (15, "subidas procesadas en la cola", """
+        ALTER TABLE subidas_pendientes ADD COLUMN IF NOT EXISTS procesada BOOLEAN NOT NULL DEFAULT false;
+        UPDATE subidas_pendientes SET procesada = true;
+    """),
+    (16, "casas canónicas en pagos", normalizar_casas_pagos),
+    # Los listados paginados ponen las fechas NULL al final (ver
+    # consultar_pagina); los índices siguen esa misma clave
+    (17, "índices de fecha con nulos al final", """
+        DROP INDEX IF EXISTS pagos_fecha_idx;
+        DROP INDEX IF EXISTS gastos_fecha_idx;
+        DROP INDEX IF EXISTS minutas_fecha_idx;
+        DROP INDEX IF EXISTS sugerencias_fecha_idx;
+        CREATE INDEX pagos_fecha_idx ON pagos ((COALESCE(fecha, '-infinity')) DESC, id DESC);
+        CREATE INDEX gastos_fecha_idx ON gastos ((COALESCE(fecha, '-infinity')) DESC, id DESC);
+        CREATE INDEX minutas_fecha_idx ON minutas ((COALESCE(fecha, '-infinity')) DESC, id DESC);
+        CREATE INDEX sugerencias_fecha_idx ON sugerencias ((COALESCE(fecha, '-infinity')) DESC, id DESC);
+    """),
+]
+
+
+def version_esquema(cur):
+    cur.execute("SELECT to_regclass('schema_migraciones') AS tabla")
+    if cur.fetchone()['tabla'] is None:
+        return 0
+    cur.execute("SELECT COALESCE(MAX(version), 0) AS version FROM schema_migraciones")
+    return cur.fetchone()['version']
+
+
+def migrar():
+    ultima = MIGRACIONES[-1][0]
+    cur, conn = get_cursor()
+    try:
+        # Camino rápido: una sola consulta cuando ya está todo aplicado
+        if version_esquema(cur) >= ultima:
+            conn.rollback()
+            return
+
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (LOCK_MIGRACIONES,))
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migraciones (
+                version INTEGER PRIMARY KEY,
+                nombre TEXT NOT NULL,
+                aplicada TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """)
+        cur.execute("SELECT version FROM schema_migraciones")
+        aplicadas = {r['version'] for r in cur.fetchall()}
+        tablas = set()
+        for version, nombre, paso in MIGRACIONES:
+            if version in aplicadas:
+                continue
+            if callable(paso):
+                tablas.update(paso(cur) or ())
+            else:
+                cur.execute(paso)
+            cur.execute(
+                "INSERT INTO schema_migraciones (version, nombre) VALUES (%s, %s)",
+                (version, nombre)
+            )
+            print(f"Migración {version} aplicada: {nombre}")
+        conn.commit()
+        if tablas:
+            invalidar(*sorted(tablas))
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_conn(conn)
+
+
+@app.cli.command('migrar')
+def migrar_command():
+    """Aplica las migraciones pendientes del esquema."""
+    migrar()
+    print("Esquema al día.")
+
+
+def crear_admin_si_no_existe():
+    cur, conn = get_cursor()
+    try:
+        cur.execute("SELECT 1 FROM usuarios WHERE rol='admin'")
+        if not cur.fetchone():
+            cur.execute(
+                "INSERT INTO usuarios (usuario, password_hash, rol) VALUES (%s, %s, %s)",
+                ("admin", hasher.hash("admin123"), "admin")
+            )
+            conn.commit()
+            invalidar('usuarios')
+    finally:
+        release_conn(conn)
+
+
+# ==========================================================
+# ARRANQUE
+# ==========================================================
+# Importar este módulo no toca la red: el pool, el cliente de Supabase y
+# los hilos de fondo se crean en el primer uso dentro de cada worker. El
+# esquema y el usuario admin se preparan una vez, antes de levantar los
+# workers, con:  flask --app app bootstrap
+# Con MIGRAR_AL_INICIAR=1 se hace en la primera petición de cada worker,
+# para plataformas sin fase de release.
+
+_worker_listo = False
+_worker_lock = threading.Lock()
+
+
+def bootstrap():
+    migrar()
+    crear_admin_si_no_existe()
+
+
+@app.cli.command('bootstrap')
+def bootstrap_command():
+    """Aplica migraciones y crea el usuario admin si no existe."""
+    bootstrap()
+    print("Aplicación inicializada correctamente.")
+
+
+@app.before_request
+def iniciar_worker():
+    global _worker_listo
+    if _worker_listo:
+        return
+    with _worker_lock:
+        if _worker_listo:
+            return
+        try:
+            if MIGRAR_AL_INICIAR:
+                bootstrap()
+            encolar_subidas()
+        except Exception as e:
+            print(f"ADVERTENCIA: Error al iniciar el worker: {e}")
+        _worker_listo = True
+
+
+def _despues_de_fork():
+    # Con gunicorn --preload el hijo hereda el estado del maestro: se
+    # descartan (sin cerrar, el socket es del padre) conexiones e hilos
+    global connection_pool, _ejecutor_subidas, _ejecutor_exportes, _supabase, _worker_listo
+    connection_pool = None
+    _ejecutor_subidas = None
+    _ejecutor_exportes = None
+    _supabase = None
+    _worker_listo = False
+    _exporte_programado.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_despues_de_fork)
+
+
+def create_app():
+    """Fábrica para gunicorn: gunicorn --preload 'app:create_app()'."""
+    precompilar_templates()
+    return app
+
+# ==========================================================
+# SEGURIDAD
+# ==========================================================
+# La cookie firmada dice quién es el usuario; en cada petición se
+# comprueba que siga existiendo con ese rol y esa contraseña contra
+# usuarios_sesion(), un mapa en memoria que se recarga cuando las rutas
+# invalidan usuarios, cada SESION_RECARGA_S segundos (altas, bajas y
+# cambios de rol hechos por SQL) y ante una sesión que no encaja.
+#
+# Los logins se limitan con dos cubetas. La de la IP se gasta en cada
+# intento, antes de tocar la base o argon2, y acota cuántos llegan en
+# paralelo. La de IP + usuario se gasta solo en los fallidos: otro
+# cliente no puede dejar afuera al admin. La IP es la de la conexión;
+# solo con PROXY_SALTOS configurado sale de X-Forwarded-For.
+
+class CubetaTokens:
+    """Token bucket por clave: capacidad fichas, una nueva cada recarga segundos.
+
+    Vive en la memoria de cada worker; las claves más viejas se descartan
+    pasadas max_claves (vuelven llenas)."""
+
+    def __init__(self, capacidad, recarga, max_claves=10000):
+        self.capacidad = capacidad
+        self.recarga = recarga
+        self.max_claves = max_claves
+        self.cubetas = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _fichas(self, clave, ahora):
+        fichas, instante = self.cubetas.get(clave, (self.capacidad, ahora))
+        return min(self.capacidad, fichas + (ahora - instante) / self.recarga)
+
+    def espera(self, clave):
+        """Segundos hasta que clave tenga una ficha; 0 si ya la tiene."""
+        with self.lock:
+            fichas = self._fichas(clave, time.monotonic())
+            return 0 if fichas >= 1 else (1 - fichas) * self.recarga
+
+    def tomar(self, clave):
+        """Gasta una ficha de clave: 0 si la había, si no los segundos de espera."""
+        with self.lock:
+            ahora = time.monotonic()
+            fichas = self._fichas(clave, ahora)
+            if fichas < 1:
+                return (1 - fichas) * self.recarga
+            self.cubetas[clave] = (fichas - 1, ahora)
+            self.cubetas.move_to_end(clave)
+            while len(self.cubetas) > self.max_claves:
+                self.cubetas.popitem(last=False)
+            return 0
+
+
+if PROXY_SALTOS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_SALTOS, x_proto=PROXY_SALTOS)
+
+intentos_ip = CubetaTokens(LOGIN_IP_INTENTOS, LOGIN_IP_RECARGA_S)
+fallos_login = CubetaTokens(LOGIN_INTENTOS, LOGIN_RECARGA_S)
+
+_usuarios_sesion = {'mapa': None, 'version': None, 'cargado': 0.0}
+_usuarios_sesion_lock = threading.Lock()
+
+
+def usuarios_sesion(recargar=False):
+    """usuario -> rol y versión de sesión, desde la memoria del worker."""
+    version = version_tablas(['usuarios'])
+    with _usuarios_sesion_lock:
+        cache = dict(_usuarios_sesion)
+    if (not recargar and cache['mapa'] is not None and cache['version'] == version
+            and time.monotonic() - cache['cargado'] < SESION_RECARGA_S):
+        return cache['mapa']
+    mapa = {f['usuario']: datos_sesion(f)
+            for f in consultar("SELECT usuario, rol, password_hash FROM usuarios")}
+    with _usuarios_sesion_lock:
+        _usuarios_sesion.update(mapa=mapa, version=version, cargado=time.monotonic())
+    return mapa
+
+
+def datos_sesion(usuario):
+    """Lo que va en la cookie, a partir de una fila de usuarios."""
+    return {'usuario': usuario['usuario'], 'rol': usuario['rol'],
+            'version': version_sesion(usuario['password_hash'])}
+
+
+def _sesion_vigente(datos):
+    return (datos is not None and datos['version'] == session.get('version')
+            and datos['rol'] == session.get('rol'))
+
+
+@app.before_request
+def validar_sesion():
+    if 'usuario' not in session and 'rol' not in session:
+        return
+    usuario = session.get('usuario')
+    if _sesion_vigente(usuarios_sesion().get(usuario)):
+        return
+    # El mapa puede ser más viejo que la sesión (usuario creado por SQL)
+    datos = usuarios_sesion(recargar=True).get(usuario)
+    if datos is None or datos['version'] != session.get('version'):
+        session.clear()
+    else:
+        session['rol'] = datos['rol']
+
+
+def admin_required(f):
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if session.get('rol') != 'admin':
+            return redirect('/login')
+        return f(*args, **kwargs)
+    return wrapper
+
+# ==========================================================
+# PAGINACIÓN POR CURSOR
+# ==========================================================
+# Los listados se ordenan por (fecha, id) DESC y se paginan con
+# ?before=<token>, donde el token codifica la última (fecha, id) vista.
+# Así cada página es un recorrido corto del índice sin OFFSET.
+# fecha admite NULL en filas viejas: esas van al final, ordenadas por id.
+# Para eso la clave es COALESCE(fecha, '-infinity') en vez de NULLS LAST;
+# así el corte sigue siendo una sola comparación de filas que los índices
+# de la migración 17 resuelven, y un NULL viaja en el token como -infinity.
+
+FECHA_NULA = '-infinity'
+
+
+def codificar_cursor(fila):
+    fecha = fila['fecha'].isoformat() if fila['fecha'] is not None else FECHA_NULA
+    crudo = f"{fecha}|{fila['id']}"
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(token):
+    try:
+        crudo = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        fecha, id_ = crudo.rsplit('|', 1)
+        if fecha != FECHA_NULA:
+            datetime.fromisoformat(fecha)
+        return fecha, int(id_)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        abort(400)
+
+
+def limite_pagina():
+    try:
+        limite = int(request.args.get('limite', PAGINA_DEFECTO))
+    except ValueError:
+        abort(400)
+    return max(1, min(limite, PAGINA_MAX))
+
+
+def consultar_pagina(sql, clave='fecha, id'):
+    """Ejecuta sql paginado por cursor.
+
+    sql lleva un marcador {antes} en el WHERE y termina en ORDER BY {orden};
+    clave nombra las columnas de fecha e id. Devuelve (filas,
+    token_siguiente); el token es None en la última página.
+    """
+    col_fecha, col_id = (c.strip() for c in clave.split(','))
+    fecha = f"COALESCE({col_fecha}, '{FECHA_NULA}')"
+    limite = limite_pagina()
+    params = []
+    antes = ''
+    token = request.args.get('before')
+    if token:
+        antes = f"AND ({fecha}, {col_id}) < (%s, %s)"
+        params.extend(decodificar_cursor(token))
+    params.append(limite + 1)
+    orden = f"{fecha} DESC, {col_id} DESC"
+    filas = consultar(sql.format(antes=antes, orden=orden) + " LIMIT %s", params)
+    siguiente = codificar_cursor(filas[limite - 1]) if len(filas) > limite else None
+    return filas[:limite], siguiente
+
+
+def pagina_json(filas, siguiente):
+    return jsonify({
+        'items': [
+            {k: v.isoformat() if hasattr(v, 'isoformat') else v for k, v in f.items()}
+            for f in filas
+        ],
+        'siguiente': siguiente,
+    })
+
+
+# ==========================================================
+# RECURSOS ESTÁTICOS
+# ==========================================================
+# 'flask --app app assets' genera en static/dist las versiones de los
+# íconos en el tamaño justo (PNG y WebP) y el Bootstrap alojado en
+# static/vendor, con el hash del contenido en el nombre, y deja el mapa
+# nombre lógico -> archivo en static/assets.json.
+# Al cambiar de contenido cambia el nombre, así static/dist se puede
+# cachear como inmutable.
+
+FUENTE_ICONOS = "PHome.png"
+RENDICIONES_ICONOS = [
+    ("icon-192", 192),
+    ("icon-512", 512),
+    ("apple-touch-icon", 180),
+]
+
+# Nombre lógico -> archivos de static/vendor que se concatenan
+BOOTSTRAP_DIR = "vendor/bootstrap-5.3.2"
+ASSETS_VENDOR = {
+    "bootstrap.min.css": [f"{BOOTSTRAP_DIR}/bootstrap.min.css"],
+    "bootstrap.bundle.min.js": [f"{BOOTSTRAP_DIR}/popper.min.js",
+                                f"{BOOTSTRAP_DIR}/bootstrap.min.js"],
+}
+
+
+def _cargar_mapa_assets():
+    try:
+        with open(ASSETS_MAPA) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+mapa_assets = _cargar_mapa_assets()
+
+
+@app.template_global()
+def asset_url(nombre):
+    archivo = mapa_assets.get(nombre)
+    if archivo:
+        return f"/static/dist/{archivo}"
+    return f"/static/{nombre}"
+
+
+@app.after_request
+def cache_assets_inmutables(resp):
+    if request.path.startswith('/static/dist/') and resp.status_code in (200, 206, 304):
+        resp.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return resp
+
+
+def _guardar_fingerprint(datos, base, ext, mapa):
+    huella = hashlib.sha256(datos).hexdigest()[:10]
+    archivo = f"{base}.{huella}.{ext}"
+    with open(os.path.join(ASSETS_DIR, archivo), 'wb') as f:
+        f.write(datos)
+    mapa[f"{base}.{ext}"] = archivo
 
-        CREATE TABLE IF NOT EXISTS usuarios (
-            id SERIAL PRIMARY KEY,
-            usuario TEXT UNIQUE,
-            password TEXT,
-            rol TEXT
-        );
 
-        CREATE TABLE IF NOT EXISTS cuotas (
-            id SERIAL PRIMARY KEY,
-            descripcion TEXT NOT NULL,
-            monto NUMERIC NOT NULL,
-            fecha_vencimiento DATE NOT NULL,
-            tipo TEXT DEFAULT 'mensual',
-            activa BOOLEAN DEFAULT TRUE
-        );
-        """)
-        conn.commit()
+@app.cli.command('assets')
+def assets_command():
+    """Genera íconos y Bootstrap con huella en static/dist."""
+    from PIL import Image
 
-        # Columnas opcionales por si la tabla pagos ya existía sin ellas
-        for col, tipo in [("notas", "TEXT"), ("cuota_id", "INTEGER")]:
-            try:
-                cur.execute(f"ALTER TABLE pagos ADD COLUMN IF NOT EXISTS {col} {tipo};")
-                conn.commit()
-            except Exception:
-                conn.rollback()
+    os.makedirs(ASSETS_DIR, exist_ok=True)
+    mapa = {}
+    with Image.open(os.path.join(app.static_folder, FUENTE_ICONOS)) as fuente:
+        fuente = fuente.convert('RGBA')
+        for base, lado in RENDICIONES_ICONOS:
+            im = fuente.resize((lado, lado), Image.LANCZOS)
+            png = io.BytesIO()
+            im.quantize(256, method=Image.Quantize.FASTOCTREE).save(png, 'PNG', optimize=True)
+            _guardar_fingerprint(png.getvalue(), base, 'png', mapa)
+            webp = io.BytesIO()
+            im.save(webp, 'WEBP', quality=85, method=6)
+            _guardar_fingerprint(webp.getvalue(), base, 'webp', mapa)
 
-    finally:
-        release_conn(conn)
+    for nombre, partes in ASSETS_VENDOR.items():
+        datos = []
+        for parte in partes:
+            with open(os.path.join(app.static_folder, parte), 'rb') as f:
+                datos.append(f.read().rstrip(b"\n"))
+        base, ext = nombre.rsplit('.', 1)
+        _guardar_fingerprint(b"\n".join(datos) + b"\n", base, ext, mapa)
 
+    for archivo in os.listdir(ASSETS_DIR):
+        if archivo not in mapa.values():
+            os.remove(os.path.join(ASSETS_DIR, archivo))
 
-def crear_admin_si_no_existe():
-    cur, conn = get_cursor()
-    try:
-        cur.execute("SELECT 1 FROM usuarios WHERE rol='admin'")
-        if not cur.fetchone():
-            cur.execute(
-                "INSERT INTO usuarios (usuario, password, rol) VALUES (%s, %s, %s)",
-                ("admin", "admin123", "admin")
-            )
-            conn.commit()
-    finally:
-        release_conn(conn)
+    ruta_manifest = os.path.join(app.static_folder, "manifest.json")
+    with open(ruta_manifest) as f:
+        manifest = json.load(f)
+    # Por tamaño se publica la variante más liviana de las dos
+    manifest['icons'] = []
+    for lado in (192, 512):
+        ext = min(('png', 'webp'), key=lambda e: os.path.getsize(
+            os.path.join(ASSETS_DIR, mapa[f'icon-{lado}.{e}'])))
+        manifest['icons'].append({
+            "src": f"/static/dist/{mapa[f'icon-{lado}.{ext}']}",
+            "sizes": f"{lado}x{lado}",
+            "type": f"image/{ext}"
+        })
+    with open(ruta_manifest, 'w') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+        f.write("\n")
 
+    with open(ASSETS_MAPA, 'w') as f:
+        json.dump(mapa, f, indent=2, sort_keys=True)
+        f.write("\n")
+    mapa_assets.clear()
+    mapa_assets.update(mapa)
+    for nombre, archivo in sorted(mapa.items()):
+        tamano = os.path.getsize(os.path.join(ASSETS_DIR, archivo))
+        print(f"{nombre:28} -> {archivo} ({tamano / 1024:.1f} KB)")
 
-try:
-    init_pool()
-    init_db()
-    crear_admin_si_no_existe()
-    print("Aplicación iniciada correctamente.")
-except Exception as e:
-    print(f"ADVERTENCIA: Error al iniciar la aplicación: {e}")
 
 # ==========================================================
-# SEGURIDAD
+# SERVICE WORKER
 # ==========================================================
+# /sw.js precarga la estructura de la app (Bootstrap, íconos, manifest y la
+# portada) y sirve estas páginas al instante desde su caché. En segundo
+# plano consulta /api/version y sólo vuelve a pedir la página si cambió la
+# versión de datos; esa petición va con If-None-Match y suele ser un 304.
+# Sin conexión, se muestra la última copia.
+
+PAGINAS_OFFLINE = {
+    '/estado-cuenta': ('pagos', 'gastos', 'cuotas'),
+    '/minutas': ('minutas',),
+    '/comite': ('comite',),
+    '/api/estado-casas': ('pagos', 'cuotas'),
+}
+
+
+def precarga_service_worker():
+    return ['/', '/static/manifest.json',
+            asset_url('bootstrap.min.css'),
+            asset_url('bootstrap.bundle.min.js'),
+            asset_url('icon-192.png'),
+            asset_url('apple-touch-icon.png')]
+
+
+@app.route('/sw.js')
+def service_worker():
+    precarga = precarga_service_worker()
+    version = hashlib.md5(f"{DESPLIEGUE}:{precarga}".encode()).hexdigest()[:12]
+    cuerpo = render_template('sw.js', version=version, precarga=precarga,
+                             paginas=sorted(PAGINAS_OFFLINE))
+    resp = Response(cuerpo, mimetype='application/javascript')
+    # El navegador debe revisar siempre si hay un service worker nuevo
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
+
+
+@app.route('/api/version')
+def api_version():
+    resp = jsonify({ruta: version_datos(tablas)
+                    for ruta, tablas in PAGINAS_OFFLINE.items()})
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
 
-def admin_required(f):
-    @wraps(f)
-    def wrapper(*args, **kwargs):
-        if session.get('rol') != 'admin':
-            return redirect('/login')
-        return f(*args, **kwargs)
-    return wrapper
 
 # ==========================================================
 # RUTAS PÚBLICAS
 # ==========================================================
 
 @app.route('/')
+@respuesta_cacheada()
 def index():
     return render_template('index.html')
 
 
 @app.route('/minutas')
+@respuesta_cacheada('minutas')
 def minutas():
-    cur, conn = get_cursor()
-    try:
-        cur.execute("SELECT * FROM minutas ORDER BY fecha DESC")
-        data = cur.fetchall()
-    finally:
-        release_conn(conn)
-    return render_template('minutas.html', data=data)
+    data, siguiente = _pagina_minutas()
+    return render_template('minutas.html', data=data, siguiente=siguiente)
+
+
+@app.route('/api/minutas')
+@respuesta_cacheada('minutas')
+def api_minutas():
+    return pagina_json(*_pagina_minutas())
+
+
+def _pagina_minutas():
+    return cache_consulta(f"minutas:{request.query_string.decode()}", ('minutas',),
+                          lambda: consultar_pagina("""
+        SELECT id, titulo, resumen, archivo, fecha FROM minutas
+        WHERE TRUE {antes}
+        ORDER BY {orden}
+    """))
 
 
 @app.route('/estado-cuenta')
+@respuesta_cacheada('pagos', 'gastos', 'cuotas')
 def estado_cuenta():
-    cur, conn = get_cursor()
-    try:
-        cur.execute("SELECT COALESCE(SUM(monto),0) AS total FROM pagos")
-        ingresos = cur.fetchone()['total']
+    datos = cache_consulta('estado_cuenta', ('pagos', 'gastos', 'cuotas'), _datos_estado_cuenta)
+    gastos, siguiente = _pagina_gastos()
+    return render_template('estado_cuenta.html', gastos=gastos, siguiente=siguiente, **datos)
+
+
+def _pagina_gastos():
+    # El listado va por páginas; los totales salen de totales_finanzas
+    return cache_consulta(f"gastos:{request.query_string.decode()}", ('gastos',),
+                          lambda: consultar_pagina("""
+        SELECT id, descripcion, monto, fecha, factura FROM gastos
+        WHERE TRUE {antes}
+        ORDER BY {orden}
+    """))
 
-        cur.execute("SELECT * FROM gastos ORDER BY fecha DESC")
-        gastos = cur.fetchall()
 
-        cur.execute("SELECT COALESCE(SUM(monto),0) AS total FROM gastos")
-        egresos = cur.fetchone()['total']
+def _datos_estado_cuenta():
+    cur, conn = get_cursor()
+    try:
+        cur.execute("SELECT ingresos, egresos FROM totales_finanzas")
+        totales = cur.fetchone() or {'ingresos': 0, 'egresos': 0}
+        ingresos = totales['ingresos']
+        egresos = totales['egresos']
 
         cur.execute("SELECT * FROM cuotas WHERE activa=TRUE ORDER BY fecha_vencimiento DESC")
         cuotas = cur.fetchall()
 
-        cur.execute("""
-            SELECT casa, COALESCE(SUM(monto),0) as total_pagado
-            FROM pagos GROUP BY casa
-        """)
+        cur.execute("SELECT casa, total_pagado FROM saldos_casa")
         pagos_por_casa_raw = cur.fetchall()
         pagos_por_casa = {}
         for r in pagos_por_casa_raw:
@@ -285,103 +3105,148 @@ def estado_cuenta():
                 key = r['casa']
             pagos_por_casa[key] = float(r['total_pagado'])
 
-        cur.execute("SELECT COALESCE(SUM(monto),0) as total FROM cuotas WHERE activa=TRUE")
-        total_cuotas = float(cur.fetchone()['total'] or 0)
-
     finally:
         release_conn(conn)
 
-    return render_template(
-        'estado_cuenta.html',
-        gastos=gastos,
+    # La grilla 25x10 se arma acá, una vez por versión de datos
+    conc = conciliacion()
+    grilla = []
+    for inicio in range(1, TOTAL_CASAS + 1, 10):
+        fila = []
+        for num in range(inicio, min(inicio + 10, TOTAL_CASAS + 1)):
+            pagado = pagos_por_casa.get(num, 0.0)
+            fila.append((num, clase_casa(conc, num - 1, pagado), f"{pagado:.2f}"))
+        grilla.append(fila)
+
+    return dict(
         ingresos=ingresos,
         gastos_total=egresos,
         disponible=ingresos - egresos,
-        cuotas=cuotas,
-        pagos_por_casa=pagos_por_casa,
-        total_cuotas=total_cuotas
+        cuotas=[dict(c) for c in cuotas],
+        grilla=grilla,
+        clave_grilla=hashlib.md5(repr(grilla).encode()).hexdigest()
     )
 
 
+def clase_casa(conc, i, pagado):
+    if conc['cuotas']:
+        if conc['pendientes'][i] == 0 and conc['parciales'][i] == 0:
+            return 'house-al-dia'
+        if conc['pagadas'][i] or conc['parciales'][i]:
+            return 'house-parcial'
+        return 'house-debe'
+    return 'house-al-dia' if pagado > 0 else 'house-sin-info'
+
+
 @app.route('/api/estado-casa/<int:numero_casa>')
+@respuesta_cacheada('pagos', 'cuotas')
 def api_estado_casa(numero_casa):
+    estado = cache_consulta(f'estado_casa:{numero_casa}', ('pagos', 'cuotas'),
+                            lambda: _estado_casa_json(numero_casa))
+    return Response(estado, mimetype='application/json')
+
+
+def _estado_casa_json(numero_casa):
+    # El JSON completo sale de Postgres como texto y se sirve tal cual. Lo
+    # aplicado por cuota viene de cuota_casa; una casa fuera de 1..250 no
+    # tiene filas ahí y debe todas las cuotas activas.
     cur, conn = get_cursor()
     try:
-        casa_str = str(numero_casa)
-
         cur.execute("""
-            SELECT p.id, p.casa, p.monto, p.fecha, p.notas, p.comprobante,
-                   c.descripcion as cuota_desc
-            FROM pagos p
-            LEFT JOIN cuotas c ON p.cuota_id = c.id
-            WHERE p.casa = %s
-            ORDER BY p.fecha DESC
-        """, (casa_str,))
-        pagos = []
-        for r in cur.fetchall():
-            row = dict(r)
-            if row.get('fecha'):
-                row['fecha'] = str(row['fecha'])
-            row['monto'] = float(row['monto'])
-            pagos.append(row)
-
-        cur.execute("SELECT COALESCE(SUM(monto),0) as total FROM pagos WHERE casa=%s", (casa_str,))
-        total_pagado = float(cur.fetchone()['total'])
-
-        cur.execute("SELECT * FROM cuotas WHERE activa=TRUE ORDER BY fecha_vencimiento")
-        cuotas_activas = []
-        for r in cur.fetchall():
-            row = dict(r)
-            if row.get('fecha_vencimiento'):
-                row['fecha_vencimiento'] = str(row['fecha_vencimiento'])
-            row['monto'] = float(row['monto'])
-            cuotas_activas.append(row)
-
-        total_cuotas = sum(c['monto'] for c in cuotas_activas)
-
-        cur.execute(
-            "SELECT DISTINCT cuota_id FROM pagos WHERE casa=%s AND cuota_id IS NOT NULL",
-            (casa_str,)
-        )
-        cuotas_pagadas_ids = {r['cuota_id'] for r in cur.fetchall()}
-        cuotas_pendientes = [c for c in cuotas_activas if c['id'] not in cuotas_pagadas_ids]
-
+            SELECT json_build_object(
+                'casa', %(numero)s,
+                'total_pagado', COALESCE((
+                    SELECT total_pagado FROM saldos_casa WHERE casa = %(casa)s
+                ), 0),
+                'total_cuotas', COALESCE(SUM(c.monto), 0),
+                'total_debe', COALESCE(SUM(c.monto - c.aplicado), 0),
+                'pagos', COALESCE((
+                    SELECT json_agg(x ORDER BY x.fecha DESC, x.id DESC)
+                    FROM (
+                        SELECT p.id, p.casa, p.monto, p.fecha, p.notas, p.comprobante,
+                               p.comprobante_miniatura, cu.descripcion AS cuota_desc
+                        FROM pagos p
+                        LEFT JOIN cuotas cu ON p.cuota_id = cu.id
+                        WHERE p.casa = %(casa)s
+                    ) x
+                ), '[]'::json),
+                'cuotas_pendientes', COALESCE(json_agg(json_build_object(
+                    'id', c.id, 'descripcion', c.descripcion, 'monto', c.monto,
+                    'fecha_vencimiento', c.fecha_vencimiento, 'tipo', c.tipo,
+                    'aplicado', c.aplicado
+                ) ORDER BY c.fecha_vencimiento, c.id) FILTER (WHERE c.aplicado < c.monto),
+                '[]'::json)
+            )::text AS estado
+            FROM (
+                SELECT c.id, c.descripcion, c.monto, c.fecha_vencimiento, c.tipo,
+                       COALESCE(cc.aplicado, 0) AS aplicado
+                FROM cuotas c
+                LEFT JOIN cuota_casa cc ON cc.cuota_id = c.id AND cc.casa = %(numero)s
+                WHERE c.activa = TRUE
+            ) c
+        """, {'numero': numero_casa, 'casa': str(numero_casa)})
+        return cur.fetchone()['estado']
     finally:
         release_conn(conn)
 
-    return jsonify({
-        'casa': numero_casa,
-        'total_pagado': total_pagado,
-        'total_debe': max(0, total_cuotas - total_pagado),
-        'total_cuotas': total_cuotas,
-        'pagos': pagos,
-        'cuotas_pendientes': cuotas_pendientes
+
+@app.route('/api/estado-casas')
+@respuesta_cacheada('pagos', 'cuotas')
+def api_estado_casas():
+    estado = cache_consulta('estado_casas', ('pagos', 'cuotas'), _estado_casas_json)
+    return Response(estado, mimetype='application/json')
+
+
+def _estado_casas_json():
+    # Estado de las 250 casas en formato columnar: la posición i de cada
+    # lista corresponde a la casa casas[i]. La página lo descarga una vez y
+    # abre cualquier modal sin volver a consultar al servidor.
+    conc = conciliacion()
+    saldos = {f['casa']: f for f in consultar(
+        "SELECT casa, total_pagado, ultimo_pago FROM saldos_casa"
+    )}
+    ids = [c['id'] for c in conc['cuotas']]
+    pagado, ultimo_pago, pendientes, abonado = [], [], [], []
+    for i in range(TOTAL_CASAS):
+        saldo = saldos.get(str(i + 1))
+        pagado.append(float(saldo['total_pagado']) if saldo else 0.0)
+        ultimo_pago.append(saldo['ultimo_pago'].isoformat()
+                           if saldo and saldo['ultimo_pago'] else None)
+        faltan = [j for j, e in enumerate(conc['estado'][i]) if e != PAGADA]
+        pendientes.append([ids[j] for j in faltan])
+        abonado.append([conc['aplicado'][i][j] for j in faltan])
+    return json.dumps({
+        'total_cuotas': conc['total_cuotas'],
+        'cuotas': conc['cuotas'],
+        'casas': list(range(1, TOTAL_CASAS + 1)),
+        'pagado': pagado,
+        'debe': conc['debe'],
+        'pendientes': pendientes,
+        'abonado': abonado,
+        'ultimo_pago': ultimo_pago,
     })
 
 
 @app.route('/comite')
+@respuesta_cacheada('comite')
 def comite():
-    cur, conn = get_cursor()
-    try:
-        cur.execute("SELECT * FROM comite")
-        data = cur.fetchall()
-    finally:
-        release_conn(conn)
+    data = cache_consulta('comite', ('comite',), lambda: consultar(
+        "SELECT * FROM comite"
+    ))
     return render_template('comite.html', data=data)
 
 
 @app.route('/requerimientos')
+@respuesta_cacheada('requerimientos')
 def requerimientos():
-    cur, conn = get_cursor()
-    try:
-        cur.execute("SELECT * FROM requerimientos ORDER BY prioridad")
-        data = cur.fetchall()
-    finally:
-        release_conn(conn)
+    data = cache_consulta('requerimientos', ('requerimientos',), lambda: consultar(
+        "SELECT * FROM requerimientos ORDER BY prioridad"
+    ))
     return render_template('requerimientos.html', data=data)
 
 
 @app.route('/sugerencias', methods=['GET', 'POST'])
+@respuesta_cacheada('sugerencias')
 def sugerencias():
     if request.method == 'POST':
         texto = request.form.get('texto')
@@ -395,51 +3260,166 @@ def sugerencias():
                 conn.commit()
             finally:
                 release_conn(conn)
+            invalidar('sugerencias')
         return redirect('/sugerencias')
 
-    cur, conn = get_cursor()
-    try:
-        cur.execute("SELECT * FROM sugerencias ORDER BY fecha DESC")
-        data = cur.fetchall()
-    finally:
-        release_conn(conn)
-    return render_template('sugerencias.html', data=data)
+    data, siguiente = _pagina_sugerencias()
+    return render_template('sugerencias.html', data=data, siguiente=siguiente)
+
+
+@app.route('/api/sugerencias')
+@respuesta_cacheada('sugerencias')
+def api_sugerencias():
+    return pagina_json(*_pagina_sugerencias())
+
+
+def _pagina_sugerencias():
+    return cache_consulta(f"sugerencias:{request.query_string.decode()}", ('sugerencias',),
+                          lambda: consultar_pagina("""
+        SELECT id, texto, fecha FROM sugerencias
+        WHERE TRUE {antes}
+        ORDER BY {orden}
+    """))
 
 
 @app.route('/estado-cuenta/excel')
 def estado_cuenta_excel():
-    cur, conn = get_cursor()
+    return servir_exporte('estado_cuenta.xlsx', 'estado_cuenta_general.xlsx')
+
+
+@app.route('/estado-cuenta/export/<nombre>')
+def estado_cuenta_export(nombre):
+    if nombre not in EXPORTES:
+        abort(404)
+    return servir_exporte(nombre, nombre)
+
+# ==========================================================
+# BÚSQUEDA
+# ==========================================================
+# /buscar consulta las columnas tsvector de minutas, sugerencias y (solo
+# para el admin) notas de pagos con websearch_to_tsquery, así acepta
+# "frases entre comillas", OR y -exclusiones. Cada tabla usa su índice
+# GIN (o el de fecha) y solo rankea sus BUSQUEDA_CANDIDATOS coincidencias
+# más recientes: con palabras que aparecen en casi todo el historial,
+# rankear todas costaba más que la propia búsqueda. ts_headline corre
+# solo sobre la página devuelta. La paginación es por cursor sobre
+# (rango, tipo, id).
+
+BUSQUEDA_MAX_CARACTERES = 200
+BUSQUEDA_CANDIDATOS = int(os.environ.get('BUSQUEDA_CANDIDATOS', 1000))
+# Marcas que no aparecen en texto normal: el extracto se escapa y
+# después se convierten en <mark>
+_INICIO_MARCA, _FIN_MARCA = '\ue000', '\ue001'
+OPCIONES_EXTRACTO = (f"StartSel={_INICIO_MARCA}, StopSel={_FIN_MARCA}, "
+                     "MaxWords=30, MinWords=12, MaxFragments=2")
+
+# La consulta va literal en cada subconsulta (no en un CTE) para que el
+# planificador la vea como constante: con términos muy frecuentes recorre
+# el índice por fecha y corta al juntar los candidatos.
+CONSULTA_BUSQUEDA = "websearch_to_tsquery('spanish', sin_acentos(%(q)s))"
+
+SQL_BUSCAR = {
+    'minuta': f"""
+        SELECT 'minuta' AS tipo, m.id, m.fecha::date AS fecha, m.titulo,
+               coalesce(m.resumen, '') AS texto, m.archivo AS enlace,
+               ts_rank(m.busqueda, {CONSULTA_BUSQUEDA}) AS rango
+        FROM (
+            SELECT id, fecha, titulo, resumen, archivo, busqueda FROM minutas
+            WHERE busqueda @@ {CONSULTA_BUSQUEDA}
+            ORDER BY COALESCE(fecha, '-infinity') DESC, id DESC LIMIT %(candidatos)s
+        ) m
+    """,
+    'sugerencia': f"""
+        SELECT 'sugerencia', s.id, s.fecha::date, NULL,
+               coalesce(s.texto, ''), NULL, ts_rank(s.busqueda, {CONSULTA_BUSQUEDA})
+        FROM (
+            SELECT id, fecha, texto, busqueda FROM sugerencias
+            WHERE busqueda @@ {CONSULTA_BUSQUEDA}
+            ORDER BY COALESCE(fecha, '-infinity') DESC, id DESC LIMIT %(candidatos)s
+        ) s
+    """,
+    'pago': f"""
+        SELECT 'pago', p.id, p.fecha, 'Casa ' || p.casa || ' – $' || p.monto,
+               coalesce(p.notas, ''), p.comprobante, ts_rank(p.busqueda, {CONSULTA_BUSQUEDA})
+        FROM (
+            SELECT id, fecha, casa, monto, notas, comprobante, busqueda FROM pagos
+            WHERE busqueda @@ {CONSULTA_BUSQUEDA}
+            ORDER BY COALESCE(fecha, '-infinity') DESC, id DESC LIMIT %(candidatos)s
+        ) p
+    """,
+}
+
+
+def codificar_cursor_busqueda(fila):
+    crudo = f"{fila['rango']!r}|{fila['tipo']}|{fila['id']}"
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor_busqueda(token):
     try:
-        cur.execute("SELECT * FROM pagos ORDER BY fecha DESC")
-        pagos = cur.fetchall()
-        cur.execute("SELECT * FROM gastos ORDER BY fecha DESC")
-        gastos = cur.fetchall()
-    finally:
-        release_conn(conn)
+        crudo = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        rango, tipo, id_ = crudo.split('|')
+        if tipo not in SQL_BUSCAR:
+            raise ValueError(tipo)
+        return float(rango), tipo, int(id_)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        abort(400)
+
+
+def _resaltar(extracto):
+    html = str(Markup.escape(extracto))
+    return Markup(html.replace(_INICIO_MARCA, '<mark>').replace(_FIN_MARCA, '</mark>'))
+
+
+def buscar(texto, tipos):
+    """Resultados rankeados de texto en las tablas de tipos, paginados por cursor."""
+    limite = limite_pagina()
+    params = {'q': texto[:BUSQUEDA_MAX_CARACTERES], 'limite': limite + 1,
+              'candidatos': BUSQUEDA_CANDIDATOS, 'opciones': OPCIONES_EXTRACTO}
+    antes = ''
+    token = request.args.get('before')
+    if token:
+        params['rango'], params['tipo'], params['id'] = decodificar_cursor_busqueda(token)
+        antes = "AND (rango, tipo, id) < (%(rango)s::real, %(tipo)s, %(id)s)"
+    filas = consultar(f"""
+        SELECT r.tipo, r.id, r.fecha, r.titulo, r.enlace, r.rango,
+               ts_headline('spanish', r.texto, {CONSULTA_BUSQUEDA}, %(opciones)s) AS extracto
+        FROM (
+            SELECT * FROM ({' UNION ALL '.join(SQL_BUSCAR[t] for t in tipos)}) t
+            WHERE TRUE {antes}
+            ORDER BY rango DESC, tipo DESC, id DESC
+            LIMIT %(limite)s
+        ) r
+        ORDER BY r.rango DESC, r.tipo DESC, r.id DESC
+    """, params)
+    for f in filas:
+        f['extracto'] = _resaltar(f['extracto'])
+    siguiente = codificar_cursor_busqueda(filas[limite - 1]) if len(filas) > limite else None
+    return filas[:limite], siguiente
+
+
+def _resultados_busqueda():
+    texto = request.args.get('q', '').strip()
+    if not texto:
+        return texto, [], None
+    # Los pagos son datos de cada casa: solo los ve el admin
+    tipos = ['minuta', 'sugerencia']
+    if session.get('rol') == 'admin':
+        tipos.append('pago')
+    return (texto, *buscar(texto, tipos))
+
+
+@app.route('/buscar')
+def buscar_pagina():
+    texto, resultados, siguiente = _resultados_busqueda()
+    return render_template('buscar.html', q=texto, resultados=resultados, siguiente=siguiente)
+
+
+@app.route('/api/buscar')
+def api_buscar():
+    _, resultados, siguiente = _resultados_busqueda()
+    return pagina_json(resultados, siguiente)
 
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Pagos"
-    ws.append(["Casa", "Monto", "Fecha", "Notas", "Comprobante"])
-    for p in pagos:
-        ws.append([p['casa'], float(p['monto']), str(p['fecha']),
-                   p['notas'] or "", p['comprobante'] or ""])
-
-    ws2 = wb.create_sheet("Gastos")
-    ws2.append(["Descripción", "Monto", "Fecha", "Factura"])
-    for g in gastos:
-        ws2.append([g['descripcion'], float(g['monto']), str(g['fecha']),
-                    g['factura'] or ""])
-
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-
-    return Response(
-        output,
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": "attachment; filename=estado_cuenta_general.xlsx"}
-    )
 
 # ==========================================================
 # ADMIN – PAGO
@@ -449,36 +3429,332 @@ def estado_cuenta_excel():
 @admin_required
 def admin_pago():
     if request.method == 'POST':
-        casa = request.form['casa']
-        monto = request.form['monto']
-        cuota_id = request.form.get('cuota_id') or None
-        archivo = request.files['comprobante']
+        registrar_pago(request.form['casa'], request.form['monto'],
+                       request.form.get('cuota_id') or None,
+                       request.form.get('notas'), request.files['comprobante'])
+        return redirect('/estado-cuenta')
 
-        url = None
-        if archivo and archivo.filename:
-            url = subir_a_supabase(archivo, "pagos")
+    pagos, siguiente = consultar_pagina("""
+        SELECT p.id, p.casa, p.monto, p.fecha, p.notas, p.cuota_id,
+               p.comprobante, p.comprobante_miniatura, EXISTS (
+            SELECT 1 FROM subidas_pendientes s
+            WHERE s.tabla = 'pagos' AND s.fila_id = p.id
+        ) AS subiendo
+        FROM pagos p
+        WHERE TRUE {antes}
+        ORDER BY {orden}
+    """, clave='p.fecha, p.id')
+    cuotas = consultar("SELECT * FROM cuotas WHERE activa=TRUE ORDER BY fecha_vencimiento")
+    return render_template('admin_pago.html', pagos=pagos, cuotas=cuotas, siguiente=siguiente)
 
-        cur, conn = get_cursor()
+
+def normalizar_casa(casa):
+    # pagos.casa es texto: '07' o ' 7' se guardan como '7', igual que en
+    # saldos_casa y cuota_casa
+    texto = str(casa).strip()
+    return str(int(texto)) if texto.isascii() and texto.isdigit() else texto
+
+
+def registrar_pago(casa, monto, cuota_id, notas, archivo):
+    subida = None
+    if archivo and archivo.filename:
+        subida = preparar_subida(archivo, "pagos")
+
+    cur, conn = get_cursor()
+    try:
+        cur.execute("""
+            INSERT INTO pagos (casa, monto, fecha, comprobante, notas, cuota_id)
+            VALUES (%s, %s, %s, NULL, %s, %s)
+            RETURNING id, casa, monto, fecha
+        """, (normalizar_casa(casa), monto, datetime.now().date(), notas, cuota_id))
+        p = cur.fetchone()
+        saldo_registrar_pago(cur, p['casa'], p['monto'], p['fecha'])
+        cuotas_refrescar_casa(cur, p['casa'])
+        if subida:
+            registrar_subida(cur, 'pagos', p['id'], subida)
+        conn.commit()
+    finally:
+        release_conn(conn)
+    invalidar('pagos')
+    if subida:
+        encolar_subidas()
+
+
+# ==========================================================
+# ADMIN – IMPORTACIÓN DE PAGOS
+# ==========================================================
+# /admin/pagos/importar recibe un CSV o XLSX con columnas casa, monto y
+# fecha (y opcionalmente cuota y notas). El archivo se lee fila a fila, se
+# valida y se compara contra los pagos existentes (misma casa, monto y
+# fecha) sin escribir nada: el admin ve el resultado y confirma. Las filas
+# validadas esperan en IMPORT_DIR hasta la confirmación, que las inserta
+# con execute_values en una sola transacción junto con saldos y cuotas.
+
+COLUMNAS_IMPORTE = {
+    'casa': 'casa', 'numero de casa': 'casa', 'no casa': 'casa',
+    'monto': 'monto', 'importe': 'monto', 'valor': 'monto',
+    'fecha': 'fecha',
+    'cuota': 'cuota', 'cuota id': 'cuota',
+    'notas': 'notas', 'nota': 'notas', 'concepto': 'notas', 'descripcion': 'notas',
+}
+
+
+def _normalizar_encabezado(texto):
+    texto = unicodedata.normalize('NFKD', str(texto or '')).encode('ascii', 'ignore').decode()
+    return re.sub(r'[^a-z0-9]+', ' ', texto.lower()).strip()
+
+
+def filas_archivo_pagos(archivo):
+    """Genera las filas del archivo subido como tuplas de valores crudos."""
+    nombre = (archivo.filename or '').lower()
+    if nombre.endswith('.xlsx'):
+        from openpyxl import load_workbook
+        libro = load_workbook(archivo.stream, read_only=True, data_only=True)
         try:
-            cur.execute("""
-                INSERT INTO pagos (casa, monto, fecha, comprobante, notas, cuota_id)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (casa, monto, datetime.now().date(), url,
-                  request.form.get('notas'), cuota_id))
-            conn.commit()
+            yield from libro.active.iter_rows(values_only=True)
         finally:
-            release_conn(conn)
-        return redirect('/estado-cuenta')
+            libro.close()
+    elif nombre.endswith('.csv'):
+        texto = io.TextIOWrapper(archivo.stream, encoding='utf-8-sig', newline='')
+        encabezado = texto.readline()
+        # Excel en español exporta CSV separado por punto y coma
+        separador = ';' if encabezado.count(';') > encabezado.count(',') else ','
+        yield from csv.reader([encabezado], delimiter=separador)
+        yield from csv.reader(texto, delimiter=separador)
+    else:
+        raise ValueError("El archivo debe ser .csv o .xlsx")
+
+
+def _leer_monto(valor):
+    if isinstance(valor, (int, float, Decimal)):
+        return Decimal(str(valor))
+    texto = str(valor or '').replace('$', '').replace(' ', '')
+    if ',' in texto and '.' in texto:
+        # El separador que aparece último es el decimal
+        if texto.rfind(',') > texto.rfind('.'):
+            texto = texto.replace('.', '').replace(',', '.')
+        else:
+            texto = texto.replace(',', '')
+    else:
+        texto = texto.replace(',', '.')
+    return Decimal(texto)
+
+
+def _leer_fecha(valor):
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    texto = str(valor or '').strip()
+    for formato in ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d/%m/%y'):
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            pass
+    raise ValueError(texto)
+
+
+def leer_importe(archivo):
+    """Valida el archivo y devuelve (filas válidas, errores por línea)."""
+    cuotas = consultar("SELECT id, descripcion FROM cuotas")
+    ids_cuota = {c['id'] for c in cuotas}
+    cuota_por_nombre = {c['descripcion'].strip().lower(): c['id'] for c in cuotas}
+
+    filas = filas_archivo_pagos(archivo)
+    encabezado = next(filas, None)
+    if not encabezado:
+        raise ValueError("El archivo está vacío")
+    columnas = [COLUMNAS_IMPORTE.get(_normalizar_encabezado(h)) for h in encabezado]
+    faltan = {'casa', 'monto', 'fecha'} - set(columnas)
+    if faltan:
+        raise ValueError(f"Faltan columnas: {', '.join(sorted(faltan))}")
 
+    validas, errores = [], []
+    for linea, fila in enumerate(filas, start=2):
+        if all(v is None or str(v).strip() == '' for v in fila):
+            continue
+        if len(validas) + len(errores) >= IMPORT_MAX_FILAS:
+            raise ValueError(f"El archivo supera el máximo de {IMPORT_MAX_FILAS} filas")
+        datos = {c: v for c, v in zip(columnas, fila) if c}
+        problemas = []
+
+        try:
+            casa = Decimal(str(datos.get('casa')).strip())
+            if casa != casa.to_integral_value() or not 1 <= casa <= TOTAL_CASAS:
+                raise ValueError
+            casa = str(int(casa))
+        except (ArithmeticError, ValueError):
+            problemas.append(f"casa inválida ({datos.get('casa')})")
+
+        try:
+            monto = _leer_monto(datos.get('monto'))
+            if not monto.is_finite() or monto <= 0:
+                raise ValueError
+        except (ArithmeticError, ValueError):
+            problemas.append(f"monto inválido ({datos.get('monto')})")
+
+        try:
+            fecha = _leer_fecha(datos.get('fecha'))
+        except ValueError:
+            problemas.append(f"fecha inválida ({datos.get('fecha')})")
+
+        cuota_id = None
+        cuota = str(datos.get('cuota') or '').strip()
+        if cuota:
+            if cuota.isdigit() and int(cuota) in ids_cuota:
+                cuota_id = int(cuota)
+            elif cuota.lower() in cuota_por_nombre:
+                cuota_id = cuota_por_nombre[cuota.lower()]
+            else:
+                problemas.append(f"cuota desconocida ({cuota})")
+
+        if problemas:
+            errores.append({'linea': linea, 'problemas': problemas})
+            continue
+        validas.append({
+            'linea': linea, 'casa': casa, 'monto': monto, 'fecha': fecha,
+            'cuota_id': cuota_id, 'notas': str(datos.get('notas') or '').strip() or None,
+        })
+    return validas, errores
+
+
+def marcar_duplicados(cur, filas):
+    # Primero repetidas dentro del archivo; después las que ya están en pagos
+    vistas = set()
+    for f in filas:
+        clave = (f['casa'], f['monto'], f['fecha'])
+        f['duplicado'] = 'archivo' if clave in vistas else None
+        vistas.add(clave)
+    if not filas:
+        return
+    existentes = psycopg2.extras.execute_values(cur, """
+        SELECT v.linea FROM (VALUES %s) AS v (linea, casa, monto, fecha)
+        WHERE EXISTS (
+            SELECT 1 FROM pagos p
+            WHERE p.casa = v.casa AND p.monto = v.monto AND p.fecha = v.fecha
+        )
+    """, [(f['linea'], f['casa'], f['monto'], f['fecha']) for f in filas],
+        template="(%s, %s, %s::numeric, %s::date)", page_size=1000, fetch=True)
+    lineas = {r['linea'] for r in existentes}
+    for f in filas:
+        if f['linea'] in lineas:
+            f['duplicado'] = 'existente'
+
+
+def _ruta_importe(token):
+    if not re.fullmatch(r'[0-9a-f]{32}', token or ''):
+        return None
+    return os.path.join(IMPORT_DIR, f"{token}.json")
+
+
+def guardar_importe(filas):
+    os.makedirs(IMPORT_DIR, exist_ok=True)
+    # Vistas previas de más de un día ya no se van a confirmar
+    limite = time.time() - 86400
+    for nombre in os.listdir(IMPORT_DIR):
+        ruta = os.path.join(IMPORT_DIR, nombre)
+        if os.path.getmtime(ruta) < limite:
+            os.remove(ruta)
+    token = uuid.uuid4().hex
+    with open(_ruta_importe(token), 'w') as f:
+        json.dump([dict(x, monto=str(x['monto']), fecha=x['fecha'].isoformat())
+                   for x in filas], f)
+    return token
+
+
+def _reclamar_importe(token):
+    """Reserva la vista previa para una sola confirmación; devuelve su ruta."""
+    ruta = _ruta_importe(token)
+    if ruta is None:
+        raise ValueError("La vista previa expiró; vuelva a subir el archivo")
+    reclamada = f"{ruta}.confirmando"
+    # rename es atómico: con doble clic o dos pestañas solo uno lo logra
+    try:
+        os.rename(ruta, reclamada)
+    except FileNotFoundError:
+        if os.path.exists(reclamada):
+            raise ValueError("Esta importación ya se está confirmando")
+        if os.path.exists(f"{ruta}.confirmado"):
+            raise ValueError("Esta importación ya se confirmó")
+        raise ValueError("La vista previa expiró; vuelva a subir el archivo")
+    return ruta, reclamada
+
+
+def confirmar_importe(token, incluir_duplicados=False):
+    """Inserta las filas de una vista previa; devuelve (importadas, omitidas)."""
+    ruta, reclamada = _reclamar_importe(token)
+    try:
+        with open(reclamada) as f:
+            filas = [dict(x, monto=Decimal(x['monto']), fecha=date.fromisoformat(x['fecha']))
+                     for x in json.load(f)]
+        importadas = _insertar_importe(filas, incluir_duplicados)
+    except Exception:
+        # Falló: la vista previa vuelve a quedar disponible para reintentar
+        os.rename(reclamada, ruta)
+        raise
+    os.rename(reclamada, f"{ruta}.confirmado")
+    if importadas:
+        invalidar('pagos')
+    return importadas, len(filas) - importadas
+
+
+def _insertar_importe(filas, incluir_duplicados):
     cur, conn = get_cursor()
     try:
-        cur.execute("SELECT * FROM pagos ORDER BY fecha DESC")
-        pagos = cur.fetchall()
-        cur.execute("SELECT * FROM cuotas WHERE activa=TRUE ORDER BY fecha_vencimiento")
-        cuotas = cur.fetchall()
+        # Se vuelve a comparar: pudieron cargarse pagos desde la vista previa
+        marcar_duplicados(cur, filas)
+        nuevas = [f for f in filas if incluir_duplicados or not f['duplicado']]
+        # Con muchas casas es más barato rehacer la matriz completa
+        reconstruir = len({f['casa'] for f in nuevas}) > 10
+        if reconstruir:
+            bloquear_cuotas(cur)
+        if nuevas:
+            pagos = psycopg2.extras.execute_values(cur, """
+                INSERT INTO pagos (casa, monto, fecha, notas, cuota_id)
+                VALUES %s
+                RETURNING id, casa, monto, fecha
+            """, [(f['casa'], f['monto'], f['fecha'], f['notas'], f['cuota_id']) for f in nuevas],
+                page_size=1000, fetch=True)
+            saldo_registrar_pagos(cur, pagos)
+            if reconstruir:
+                reconstruir_cuotas(cur)
+            else:
+                for casa in sorted({p['casa'] for p in pagos}):
+                    cuotas_refrescar_casa(cur, casa)
+        conn.commit()
+    finally:
+        release_conn(conn)
+    return len(nuevas)
+
+
+@app.route('/admin/pagos/importar', methods=['GET', 'POST'])
+@admin_required
+def admin_importar_pagos():
+    if request.method == 'GET':
+        return render_template('admin_pago_importar.html')
+
+    try:
+        if request.form.get('token'):
+            importadas, omitidas = confirmar_importe(
+                request.form['token'], bool(request.form.get('incluir_duplicados')))
+            return render_template('admin_pago_importar.html',
+                                   importadas=importadas, omitidas=omitidas)
+
+        archivo = request.files.get('archivo')
+        if not archivo or not archivo.filename:
+            raise ValueError("Seleccione un archivo CSV o XLSX")
+        filas, errores = leer_importe(archivo)
+    except ValueError as e:
+        return render_template('admin_pago_importar.html', error=str(e))
+
+    cur, conn = get_cursor()
+    try:
+        marcar_duplicados(cur, filas)
     finally:
         release_conn(conn)
-    return render_template('admin_pago.html', pagos=pagos, cuotas=cuotas)
+    return render_template('admin_pago_importar.html', filas=filas, errores=errores,
+                           token=guardar_importe(filas) if filas else None,
+                           nombre_archivo=archivo.filename)
 
 
 # ==========================================================
@@ -493,28 +3769,37 @@ def admin_minuta():
         resumen = request.form['resumen']
         archivo = request.files['archivo']
 
-        url = None
+        subida = None
         if archivo and archivo.filename:
-            url = subir_a_supabase(archivo, "minutas")
+            subida = preparar_subida(archivo, "minutas")
 
         cur, conn = get_cursor()
         try:
             cur.execute("""
                 INSERT INTO minutas (titulo, resumen, archivo, fecha)
-                VALUES (%s, %s, %s, %s)
-            """, (titulo, resumen, url, datetime.now().date()))
+                VALUES (%s, %s, NULL, %s)
+                RETURNING id
+            """, (titulo, resumen, datetime.now().date()))
+            if subida:
+                registrar_subida(cur, 'minutas', cur.fetchone()['id'], subida)
             conn.commit()
         finally:
             release_conn(conn)
+        invalidar('minutas')
+        if subida:
+            encolar_subidas()
         return redirect('/minutas')
 
-    cur, conn = get_cursor()
-    try:
-        cur.execute("SELECT * FROM minutas ORDER BY fecha DESC")
-        minutas_list = cur.fetchall()
-    finally:
-        release_conn(conn)
-    return render_template('admin_minuta.html', minutas=minutas_list)
+    minutas_list, siguiente = consultar_pagina("""
+        SELECT m.id, m.titulo, m.resumen, m.archivo, m.fecha, EXISTS (
+            SELECT 1 FROM subidas_pendientes s
+            WHERE s.tabla = 'minutas' AND s.fila_id = m.id
+        ) AS subiendo
+        FROM minutas m
+        WHERE TRUE {antes}
+        ORDER BY {orden}
+    """, clave='m.fecha, m.id')
+    return render_template('admin_minuta.html', minutas=minutas_list, siguiente=siguiente)
 
 
 # ==========================================================
@@ -529,28 +3814,39 @@ def admin_gasto():
         monto = request.form['monto']
         archivo = request.files['factura']
 
-        url = None
+        subida = None
         if archivo and archivo.filename:
-            url = subir_a_supabase(archivo, "gastos")
+            subida = preparar_subida(archivo, "gastos")
 
         cur, conn = get_cursor()
         try:
             cur.execute("""
                 INSERT INTO gastos (descripcion, monto, fecha, factura)
-                VALUES (%s, %s, %s, %s)
-            """, (descripcion, monto, datetime.now().date(), url))
+                VALUES (%s, %s, %s, NULL)
+                RETURNING id, monto
+            """, (descripcion, monto, datetime.now().date()))
+            g = cur.fetchone()
+            saldo_registrar_gasto(cur, g['monto'])
+            if subida:
+                registrar_subida(cur, 'gastos', g['id'], subida)
             conn.commit()
         finally:
             release_conn(conn)
+        invalidar('gastos')
+        if subida:
+            encolar_subidas()
         return redirect('/estado-cuenta')
 
-    cur, conn = get_cursor()
-    try:
-        cur.execute("SELECT * FROM gastos ORDER BY fecha DESC")
-        gastos = cur.fetchall()
-    finally:
-        release_conn(conn)
-    return render_template('admin_gasto.html', gastos=gastos)
+    gastos, siguiente = consultar_pagina("""
+        SELECT g.*, EXISTS (
+            SELECT 1 FROM subidas_pendientes s
+            WHERE s.tabla = 'gastos' AND s.fila_id = g.id
+        ) AS subiendo
+        FROM gastos g
+        WHERE TRUE {antes}
+        ORDER BY {orden}
+    """, clave='g.fecha, g.id')
+    return render_template('admin_gasto.html', gastos=gastos, siguiente=siguiente)
 
 
 # ==========================================================
@@ -566,24 +3862,36 @@ def admin_comite():
         casa = request.form['casa']
         archivo = request.files['foto']
 
-        url = None
+        subida = None
         if archivo and archivo.filename:
-            url = subir_a_supabase(archivo, "comite")
+            subida = preparar_subida(archivo, "comite")
 
         cur, conn = get_cursor()
         try:
             cur.execute("""
                 INSERT INTO comite (nombre, cargo, casa, foto)
-                VALUES (%s, %s, %s, %s)
-            """, (nombre, cargo, casa, url))
+                VALUES (%s, %s, %s, NULL)
+                RETURNING id
+            """, (nombre, cargo, casa))
+            if subida:
+                registrar_subida(cur, 'comite', cur.fetchone()['id'], subida)
             conn.commit()
         finally:
             release_conn(conn)
+        invalidar('comite')
+        if subida:
+            encolar_subidas()
         return redirect('/comite')
 
     cur, conn = get_cursor()
     try:
-        cur.execute("SELECT * FROM comite ORDER BY nombre")
+        cur.execute("""
+            SELECT c.*, EXISTS (
+                SELECT 1 FROM subidas_pendientes s
+                WHERE s.tabla = 'comite' AND s.fila_id = c.id
+            ) AS subiendo
+            FROM comite c ORDER BY c.nombre
+        """)
         miembros = cur.fetchall()
     finally:
         release_conn(conn)
@@ -605,13 +3913,16 @@ def admin_cuotas():
 
         cur, conn = get_cursor()
         try:
+            bloquear_cuotas(cur)
             cur.execute("""
                 INSERT INTO cuotas (descripcion, monto, fecha_vencimiento, tipo, activa)
                 VALUES (%s, %s, %s, %s, TRUE)
             """, (descripcion, monto, fecha_vencimiento, tipo))
+            reconstruir_cuotas(cur)
             conn.commit()
         finally:
             release_conn(conn)
+        invalidar('cuotas')
         return redirect('/admin/cuotas')
 
     cur, conn = get_cursor()
@@ -620,7 +3931,119 @@ def admin_cuotas():
         cuotas = cur.fetchall()
     finally:
         release_conn(conn)
-    return render_template('admin_cuotas.html', cuotas=cuotas)
+    cobranza = {c['id']: c for c in conciliacion()['cuotas']}
+    return render_template('admin_cuotas.html', cuotas=cuotas, cobranza=cobranza)
+
+
+def cobranza_cuota(cuota_id):
+    """Cuota con sus totales precalculados y el estado de cada casa."""
+    cur, conn = get_cursor()
+    try:
+        cur.execute("""
+            SELECT c.*, r.recaudado, r.pagadas, r.parciales, r.pendientes
+            FROM cuotas c JOIN cuota_resumen r ON r.cuota_id = c.id
+            WHERE c.id = %s
+        """, (cuota_id,))
+        cuota = cur.fetchone()
+        if cuota is None:
+            return None
+        cur.execute("""
+            SELECT cc.casa, cc.aplicado, ult.comprobante
+            FROM cuota_casa cc
+            LEFT JOIN LATERAL (
+                SELECT p.comprobante FROM pagos p
+                WHERE p.cuota_id = cc.cuota_id AND p.casa = cc.casa::text
+                ORDER BY p.fecha DESC, p.id DESC
+                LIMIT 1
+            ) ult ON TRUE
+            WHERE cc.cuota_id = %s
+            ORDER BY cc.casa
+        """, (cuota_id,))
+        casas = cur.fetchall()
+    finally:
+        release_conn(conn)
+
+    cuota = dict(cuota)
+    vencida = cuota['fecha_vencimiento'] < datetime.now().date()
+    filas = []
+    for c in casas:
+        estado = estado_celda(c['aplicado'], cuota['monto'])
+        filas.append({
+            'numero': c['casa'],
+            'aplicado': float(c['aplicado']),
+            'falta': float(cuota['monto'] - c['aplicado']),
+            'estado': estado,
+            'comprobante': c['comprobante'],
+            'atrasada': vencida and estado != PAGADA,
+        })
+    esperado = cuota['monto'] * len(filas)
+    resumen = {
+        'total_casas': len(filas),
+        'total_esperado': float(esperado),
+        'total_pagado': float(cuota['recaudado']),
+        'total_pendiente': float(esperado - cuota['recaudado']),
+        'pagadas': cuota['pagadas'],
+        'parciales': cuota['parciales'],
+        'pendientes': cuota['pendientes'],
+        'atrasadas': [f for f in filas if f['atrasada']],
+    }
+    return {'cuota': cuota, 'casas': filas, 'resumen': resumen}
+
+
+def _cobranza_o_404(cuota_id):
+    # Sólo las cuotas activas tienen conciliación
+    datos = cache_consulta(f'cobranza:{cuota_id}', ('pagos', 'cuotas'),
+                           lambda: cobranza_cuota(cuota_id))
+    if datos is None:
+        abort(404)
+    return datos
+
+
+@app.route('/admin/cuota/<int:cuota_id>')
+@admin_required
+def admin_cuota_detalle(cuota_id):
+    return render_template('admin_cuota_detalle.html', **_cobranza_o_404(cuota_id))
+
+
+@app.route('/admin/cuota/<int:cuota_id>/estado')
+@admin_required
+def admin_cuota_estado(cuota_id):
+    return render_template('admin_cuota_estado.html', **_cobranza_o_404(cuota_id))
+
+
+@app.route('/admin/cuota/<int:cuota_id>/pagar', methods=['POST'])
+@admin_required
+def admin_cuota_pagar(cuota_id):
+    # pagos.cuota_id no tiene clave foránea: sin esto quedaba un pago
+    # apuntando a una cuota que no existe
+    _cobranza_o_404(cuota_id)
+    registrar_pago(request.form['casa'], request.form['monto'], cuota_id,
+                   request.form.get('notas'), request.files.get('comprobante'))
+    return redirect(f'/admin/cuota/{cuota_id}')
+
+
+# ==========================================================
+# ADMIN – CACHÉ Y POOL
+# ==========================================================
+
+@app.route('/admin/cache')
+@admin_required
+def admin_cache():
+    return jsonify({
+        'local': cache_local.stats(),
+        'respuestas': cache_respuestas.stats(),
+        'fragmentos': cache_fragmentos.stats(),
+        'archivos': cache_archivos.stats(),
+        'redis': cache_redis is not None,
+    })
+
+
+@app.route('/admin/pool')
+@admin_required
+def admin_pool():
+    if connection_pool is None:
+        return jsonify({'activo': False})
+    return jsonify(dict(connection_pool.stats(), activo=True))
 
 
 # ==========================================================
@@ -632,10 +4055,16 @@ def admin_cuotas():
 def delete_pago(id):
     cur, conn = get_cursor()
     try:
-        cur.execute("DELETE FROM pagos WHERE id=%s", (id,))
+        cur.execute("DELETE FROM pagos WHERE id=%s RETURNING casa, monto", (id,))
+        p = cur.fetchone()
+        if p:
+            saldo_revertir_pago(cur, p['casa'], p['monto'])
+            cuotas_refrescar_casa(cur, p['casa'])
+        cur.execute("DELETE FROM subidas_pendientes WHERE tabla='pagos' AND fila_id=%s", (id,))
         conn.commit()
     finally:
         release_conn(conn)
+    invalidar('pagos')
     return redirect('/admin/pago')
 
 
@@ -645,9 +4074,11 @@ def delete_minuta(id):
     cur, conn = get_cursor()
     try:
         cur.execute("DELETE FROM minutas WHERE id=%s", (id,))
+        cur.execute("DELETE FROM subidas_pendientes WHERE tabla='minutas' AND fila_id=%s", (id,))
         conn.commit()
     finally:
         release_conn(conn)
+    invalidar('minutas')
     return redirect('/admin/minuta')
 
 
@@ -656,10 +4087,15 @@ def delete_minuta(id):
 def delete_gasto(id):
     cur, conn = get_cursor()
     try:
-        cur.execute("DELETE FROM gastos WHERE id=%s", (id,))
+        cur.execute("DELETE FROM gastos WHERE id=%s RETURNING monto", (id,))
+        g = cur.fetchone()
+        if g:
+            saldo_revertir_gasto(cur, g['monto'])
+        cur.execute("DELETE FROM subidas_pendientes WHERE tabla='gastos' AND fila_id=%s", (id,))
         conn.commit()
     finally:
         release_conn(conn)
+    invalidar('gastos')
     return redirect('/admin/gasto')
 
 
@@ -669,9 +4105,11 @@ def delete_comite(id):
     cur, conn = get_cursor()
     try:
         cur.execute("DELETE FROM comite WHERE id=%s", (id,))
+        cur.execute("DELETE FROM subidas_pendientes WHERE tabla='comite' AND fila_id=%s", (id,))
         conn.commit()
     finally:
         release_conn(conn)
+    invalidar('comite')
     return redirect('/admin/comite')
 
 
@@ -684,6 +4122,7 @@ def delete_requerimiento(id):
         conn.commit()
     finally:
         release_conn(conn)
+    invalidar('requerimientos')
     return redirect('/requerimientos')
 
 
@@ -692,10 +4131,13 @@ def delete_requerimiento(id):
 def delete_cuota(id):
     cur, conn = get_cursor()
     try:
+        bloquear_cuotas(cur)
         cur.execute("DELETE FROM cuotas WHERE id=%s", (id,))
+        reconstruir_cuotas(cur)
         conn.commit()
     finally:
         release_conn(conn)
+    invalidar('cuotas')
     return redirect('/admin/cuotas')
 
 
@@ -707,22 +4149,39 @@ def delete_cuota(id):
 def login():
     error = None
     if request.method == 'POST':
-        cur, conn = get_cursor()
-        try:
-            cur.execute(
-                "SELECT * FROM usuarios WHERE usuario=%s AND password=%s",
-                (request.form['usuario'], request.form['password'])
-            )
-            u = cur.fetchone()
-        finally:
-            release_conn(conn)
+        usuario = request.form['usuario']
+        clave = f"{request.remote_addr}:{usuario.strip().lower()}"
+        espera = fallos_login.espera(clave) or intentos_ip.tomar(request.remote_addr)
+        if espera:
+            segundos = math.ceil(espera)
+            resp = make_response(render_template(
+                'login.html',
+                error=f"Demasiados intentos fallidos. Intente de nuevo en {segundos} segundos."
+            ), 429)
+            resp.headers['Retry-After'] = str(segundos)
+            return resp
 
-        if u:
-            session['usuario'] = u['usuario']
-            session['rol'] = u['rol']
+        filas = consultar(
+            "SELECT id, usuario, rol, password_hash FROM usuarios WHERE usuario=%s", (usuario,))
+        u = filas[0] if filas else None
+        # argon2 corre con la conexión ya devuelta al pool
+        if verificar_password(u and u['password_hash'], request.form['password']):
+            if hasher.check_needs_rehash(u['password_hash']):
+                u['password_hash'] = hasher.hash(request.form['password'])
+                cur, conn = get_cursor()
+                try:
+                    cur.execute("UPDATE usuarios SET password_hash=%s WHERE id=%s",
+                                (u['password_hash'], u['id']))
+                    conn.commit()
+                finally:
+                    release_conn(conn)
+                invalidar('usuarios')
+            session.clear()
+            session.update(datos_sesion(u))
             return redirect('/')
-        else:
-            error = "Usuario o contraseña incorrectos"
+
+        fallos_login.tomar(clave)
+        error = "Usuario o contraseña incorrectos"
 
     return render_template('login.html', error=error)
 
@@ -733,6 +4192,41 @@ def logout():
     return redirect('/')
 
 
+# ==========================================================
+# SALUD Y TIEMPO DE ARRANQUE
+# ==========================================================
+
+@app.route('/healthz')
+def healthz():
+    # No toca la base: responde aunque Postgres esté lento o caído
+    return jsonify({'ok': True, 'arranque_ms': round(TIEMPO_ARRANQUE_MS, 1)})
+
+
+@app.cli.command('startup-check')
+def startup_check_command():
+    """Mide el import de la app en un proceso nuevo contra STARTUP_BUDGET_MS."""
+    import subprocess
+    codigo = (
+        "import time; t = time.perf_counter(); import app; "
+        "print((time.perf_counter() - t) * 1000)"
+    )
+    salida = subprocess.run(
+        [sys.executable, "-c", codigo],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True
+    )
+    ms = float(salida.stdout.strip().splitlines()[-1])
+    print(f"Import de la aplicación: {ms:.0f} ms (presupuesto {STARTUP_BUDGET_MS:.0f} ms)")
+    if ms > STARTUP_BUDGET_MS:
+        sys.exit(1)
+
+
+TIEMPO_ARRANQUE_MS = (time.perf_counter() - _INICIO_IMPORT) * 1000
+if TIEMPO_ARRANQUE_MS > STARTUP_BUDGET_MS:
+    print(f"ADVERTENCIA: el arranque tardó {TIEMPO_ARRANQUE_MS:.0f} ms "
+          f"(presupuesto {STARTUP_BUDGET_MS:.0f} ms)")
+
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
@@ -0,0 +1,456 @@
+# ==========================================================
+# BENCHMARKS
+# ==========================================================
+# Comandos de medición que no son parte de la app: viven aparte para que
+# los workers de gunicorn (app:app) no los importen. Este módulo registra
+# sus comandos en la misma app de app.py, así que se corren con
+#   flask --app bench bench-render | sembrar-bench | bench-carga
+# con la misma configuración por variables de entorno que la app.
+
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, date
+from decimal import Decimal
+
+import click
+import psycopg2.extras
+
+import app as barriada
+from app import (
+    app, AlmacenLocal, TOTAL_CASAS, bootstrap, consultar, datos_sesion, get_cursor,
+    invalidar, reconstruir_cuotas, reconstruir_saldos, release_conn,
+)
+
+BENCH_DIR = os.environ.get("BENCH_DIR", os.path.join(app.instance_path, "bench"))
+
+
+# ==========================================================
+# MEDICIÓN DE RENDER
+# ==========================================================
+# 'flask --app bench bench-render' pide cada página N veces con la sesión
+# de un admin real (así no responde la caché HTTP) y separa el tiempo del
+# template del total de la petición. Las consultas quedan en caché tras la
+# primera. Cualquier respuesta que no sea un 200 renderizado corta la
+# corrida; los resultados quedan en BENCH_DIR como render-*.json.
+# benchmarks/ guarda las corridas de referencia antes y después del layout
+# (misma base _bench, -n 200).
+
+PAGINAS_BENCH = [
+    '/', '/minutas', '/estado-cuenta', '/comite', '/requerimientos',
+    '/sugerencias', '/login', '/admin/pago', '/admin/gasto',
+    '/admin/minuta', '/admin/comite', '/admin/cuotas',
+]
+
+
+@app.cli.command('bench-render')
+@click.option('-n', 'repeticiones', default=200, help='Peticiones por página.')
+@click.option('--salida', default=None, help='Archivo JSON de resultados.')
+@click.option('--comparar', default=None, help='JSON de una corrida anterior.')
+def bench_render_command(repeticiones, salida, comparar):
+    """Mide el tiempo de render por página (p50/p95 en ms)."""
+    from flask import before_render_template, template_rendered
+
+    inicio = {}
+    renders = []
+
+    def antes(sender, template, context, **extra):
+        inicio[template.name] = time.perf_counter()
+
+    def despues(sender, template, context, **extra):
+        renders.append((time.perf_counter() - inicio.pop(template.name)) * 1000)
+
+    admin = consultar(
+        "SELECT usuario, rol, password_hash FROM usuarios WHERE rol='admin' ORDER BY id LIMIT 1")
+    if not admin:
+        print("No hay usuario admin; corra 'flask --app app bootstrap'.")
+        sys.exit(1)
+    cliente = app.test_client()
+    with cliente.session_transaction() as s:
+        s.update(datos_sesion(admin[0]))
+
+    resultados = {}
+    print(f"{'página':16} {'render p50':>11} {'render p95':>11} {'total p50':>10}")
+    with before_render_template.connected_to(antes, app), \
+            template_rendered.connected_to(despues, app):
+        for ruta in PAGINAS_BENCH:
+            cliente.get(ruta)
+            renders.clear()
+            totales = []
+            for _ in range(repeticiones):
+                t = time.perf_counter()
+                resp = cliente.get(ruta)
+                totales.append((time.perf_counter() - t) * 1000)
+                # Un 302 a /login o una respuesta cacheada no miden el render
+                if resp.status_code != 200 or not renders:
+                    print(f"{ruta}: HTTP {resp.status_code}, {len(renders)} renders; "
+                          "la medición no es válida.")
+                    sys.exit(1)
+            renders.sort()
+            totales.sort()
+            r = resultados[ruta] = {
+                'render_p50_ms': round(renders[len(renders) // 2], 4),
+                'render_p95_ms': round(renders[int(len(renders) * 0.95)], 4),
+                'total_p50_ms': round(totales[len(totales) // 2], 4),
+            }
+            print(f"{ruta:16} {r['render_p50_ms']:11.3f} {r['render_p95_ms']:11.3f} "
+                  f"{r['total_p50_ms']:10.3f}")
+
+    commit = _commit_actual()
+    informe = {
+        'commit': commit,
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'repeticiones': repeticiones,
+        'paginas': resultados,
+    }
+    if salida is None:
+        os.makedirs(BENCH_DIR, exist_ok=True)
+        salida = os.path.join(BENCH_DIR, f"render-{datetime.now():%Y%m%d-%H%M%S}-{commit}.json")
+    with open(salida, 'w') as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+    print(f"Resultados en {salida}")
+    if comparar:
+        with open(comparar) as f:
+            anterior = json.load(f)
+        _comparar_bench(anterior, 'paginas', resultados,
+                        ('render_p50_ms', 'render_p95_ms', 'total_p50_ms'))
+
+
+def _comparar_bench(anterior, seccion, resultados, claves):
+    print(f"\nContra {anterior['commit']} ({anterior['fecha']}):")
+    for nombre, r in resultados.items():
+        previo = anterior[seccion].get(nombre)
+        if not previo:
+            continue
+        cambios = []
+        for clave in claves:
+            if previo.get(clave) and r[clave] is not None:
+                cambios.append(f"{clave} {(r[clave] / previo[clave] - 1) * 100:+6.1f}%")
+        print(f"{nombre:22} " + '  '.join(cambios))
+
+
+# ==========================================================
+# BENCHMARK DE CARGA
+# ==========================================================
+# 'flask --app bench sembrar-bench' llena una base de prueba (DATABASE_URL
+# apuntando a un Postgres local) con volúmenes realistas y datos
+# reproducibles por semilla; por seguridad solo corre sobre una base cuyo
+# nombre termine en _bench. 'flask --app bench bench-carga' levanta la app
+# en un servidor local con hilos (o usa --url), pega a cada escenario con
+# C clientes concurrentes y guarda p50/p95/p99 y throughput en BENCH_DIR
+# como JSON, etiquetado con el commit, para comparar con --comparar.
+# Con el servidor local, las subidas van a disco en BENCH_DIR, no a Supabase.
+
+CUOTA_MENSUAL_BENCH = Decimal('25.00')
+
+# nombre -> (método, ruta, requiere admin, estado esperado)
+# Cualquier otro estado cuenta como error: un 302 a /login en una página
+# de admin no es una respuesta rápida, es una sesión rechazada.
+ESCENARIOS_BENCH = {
+    'inicio': ('GET', '/', False, 200),
+    'estado-cuenta': ('GET', '/estado-cuenta', False, 200),
+    'estado-casas': ('GET', '/api/estado-casas', False, 200),
+    'estado-casa': ('GET', '/api/estado-casa/{casa}', False, 200),
+    'minutas': ('GET', '/minutas', False, 200),
+    'admin-estado-cuenta': ('GET', '/estado-cuenta', True, 200),
+    'admin-pago': ('GET', '/admin/pago', True, 200),
+    'admin-cuotas': ('GET', '/admin/cuotas', True, 200),
+    'admin-cuota': ('GET', '/admin/cuota/{cuota}', True, 200),
+    # Va al final: cada pago invalida las cachés de los anteriores
+    'registrar-pago': ('POST', '/admin/pago', True, 302),
+}
+
+
+def _meses_atras(hoy, n):
+    indice = hoy.year * 12 + hoy.month - 1 - n
+    return indice // 12, indice % 12 + 1
+
+
+@app.cli.command('sembrar-bench')
+@click.option('--anios', default=5, help='Años de historial de pagos.')
+@click.option('--cuotas', 'total_cuotas', default=300, help='Cuotas en total.')
+@click.option('--semilla', default=1, help='Semilla del generador.')
+@click.option('--forzar', is_flag=True, help='Vaciar la base aunque tenga datos.')
+def sembrar_bench_command(anios, total_cuotas, semilla, forzar):
+    """Llena la base con datos de prueba para el benchmark."""
+    import random
+
+    bootstrap()
+    rng = random.Random(semilla)
+    hoy = date.today()
+    meses = [_meses_atras(hoy, n) for n in range(anios * 12 - 1, -1, -1)]
+
+    cur, conn = get_cursor()
+    try:
+        cur.execute("SELECT current_database() AS base")
+        base = cur.fetchone()['base']
+        if not base.endswith('_bench'):
+            print(f"La base '{base}' no es de benchmark: sembrar-bench solo vacía "
+                  "bases cuyo nombre termine en _bench.")
+            sys.exit(1)
+        cur.execute("SELECT count(*) AS n FROM pagos")
+        if cur.fetchone()['n'] and not forzar:
+            print("La base ya tiene pagos; use --forzar para vaciarla.")
+            sys.exit(1)
+        cur.execute("""
+            TRUNCATE pagos, gastos, cuotas, minutas, comite, requerimientos,
+                     sugerencias, subidas_pendientes RESTART IDENTITY CASCADE
+        """)
+
+        # Una cuota por mes y el resto extraordinarias repartidas en el período
+        cuotas = [(f"Cuota {m:02d}/{a}", CUOTA_MENSUAL_BENCH, date(a, m, 10), 'mensual')
+                  for a, m in meses]
+        for _ in range(max(0, total_cuotas - len(cuotas))):
+            a, m = rng.choice(meses)
+            cuotas.append((f"Extraordinaria {rng.randint(100, 999)} {m:02d}/{a}",
+                           Decimal(rng.randint(2, 20) * 5), date(a, m, rng.randint(1, 28)),
+                           'extraordinaria'))
+        cuotas.sort(key=lambda c: c[2])
+        # Solo el último año sigue activo, como en la operación normal
+        desde_activas = date(hoy.year - 1, hoy.month, 1)
+        filas_cuotas = psycopg2.extras.execute_values(cur, """
+            INSERT INTO cuotas (descripcion, monto, fecha_vencimiento, tipo, activa)
+            VALUES %s RETURNING id, fecha_vencimiento, tipo
+        """, [c + (c[2] >= desde_activas,) for c in cuotas], page_size=1000, fetch=True)
+        mensual = {(c['fecha_vencimiento'].year, c['fecha_vencimiento'].month): c['id']
+                   for c in filas_cuotas if c['tipo'] == 'mensual'}
+
+        notas = [None, None, None, 'Transferencia', 'Depósito', 'Efectivo', 'Pago tardío']
+        pagos = []
+        for casa in range(1, TOTAL_CASAS + 1):
+            cumplimiento = rng.uniform(0.6, 1.0)
+            for a, m in meses:
+                if rng.random() < cumplimiento:
+                    cuota_id = mensual[(a, m)] if rng.random() < 0.7 else None
+                    pagos.append((str(casa), CUOTA_MENSUAL_BENCH, date(a, m, rng.randint(1, 28)),
+                                  rng.choice(notas), cuota_id))
+                if rng.random() < 0.05:
+                    pagos.append((str(casa), Decimal(rng.randint(1, 40) * 5),
+                                  date(a, m, rng.randint(1, 28)), 'Abono', None))
+        psycopg2.extras.execute_values(cur, """
+            INSERT INTO pagos (casa, monto, fecha, notas, cuota_id) VALUES %s
+        """, pagos, page_size=1000)
+
+        conceptos = ['Vigilancia', 'Jardinería', 'Electricidad', 'Agua', 'Limpieza',
+                     'Reparaciones', 'Papelería', 'Portón eléctrico']
+        psycopg2.extras.execute_values(cur, """
+            INSERT INTO gastos (descripcion, monto, fecha) VALUES %s
+        """, [(rng.choice(conceptos), Decimal(rng.randint(2000, 90000)) / 100,
+               date(a, m, rng.randint(1, 28))) for a, m in meses for _ in range(8)],
+            page_size=1000)
+
+        psycopg2.extras.execute_values(cur, """
+            INSERT INTO minutas (titulo, resumen, fecha) VALUES %s
+        """, [(f"Reunión {m:02d}/{a}", "Acuerdos de la asamblea. " * 10, date(a, m, 15))
+              for a, m in meses[-24:]], page_size=1000)
+        psycopg2.extras.execute_values(cur, """
+            INSERT INTO comite (nombre, cargo, casa) VALUES %s
+        """, [(f"Vecino {i}", cargo, str(rng.randint(1, TOTAL_CASAS))) for i, cargo in
+              enumerate(['Presidente', 'Vicepresidente', 'Tesorero', 'Secretario',
+                         'Vocal', 'Vocal', 'Fiscal'], start=1)])
+        psycopg2.extras.execute_values(cur, """
+            INSERT INTO requerimientos (descripcion, prioridad, estado) VALUES %s
+        """, [(f"Requerimiento {i}", rng.randint(1, 5), rng.choice(['pendiente', 'en curso', 'resuelto']))
+              for i in range(40)])
+        psycopg2.extras.execute_values(cur, """
+            INSERT INTO sugerencias (texto, fecha) VALUES %s
+        """, [(f"Sugerencia {i}", datetime(a, m, rng.randint(1, 28), rng.randint(0, 23)))
+              for i, (a, m) in enumerate(rng.choice(meses) for _ in range(300))],
+            page_size=1000)
+
+        reconstruir_saldos(cur)
+        reconstruir_cuotas(cur)
+        conn.commit()
+    finally:
+        release_conn(conn)
+    invalidar('pagos', 'gastos', 'cuotas', 'minutas', 'comite', 'requerimientos', 'sugerencias')
+    print(f"Sembrados {len(pagos)} pagos, {len(cuotas)} cuotas y {len(meses) * 8} gastos "
+          f"({anios} años, semilla {semilla}).")
+
+
+def _percentil(ordenados, p):
+    # Rango más cercano: el menor valor con al menos p% de las muestras debajo
+    if not ordenados:
+        return None
+    return ordenados[max(0, -(-len(ordenados) * p // 100) - 1)]
+
+
+def _cuerpo_pago_bench(rng, limite):
+    limite = limite.encode()
+    partes = []
+    for campo, valor in (('casa', str(rng.randint(1, TOTAL_CASAS))),
+                         ('monto', str(CUOTA_MENSUAL_BENCH)), ('cuota_id', ''),
+                         ('notas', 'bench')):
+        partes.append(b'--' + limite + b'\r\nContent-Disposition: form-data; name="'
+                      + campo.encode() + b'"\r\n\r\n' + valor.encode() + b'\r\n')
+    partes.append(b'--' + limite + b'\r\nContent-Disposition: form-data; name="comprobante"; '
+                  b'filename="bench.pdf"\r\nContent-Type: application/pdf\r\n\r\n'
+                  + b'%PDF-1.4\n' + bytes(rng.getrandbits(8) for _ in range(20000)) + b'\r\n')
+    partes.append(b'--' + limite + b'--\r\n')
+    return b''.join(partes)
+
+
+def _correr_escenario(host, puerto, metodo, ruta, esperado, cookie, peticiones, concurrencia,
+                      semilla, cuotas):
+    import http.client
+    import random
+    from collections import Counter
+
+    latencias = []
+    errores = Counter()
+    lock = threading.Lock()
+    pendientes = iter(range(peticiones))
+
+    def cliente(numero):
+        rng = random.Random(semilla * 1000 + numero)
+        conexion = http.client.HTTPConnection(host, puerto, timeout=60)
+        while True:
+            with lock:
+                if next(pendientes, None) is None:
+                    break
+            destino = ruta.format(casa=rng.randint(1, TOTAL_CASAS),
+                                  cuota=rng.choice(cuotas) if cuotas else 1)
+            cabeceras = {'Cookie': cookie} if cookie else {}
+            cuerpo = None
+            if metodo == 'POST':
+                limite = uuid.uuid4().hex
+                cuerpo = _cuerpo_pago_bench(rng, limite)
+                cabeceras['Content-Type'] = f'multipart/form-data; boundary={limite}'
+            inicio = time.perf_counter()
+            try:
+                conexion.request(metodo, destino, body=cuerpo, headers=cabeceras)
+                resp = conexion.getresponse()
+                resp.read()
+                estado = resp.status
+            except (OSError, http.client.HTTPException) as e:
+                conexion.close()
+                estado = type(e).__name__
+            ms = (time.perf_counter() - inicio) * 1000
+            with lock:
+                if estado == esperado:
+                    latencias.append(ms)
+                else:
+                    errores[str(estado)] += 1
+        conexion.close()
+
+    inicio = time.perf_counter()
+    hilos = [threading.Thread(target=cliente, args=(i,)) for i in range(concurrencia)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    duracion = time.perf_counter() - inicio
+
+    latencias.sort()
+    return {
+        'ruta': ruta,
+        'metodo': metodo,
+        'peticiones': peticiones,
+        'errores': sum(errores.values()),
+        'errores_por_estado': dict(errores),
+        'p50_ms': _percentil(latencias, 50),
+        'p95_ms': _percentil(latencias, 95),
+        'p99_ms': _percentil(latencias, 99),
+        'max_ms': latencias[-1] if latencias else None,
+        'rps': round(len(latencias) / duracion, 1) if duracion else None,
+    }
+
+
+def _commit_actual():
+    import subprocess
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'desconocido'
+
+
+@app.cli.command('bench-carga')
+@click.option('-n', 'peticiones', default=300, help='Peticiones por escenario.')
+@click.option('-c', 'concurrencia', default=8, help='Clientes concurrentes.')
+@click.option('--escenario', 'escenarios', multiple=True,
+              type=click.Choice(list(ESCENARIOS_BENCH)), help='Limitar a estos escenarios.')
+@click.option('--url', default=None, help='Servidor ya levantado (p. ej. gunicorn).')
+@click.option('--semilla', default=1, help='Semilla de casas y cuotas pedidas.')
+@click.option('--salida', default=None, help='Archivo JSON de resultados.')
+@click.option('--comparar', default=None, help='JSON de una corrida anterior.')
+def bench_carga_command(peticiones, concurrencia, escenarios, url, semilla, salida, comparar):
+    """Prueba de carga: p50/p95/p99 y throughput por escenario, en JSON."""
+    from urllib.parse import urlsplit
+
+    cuotas = [c['id'] for c in consultar("SELECT id FROM cuotas WHERE activa ORDER BY id")]
+    datos = consultar("""
+        SELECT (SELECT count(*) FROM pagos) AS pagos, (SELECT count(*) FROM cuotas) AS cuotas,
+               (SELECT count(*) FROM gastos) AS gastos
+    """)[0]
+
+    # Misma clave secreta que la app: la cookie sirve también contra --url
+    admin = consultar(
+        "SELECT usuario, rol, password_hash FROM usuarios WHERE rol='admin' ORDER BY id LIMIT 1")[0]
+    sesion = app.session_interface.get_signing_serializer(app).dumps(datos_sesion(admin))
+    cookie = f"{app.config['SESSION_COOKIE_NAME']}={sesion}"
+
+    servidor = None
+    if url:
+        partes = urlsplit(url)
+        host, puerto = partes.hostname, partes.port or 80
+    else:
+        import logging
+        from werkzeug.serving import make_server
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        barriada._almacen = AlmacenLocal(os.path.join(BENCH_DIR, 'almacen'))
+        servidor = make_server('127.0.0.1', 0, app, threaded=True)
+        host, puerto = '127.0.0.1', servidor.server_port
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+
+    resultados = {}
+    try:
+        print(f"{'escenario':22} {'p50':>8} {'p95':>8} {'p99':>8} {'rps':>8} {'err':>5}")
+        for nombre in escenarios or ESCENARIOS_BENCH:
+            metodo, ruta, admin, esperado = ESCENARIOS_BENCH[nombre]
+            cookie_escenario = cookie if admin else None
+            # Una ronda de calentamiento llena cachés y el pool
+            _correr_escenario(host, puerto, metodo, ruta, esperado, cookie_escenario,
+                              concurrencia, concurrencia, semilla + 1, cuotas)
+            r = _correr_escenario(host, puerto, metodo, ruta, esperado, cookie_escenario,
+                                  peticiones, concurrencia, semilla, cuotas)
+            resultados[nombre] = r
+            print(f"{nombre:22} {r['p50_ms'] or 0:8.2f} {r['p95_ms'] or 0:8.2f} "
+                  f"{r['p99_ms'] or 0:8.2f} {r['rps'] or 0:8.1f} {r['errores']:5}")
+            if r['errores']:
+                print(f"{'':22} estados inesperados (se esperaba {esperado}): "
+                      f"{r['errores_por_estado']}")
+    finally:
+        if servidor is not None:
+            servidor.shutdown()
+
+    commit = _commit_actual()
+    informe = {
+        'commit': commit,
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'servidor': url or 'werkzeug local',
+        'peticiones': peticiones,
+        'concurrencia': concurrencia,
+        'semilla': semilla,
+        'datos': dict(datos),
+        'escenarios': resultados,
+    }
+    if salida is None:
+        os.makedirs(BENCH_DIR, exist_ok=True)
+        salida = os.path.join(BENCH_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{commit}.json")
+    with open(salida, 'w') as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+    print(f"Resultados en {salida}")
+
+    if comparar:
+        with open(comparar) as f:
+            anterior = json.load(f)
+        _comparar_bench(anterior, 'escenarios', resultados, ('p50_ms', 'p95_ms', 'p99_ms', 'rps'))
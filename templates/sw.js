@@ -0,0 +1,74 @@
+// Generado por /sw.js: cambia con cada despliegue
+const ESTRUCTURA = 'estructura-{{ version }}';
+const PAGINAS = 'paginas';
+const PRECARGA = {{ precarga|tojson }};
+const OFFLINE = {{ paginas|tojson }};
+
+self.addEventListener('install', event => {
+  event.waitUntil((async () => {
+    const estructura = await caches.open(ESTRUCTURA);
+    await estructura.addAll(PRECARGA);
+    // Las páginas se dejan listas para verlas sin conexión
+    const paginas = await caches.open(PAGINAS);
+    await Promise.all(OFFLINE.map(ruta => guardar(paginas, new Request(ruta)).catch(() => {})));
+    await self.skipWaiting();
+  })());
+});
+
+self.addEventListener('activate', event => {
+  event.waitUntil((async () => {
+    for (const nombre of await caches.keys()) {
+      if (nombre !== ESTRUCTURA && nombre !== PAGINAS) await caches.delete(nombre);
+    }
+    await self.clients.claim();
+  })());
+});
+
+self.addEventListener('fetch', event => {
+  const url = new URL(event.request.url);
+  if (url.origin !== self.location.origin) return;
+
+  // Al entrar o salir del admin las copias dejan de corresponder
+  if (url.pathname === '/login' || url.pathname === '/logout') {
+    event.waitUntil(caches.delete(PAGINAS));
+    return;
+  }
+  if (event.request.method !== 'GET') return;
+
+  if (OFFLINE.includes(url.pathname) && !url.search) {
+    event.respondWith(desdeCache(event));
+  } else if (PRECARGA.includes(url.pathname) && !url.search) {
+    event.respondWith(
+      caches.match(event.request).then(resp => resp || fetch(event.request))
+    );
+  }
+});
+
+async function guardar(cache, request) {
+  const resp = await fetch(request);
+  // Sólo las respuestas públicas traen versión; las del admin no se guardan
+  if (resp.ok && resp.headers.has('X-Version-Datos')) {
+    await cache.put(request, resp.clone());
+  }
+  return resp;
+}
+
+async function revalidar(cache, request, copia) {
+  if (copia) {
+    const versiones = await fetch('/api/version', {cache: 'no-store'}).then(r => r.json());
+    const ruta = new URL(request.url).pathname;
+    if (versiones[ruta] === copia.headers.get('X-Version-Datos')) return copia;
+  }
+  return guardar(cache, request);
+}
+
+async function desdeCache(event) {
+  const cache = await caches.open(PAGINAS);
+  const copia = await cache.match(event.request);
+  const actualizada = revalidar(cache, event.request, copia);
+  if (copia) {
+    event.waitUntil(actualizada.catch(() => {}));
+    return copia;
+  }
+  return actualizada.catch(() => caches.match('/'));
+}
@@ -0,0 +1,121 @@
+"""Fixtures comunes de las pruebas.
+
+Las pruebas corren contra un Postgres real. DATABASE_URL debe apuntar a
+una base cuyo nombre termine en _test, porque cada prueba la vacía; sin
+DATABASE_URL se saltan.
+
+    DATABASE_URL=postgresql://localhost/barriada_test python -m pytest tests
+"""
+import io
+import os
+import sys
+import tempfile
+
+import pytest
+
+# app.py lee la configuración al importarse: directorios propios de la
+# corrida, almacenamiento en memoria y un argon2 barato
+_DIR = tempfile.mkdtemp(prefix="barriada-pruebas-")
+os.environ.update({
+    'SECRET_KEY': 'pruebas',
+    'STORAGE_BACKEND': 'memoria',
+    'CACHE_DIR': os.path.join(_DIR, 'cache'),
+    'EXPORT_DIR': os.path.join(_DIR, 'exportes'),
+    'IMPORT_DIR': os.path.join(_DIR, 'importes'),
+    'UPLOAD_SPOOL_DIR': os.path.join(_DIR, 'subidas'),
+    'ARCHIVOS_CACHE_DIR': os.path.join(_DIR, 'archivos'),
+    'JINJA_CACHE_DIR': os.path.join(_DIR, 'jinja'),
+    'BENCH_DIR': os.path.join(_DIR, 'bench'),
+    'ARGON2_TIEMPO': '1',
+    'ARGON2_MEMORIA_KB': '8192',
+})
+for variable in ('CACHE_REDIS_URL', 'METRICS_TOKEN', 'MIGRAR_AL_INICIAR'):
+    os.environ.pop(variable, None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+TABLAS_DATOS = ('pagos', 'gastos', 'cuotas', 'minutas', 'comite', 'requerimientos',
+                'sugerencias', 'subidas_pendientes', 'archivos', 'usuarios')
+
+
+@pytest.fixture(scope='session')
+def base():
+    """El módulo app con el esquema migrado."""
+    if not app.DATABASE_URL:
+        pytest.skip("DATABASE_URL no definida")
+    nombre = app.consultar("SELECT current_database() AS base")[0]['base']
+    if not nombre.endswith('_test'):
+        pytest.skip(f"La base '{nombre}' no es de pruebas (debe terminar en _test)")
+    app.migrar()
+    return app
+
+
+@pytest.fixture
+def limpia(base):
+    """Base vacía, con saldos en cero y solo el usuario admin/admin123."""
+    cur, conn = base.get_cursor()
+    try:
+        cur.execute(f"TRUNCATE {', '.join(TABLAS_DATOS)} RESTART IDENTITY CASCADE")
+        base.reconstruir_saldos(cur)
+        base.reconstruir_cuotas(cur)
+        conn.commit()
+    finally:
+        base.release_conn(conn)
+    base.invalidar(*TABLAS_DATOS)
+    base.crear_admin_si_no_existe()
+    base.intentos_ip.cubetas.clear()
+    base.fallos_login.cubetas.clear()
+    return base
+
+
+@pytest.fixture
+def sql(limpia):
+    """Ejecuta SQL en su propia transacción e invalida las cachés."""
+    def ejecutar(consulta, params=()):
+        cur, conn = limpia.get_cursor()
+        try:
+            cur.execute(consulta, params)
+            filas = cur.fetchall() if cur.description else None
+            conn.commit()
+        finally:
+            limpia.release_conn(conn)
+        limpia.invalidar(*TABLAS_DATOS)
+        return filas
+    return ejecutar
+
+
+@pytest.fixture
+def cliente(limpia):
+    return limpia.app.test_client()
+
+
+@pytest.fixture
+def admin(limpia):
+    """Cliente con la sesión del admin, armada como la arma el login."""
+    cliente = limpia.app.test_client()
+    fila = limpia.consultar(
+        "SELECT usuario, rol, password_hash FROM usuarios WHERE usuario = 'admin'")[0]
+    with cliente.session_transaction() as sesion:
+        sesion.update(limpia.datos_sesion(fila))
+    return cliente
+
+
+@pytest.fixture
+def pagar(admin):
+    """Registra un pago por /admin/pago, como el formulario del admin."""
+    def registrar(casa, monto, cuota_id='', comprobante=b'', nombre=''):
+        return admin.post('/admin/pago', data={
+            'casa': casa, 'monto': monto, 'cuota_id': cuota_id, 'notas': '',
+            'comprobante': (io.BytesIO(comprobante), nombre),
+        }, content_type='multipart/form-data')
+    return registrar
+
+
+@pytest.fixture
+def subidas(limpia, monkeypatch):
+    """Almacén en memoria nuevo y la cola de subidas procesada a mano, sin hilos."""
+    monkeypatch.setattr(limpia, '_almacen', limpia.AlmacenMemoria())
+    monkeypatch.setattr(limpia, 'encolar_subidas', lambda: None)
+    return limpia
@@ -0,0 +1,39 @@
+import hashlib
+
+
+def test_mismo_contenido_se_sube_una_vez(subidas, pagar, sql, monkeypatch):
+    contenido = b'constancia de transferencia 0001'
+    nombre = f"pagos/{hashlib.sha256(contenido).hexdigest()}.txt"
+    subidos = []
+    subir = subidas._almacen.subir
+    monkeypatch.setattr(subidas._almacen, 'subir',
+                        lambda ruta, n, mime: subidos.append(n) or subir(ruta, n, mime))
+
+    pagar('3', '10', comprobante=contenido, nombre='Constancia.TXT')
+    assert sql("SELECT comprobante FROM pagos")[0]['comprobante'] is None
+    subidas.procesar_subidas()
+    assert sql("SELECT comprobante FROM pagos")[0]['comprobante'] == f'/files/{nombre}'
+    assert subidas._almacen.objetos[nombre] == contenido
+    assert sql("SELECT nombre, bytes, backend FROM archivos") == [
+        {'nombre': nombre, 'bytes': len(contenido), 'backend': 'memoria'}]
+
+    # El reenvío queda enlazado al registrarse, sin pasar por la cola
+    pagar('4', '10', comprobante=contenido, nombre='otra.txt')
+    assert sql("SELECT comprobante FROM pagos WHERE casa = '4'")[0]['comprobante'] == f'/files/{nombre}'
+    assert sql("SELECT count(*) AS n FROM subidas_pendientes")[0]['n'] == 0
+    assert subidos == [nombre]
+
+
+def test_almacen_local_escribe_una_vez(tmp_path):
+    import app
+    almacen = app.AlmacenLocal(str(tmp_path / 'almacen'))
+    origen = tmp_path / 'origen'
+    origen.write_bytes(b'uno')
+    assert almacen.subir(str(origen), 'pagos/abc.pdf', 'application/pdf') == 'local://pagos/abc.pdf'
+    # Nombre por contenido: si ya existe no se reescribe
+    origen.write_bytes(b'dos')
+    almacen.subir(str(origen), 'pagos/abc.pdf', 'application/pdf')
+    with almacen.abrir('pagos/abc.pdf') as f:
+        assert f.read() == b'uno'
+    assert not list((tmp_path / 'almacen' / 'pagos').glob('*.tmp'))
+
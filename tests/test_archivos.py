@@ -0,0 +1,67 @@
+import hashlib
+import os
+
+import pytest
+
+
+@pytest.fixture
+def guardar(limpia, sql, tmp_path):
+    """Sube bytes al almacenamiento en memoria y los registra en archivos."""
+    def subir(contenido, carpeta='pagos', ext='pdf', url=None):
+        nombre = f"{carpeta}/{hashlib.sha256(contenido).hexdigest()}.{ext}"
+        ruta = tmp_path / 'origen'
+        ruta.write_bytes(contenido)
+        url = url or limpia.subir_archivo(str(ruta), nombre, 'application/pdf')
+        sql("INSERT INTO archivos (nombre, url, backend) VALUES (%s, %s, 'memoria')", (nombre, url))
+        return nombre
+    return subir
+
+
+def test_sirve_desde_el_almacen_y_despues_del_disco(limpia, cliente, guardar):
+    contenido = b'%PDF-1.4 ' + os.urandom(64)
+    nombre = guardar(contenido)
+    antes = limpia.cache_archivos.stats()
+
+    r = cliente.get(f'/files/{nombre}')
+    assert r.status_code == 200 and r.data == contenido
+    assert r.mimetype == 'application/pdf'
+    assert r.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert cliente.get(f'/files/{nombre}').data == contenido
+
+    despues = limpia.cache_archivos.stats()
+    assert despues['misses'] == antes['misses'] + 1
+    assert despues['hits'] == antes['hits'] + 1
+
+
+def test_condicional_y_rangos(cliente, guardar):
+    contenido = b'%PDF-1.4 ' + os.urandom(64)
+    nombre = guardar(contenido)
+    r = cliente.get(f'/files/{nombre}')
+
+    assert cliente.get(f'/files/{nombre}',
+                       headers={'If-None-Match': r.headers['ETag']}).status_code == 304
+    r = cliente.get(f'/files/{nombre}', headers={'Range': 'bytes=0-7'})
+    assert r.status_code == 206 and r.data == contenido[:8]
+
+
+def test_nombres_invalidos_o_desconocidos(cliente):
+    desconocido = f"pagos/{'a' * 64}.pdf"
+    for ruta in ('/files/pagos/../../app.py', '/files/archivo.pdf', f'/files/{desconocido}'):
+        assert cliente.get(ruta).status_code == 404
+
+
+def test_expulsa_lo_menos_usado_y_vuelve_a_bajar(limpia, cliente, guardar, tmp_path, monkeypatch):
+    monkeypatch.setattr(limpia, 'cache_archivos', limpia.CacheDisco(str(tmp_path / 'cache'), 100))
+    primero = guardar(b'1' * 80)
+    segundo = guardar(b'2' * 80)
+
+    assert cliente.get(f'/files/{primero}').status_code == 200
+    assert cliente.get(f'/files/{segundo}').status_code == 200
+    assert limpia.cache_archivos.stats()['evictions'] == 1
+    assert cliente.get(f'/files/{primero}').data == b'1' * 80
+    assert limpia.cache_archivos.stats()['misses'] == 3
+
+
+def test_origen_caido_da_502(cliente, guardar):
+    nombre = guardar(os.urandom(32), url='http://127.0.0.1:9/no-hay-nada')
+    assert cliente.get(f'/files/{nombre}').status_code == 502
@@ -0,0 +1,57 @@
+def resultados(cliente, q, limite=50):
+    """Todas las páginas de /api/buscar siguiendo el cursor."""
+    paginas = []
+    token = None
+    while True:
+        consulta = {'q': q, 'limite': limite, **({'before': token} if token else {})}
+        datos = cliente.get('/api/buscar', query_string=consulta).get_json()
+        paginas.append(datos['items'])
+        token = datos['siguiente']
+        if token is None:
+            return paginas
+
+
+def test_titulo_pesa_mas_que_el_resumen(cliente, sql):
+    sql("""
+        INSERT INTO minutas (titulo, resumen, fecha) VALUES
+            ('Asamblea ordinaria', 'Se habló del corte de agua', '2026-01-10'),
+            ('Corte de agua', 'Avisos varios', '2026-01-05'),
+            ('Presupuesto', 'Nada que ver', '2026-01-12')
+    """)
+    items = resultados(cliente, 'agua')[0]
+    assert [i['titulo'] for i in items] == ['Corte de agua', 'Asamblea ordinaria']
+    assert items[0]['rango'] > items[1]['rango']
+
+
+def test_sin_acentos_y_con_resaltado_escapado(cliente, sql):
+    sql("INSERT INTO sugerencias (texto, fecha) VALUES ('Reunión: 5 < 7 & vecinos', now())")
+    item, = resultados(cliente, 'reunion')[0]
+    assert item['tipo'] == 'sugerencia'
+    assert item['extracto'] == '<mark>Reunión</mark>: 5 &lt; 7 &amp; vecinos'
+
+
+def test_cursor_recorre_empates_sin_repetir(cliente, sql):
+    sql("INSERT INTO sugerencias (texto, fecha) SELECT 'Poda de árboles', now() FROM generate_series(1, 5)")
+    sql("INSERT INTO minutas (titulo, fecha) VALUES ('Poda de árboles', '2026-01-10')")
+    paginas = resultados(cliente, 'poda', limite=2)
+
+    assert [len(p) for p in paginas] == [2, 2, 2]
+    vistos = [(i['tipo'], i['id']) for p in paginas for i in p]
+    assert len(set(vistos)) == 6
+    # El título (peso A) va primero; los empates, por tipo e id descendentes
+    assert vistos == [('minuta', 1)] + [('sugerencia', n) for n in (5, 4, 3, 2, 1)]
+
+
+def test_pagos_solo_para_el_admin(cliente, admin, sql):
+    sql("INSERT INTO pagos (casa, monto, fecha, notas) VALUES ('4', 10, '2026-01-10', 'Transferencia bancaria')")
+    assert resultados(cliente, 'transferencia') == [[]]
+    item, = resultados(admin, 'transferencia')[0]
+    assert item['tipo'] == 'pago' and item['titulo'].startswith('Casa 4')
+
+
+def test_token_invalido_da_400(limpia, cliente):
+    import base64
+    for crudo in (b'x', b'0.1|pago|1|2', b'0.1|otro|1', b'rango|minuta|1'):
+        token = base64.urlsafe_b64encode(crudo).decode()
+        r = cliente.get('/api/buscar', query_string={'q': 'agua', 'before': token})
+        assert r.status_code == 400
@@ -0,0 +1,80 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+
+class RedisEnMemoria:
+    """Lo justo de redis.Redis para version_tablas, invalidar y cache_consulta."""
+
+    def __init__(self):
+        self.datos = {}
+
+    def get(self, clave):
+        return self.datos.get(clave)
+
+    def mget(self, claves):
+        return [self.datos.get(c) for c in claves]
+
+    def set(self, clave, valor, ex=None):
+        self.datos[clave] = valor if isinstance(valor, bytes) else str(valor).encode()
+
+
+@pytest.fixture
+def contador():
+    llamadas = []
+
+    def cargar(valor):
+        def f():
+            llamadas.append(valor)
+            return valor
+        return f
+    cargar.llamadas = llamadas
+    return cargar
+
+
+def test_invalidar_solo_afecta_a_sus_tablas(limpia, contador, monkeypatch):
+    monkeypatch.setattr(limpia, 'cache_local', limpia.CacheLRU(100))
+    assert limpia.cache_consulta('prueba', ('minutas',), contador(1)) == 1
+    assert limpia.cache_consulta('prueba', ('minutas',), contador(2)) == 1
+
+    limpia.invalidar('gastos')
+    assert limpia.cache_consulta('prueba', ('minutas',), contador(3)) == 1
+    limpia.invalidar('minutas')
+    assert limpia.cache_consulta('prueba', ('minutas',), contador(4)) == 4
+    assert contador.llamadas == [1, 4]
+
+
+def test_versiones_siempre_avanzan(limpia):
+    versiones = []
+    for _ in range(20):
+        limpia.invalidar('minutas')
+        versiones.append(limpia.version_tablas(('minutas',))[0])
+    assert versiones == sorted(set(versiones))
+
+
+def test_redis_guarda_json_y_lo_comparten_los_workers(limpia, contador, monkeypatch):
+    redis = RedisEnMemoria()
+    monkeypatch.setattr(limpia, 'cache_redis', redis)
+    monkeypatch.setattr(limpia, 'cache_local', limpia.CacheLRU(100))
+    limpia.invalidar('pagos')
+    valor = {'monto': Decimal('10.50'), 'fecha': date(2026, 1, 31),
+             'hora': datetime(2026, 1, 31, 8, 30), 'casas': [1, 2]}
+    assert limpia.cache_consulta('prueba', ('pagos',), contador(valor)) == valor
+
+    crudo, = [v for c, v in redis.datos.items() if c.startswith('barriada:cache-json:')]
+    assert json.loads(crudo)['monto'] == {'__decimal__': '10.50'}
+
+    # Otro worker: caché local vacía, mismo Redis
+    monkeypatch.setattr(limpia, 'cache_local', limpia.CacheLRU(100))
+    assert limpia.cache_consulta('prueba', ('pagos',), contador('no')) == valor
+    assert contador.llamadas == [valor]
+
+
+def test_valor_no_serializable_no_rompe(limpia, contador, monkeypatch, capsys):
+    monkeypatch.setattr(limpia, 'cache_redis', RedisEnMemoria())
+    monkeypatch.setattr(limpia, 'cache_local', limpia.CacheLRU(100))
+    valor = {'conjunto': {1, 2}}
+    assert limpia.cache_consulta('prueba', ('pagos',), contador(valor)) is valor
+    assert 'no se puede guardar en la caché' in capsys.readouterr().out
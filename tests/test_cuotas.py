@@ -0,0 +1,90 @@
+import threading
+
+
+def crear_cuota(admin, descripcion, monto, vence):
+    return admin.post('/admin/cuotas', data={
+        'descripcion': descripcion, 'monto': monto, 'fecha_vencimiento': vence,
+    })
+
+
+def materializado(sql):
+    return ([dict(f) for f in sql("SELECT * FROM cuota_casa ORDER BY cuota_id, casa")],
+            [dict(f) for f in sql("SELECT * FROM cuota_resumen ORDER BY cuota_id")])
+
+
+def test_credito_se_aplica_por_vencimiento(admin, cliente, pagar):
+    crear_cuota(admin, 'Enero', '10', '2026-01-31')
+    crear_cuota(admin, 'Febrero', '15', '2026-02-28')
+    # Sin cuota_id el pago cubre primero la que vence antes
+    pagar('3', '12')
+
+    d = cliente.get('/api/estado-casa/3').get_json()
+    assert d['total_pagado'] == 12 and d['total_cuotas'] == 25 and d['total_debe'] == 13
+    assert [(c['descripcion'], c['aplicado']) for c in d['cuotas_pendientes']] == [('Febrero', 2)]
+
+    d = cliente.get('/api/estado-casa/4').get_json()
+    assert d['total_debe'] == 25 and len(d['cuotas_pendientes']) == 2
+    # Fuera de 1..250 no hay conciliación: debe todo
+    assert cliente.get('/api/estado-casa/999').get_json()['total_debe'] == 25
+
+
+def test_incremental_igual_a_reconstruir(admin, sql, limpia, pagar):
+    crear_cuota(admin, 'Enero', '10', '2026-01-31')
+    crear_cuota(admin, 'Febrero', '15', '2026-02-28')
+    for casa, monto, cuota in [('1', '10', '1'), ('1', '15', '2'), ('2', '5', '1'),
+                               ('2', '30', ''), ('7', '4', '2'), ('250', '25', '')]:
+        assert pagar(casa, monto, cuota).status_code == 302
+    admin.post('/admin/delete/pago/3')
+    antes = materializado(sql)
+
+    cur, conn = limpia.get_cursor()
+    try:
+        limpia.bloquear_cuotas(cur)
+        limpia.reconstruir_cuotas(cur)
+        conn.commit()
+    finally:
+        limpia.release_conn(conn)
+    assert materializado(sql) == antes
+
+    resumen = {f['cuota_id']: f for f in antes[1]}
+    assert (resumen[1]['pagadas'], resumen[1]['parciales'], resumen[1]['pendientes']) == (3, 0, 247)
+    assert (resumen[2]['pagadas'], resumen[2]['parciales'], resumen[2]['pendientes']) == (3, 1, 246)
+
+
+def test_casa_con_ceros_cuenta_para_su_casa(admin, cliente, sql, pagar):
+    crear_cuota(admin, 'Enero', '10', '2026-01-31')
+    pagar('07', '10')
+
+    assert sql("SELECT casa FROM pagos")[0]['casa'] == '7'
+    d = cliente.get('/api/estado-casas').get_json()
+    assert d['pagado'][6] == 10 and d['pendientes'][6] == []
+    assert cliente.get('/api/estado-casa/7').get_json()['total_debe'] == 0
+
+
+def test_cuotas_simultaneas_no_se_bloquean(admin, limpia, sql):
+    cookie = admin.get_cookie(limpia.app.config['SESSION_COOKIE_NAME']).value
+    estados = []
+
+    def crear(n):
+        c = limpia.app.test_client()
+        c.set_cookie(limpia.app.config['SESSION_COOKIE_NAME'], cookie)
+        r = crear_cuota(c, f'Cuota {n}', '5', f'2026-03-{n + 1:02d}')
+        estados.append(r.status_code)
+
+    hilos = [threading.Thread(target=crear, args=(n,)) for n in range(8)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    assert estados == [302] * 8
+    assert sql("SELECT count(*) AS n, min(pendientes) AS p FROM cuota_resumen")[0] == {'n': 8, 'p': 250}
+
+
+def test_pagar_cuota_inexistente(admin, sql):
+    crear_cuota(admin, 'Enero', '10', '2026-01-31')
+    admin.post('/admin/delete/cuota/1')
+    for cuota_id in (1, 99):
+        r = admin.post(f'/admin/cuota/{cuota_id}/pagar', data={'casa': '3', 'monto': '10'})
+        assert r.status_code == 404
+    assert sql("SELECT count(*) AS n FROM pagos")[0]['n'] == 0
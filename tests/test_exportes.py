@@ -0,0 +1,101 @@
+import io
+import os
+
+import openpyxl
+import pytest
+
+
+@pytest.fixture
+def sin_exportes(limpia, monkeypatch, tmp_path):
+    """Sin regeneración en segundo plano y con EXPORT_DIR vacío."""
+    if limpia._ejecutor_exportes is not None:
+        limpia._ejecutor_exportes.submit(lambda: None).result()
+    monkeypatch.setattr(limpia, 'programar_exportes', lambda: None)
+    monkeypatch.setattr(limpia, 'EXPORT_DIR', str(tmp_path))
+    return limpia
+
+
+def leer_xlsx(contenido):
+    libro = openpyxl.load_workbook(io.BytesIO(contenido), read_only=True)
+    return {hoja.title: [list(f) for f in hoja.iter_rows(values_only=True)] for hoja in libro}
+
+
+def test_xlsx_por_bloques(limpia, monkeypatch):
+    monkeypatch.setattr(limpia, 'XLSX_BLOQUE', 1024)
+    azar = [os.urandom(16).hex() for _ in range(20000)]
+    filas = ([n, f"{azar[n]}\x07", n / 2] for n in range(20000))
+    bloques = list(limpia.xlsx_stream([('Datos', ['N', 'Texto', 'Mitad'], filas)]))
+
+    # Sale por partes mientras se leen las filas, no todo al final
+    assert len(bloques) > 10
+    hoja = leer_xlsx(b''.join(bloques))['Datos']
+    assert hoja[0] == ['N', 'Texto', 'Mitad']
+    assert hoja[1] == [0, azar[0], 0] and hoja[-1] == [19999, azar[-1], 9999.5]
+    assert len(hoja) == 20001
+
+
+def test_excel_sin_precalcular_sale_en_streaming(sin_exportes, cliente, sql):
+    sql("""
+        INSERT INTO pagos (casa, monto, fecha, notas) VALUES ('3', 10.5, '2026-01-10', 'Enero'), ('4', 7, '2026-01-11', NULL);
+        INSERT INTO gastos (descripcion, monto, fecha) VALUES ('Luz', 4, '2026-01-20');
+    """)
+    r = cliente.get('/estado-cuenta/excel')
+    assert r.status_code == 200 and r.is_streamed
+    assert 'estado_cuenta_general.xlsx' in r.headers['Content-Disposition']
+
+    hojas = leer_xlsx(r.get_data())
+    assert hojas['Pagos'] == [['Casa', 'Monto', 'Fecha', 'Notas', 'Comprobante'],
+                              ['4', 7, '2026-01-11', '', ''],
+                              ['3', 10.5, '2026-01-10', 'Enero', '']]
+    assert hojas['Gastos'][1] == ['Luz', 4, '2026-01-20', '']
+    assert sin_exportes.connection_pool.stats()['en_uso'] == 0
+
+
+def archivos_de(limpia, nombre):
+    base, ext = nombre.rsplit('.', 1)
+    return sorted(a for a in os.listdir(limpia.EXPORT_DIR)
+                  if a.startswith(f'{base}-') and a.endswith(f'.{ext}'))
+
+
+def test_exporte_precalculado_se_sirve_del_disco(sin_exportes, cliente, sql):
+    sql("INSERT INTO pagos (casa, monto, fecha) VALUES ('3', 10, '2026-01-10')")
+    sin_exportes.regenerar_exportes()
+    version = sin_exportes.version_exportes()
+
+    r = cliente.get('/estado-cuenta/export/pagos.csv')
+    assert r.status_code == 200 and r.content_length == len(r.data)
+    assert r.headers['ETag'] == f'"pagos.csv-{version}"'
+    assert r.data.decode('utf-8-sig').splitlines() == [
+        'Casa,Monto,Fecha,Notas,Comprobante', '3,10.0,2026-01-10,,']
+
+    assert cliente.get('/estado-cuenta/export/pagos.csv',
+                       headers={'If-None-Match': r.headers['ETag']}).status_code == 304
+    r = cliente.get('/estado-cuenta/export/pagos.csv', headers={'Range': 'bytes=0-2'})
+    assert r.status_code == 206 and r.data == '﻿'.encode()
+
+
+def test_csv_faltante_se_genera_al_pedirlo(sin_exportes, cliente, sql):
+    sql("INSERT INTO gastos (descripcion, monto, fecha) VALUES ('Luz', 4, '2026-01-20')")
+    assert archivos_de(sin_exportes, 'gastos.csv') == []
+    r = cliente.get('/estado-cuenta/export/gastos.csv')
+    assert r.status_code == 200 and 'Luz' in r.data.decode('utf-8-sig')
+    assert archivos_de(sin_exportes, 'gastos.csv') == [
+        f'gastos-{sin_exportes.version_exportes()}.csv']
+
+
+def test_se_conserva_solo_la_version_anterior(sin_exportes, sql):
+    versiones = []
+    for n in range(3):
+        sql("INSERT INTO pagos (casa, monto, fecha) VALUES ('3', %s, '2026-01-10')", (n + 1,))
+        sin_exportes.regenerar_exportes()
+        versiones.append(sin_exportes.version_exportes())
+
+    for nombre in sin_exportes.EXPORTES:
+        base, ext = nombre.rsplit('.', 1)
+        assert archivos_de(sin_exportes, nombre) == sorted(
+            f'{base}-{v}.{ext}' for v in versiones[1:])
+
+
+def test_exporte_desconocido(cliente):
+    for nombre in ('otro.csv', 'app.py', '..%2Fapp.py'):
+        assert cliente.get(f'/estado-cuenta/export/{nombre}').status_code == 404
@@ -0,0 +1,78 @@
+import io
+import re
+from datetime import datetime
+from decimal import Decimal
+
+
+def subir(admin, contenido, nombre='pagos.csv'):
+    if isinstance(contenido, str):
+        contenido = contenido.encode()
+    return admin.post('/admin/pagos/importar', data={'archivo': (io.BytesIO(contenido), nombre)},
+                      content_type='multipart/form-data')
+
+
+def token_de(respuesta):
+    return re.search(r'name="token" value="([0-9a-f]{32})"', respuesta.get_data(as_text=True))[1]
+
+
+def test_vista_previa_no_escribe(admin, sql):
+    sql("INSERT INTO pagos (casa, monto, fecha) VALUES ('2', 5, '2026-03-01')")
+    r = subir(admin, "casa;monto;fecha\n1;10,50;01/03/2026\n2;5;2026-03-01\n1;10.50;2026-03-01\n"
+                     "300;5;2026-03-01\n4;x;2026-03-01\n")
+    html = r.get_data(as_text=True)
+    assert r.status_code == 200
+    assert '1 nuevos' in html and '2 duplicados' in html
+    assert 'casa inválida (300)' in html and 'monto inválido (x)' in html
+    assert sql("SELECT count(*) AS n FROM pagos")[0]['n'] == 1
+
+
+def test_confirmar_inserta_y_actualiza_saldos(admin, sql, cliente):
+    import openpyxl
+    libro = openpyxl.Workbook()
+    hoja = libro.active
+    hoja.append(['Casa', 'Monto', 'Fecha', 'Notas'])
+    hoja.append([8, 7.5, datetime(2026, 3, 1), 'Transferencia'])
+    hoja.append([9.0, 12, '02/03/2026', None])
+    datos = io.BytesIO()
+    libro.save(datos)
+
+    token = token_de(subir(admin, datos.getvalue(), 'pagos.xlsx'))
+    r = admin.post('/admin/pagos/importar', data={'token': token})
+    assert r.status_code == 200
+    filas = sql("SELECT casa, monto, notas FROM pagos ORDER BY casa")
+    assert [(f['casa'], f['monto'], f['notas']) for f in filas] == [
+        ('8', Decimal('7.5'), 'Transferencia'), ('9', Decimal('12'), None)]
+    assert sql("SELECT ingresos FROM totales_finanzas")[0]['ingresos'] == Decimal('19.5')
+    assert cliente.get('/api/estado-casas').get_json()['pagado'][7] == 7.5
+
+
+def test_duplicados_solo_si_se_piden(admin, sql):
+    sql("INSERT INTO pagos (casa, monto, fecha) VALUES ('3', 5, '2026-03-01')")
+    contenido = "casa,monto,fecha\n3,5,2026-03-01\n4,5,2026-03-01\n"
+
+    admin.post('/admin/pagos/importar', data={'token': token_de(subir(admin, contenido))})
+    assert sql("SELECT count(*) AS n FROM pagos")[0]['n'] == 2
+
+    admin.post('/admin/pagos/importar', data={'token': token_de(subir(admin, contenido)),
+                                              'incluir_duplicados': '1'})
+    assert sql("SELECT count(*) AS n FROM pagos")[0]['n'] == 4
+
+
+def test_token_se_confirma_una_sola_vez(admin, sql):
+    token = token_de(subir(admin, "casa,monto,fecha\n5,10,2026-03-01\n"))
+    assert admin.post('/admin/pagos/importar', data={'token': token}).status_code == 200
+
+    r = admin.post('/admin/pagos/importar', data={'token': token})
+    assert r.status_code == 200 and 'Esta importación ya se confirmó' in r.get_data(as_text=True)
+    assert sql("SELECT count(*) AS n FROM pagos")[0]['n'] == 1
+
+
+def test_token_desconocido(admin):
+    for token in ('0' * 32, '../../etc/passwd'):
+        r = admin.post('/admin/pagos/importar', data={'token': token})
+        assert 'La vista previa expiró' in r.get_data(as_text=True)
+
+
+def test_importar_requiere_admin(cliente):
+    r = subir(cliente, "casa,monto,fecha\n5,10,2026-03-01\n")
+    assert r.status_code == 302 and r.headers['Location'].endswith('/login')
@@ -0,0 +1,95 @@
+import pytest
+
+
+def entrar(cliente, usuario, password, ip='10.0.0.1'):
+    return cliente.post('/login', data={'usuario': usuario, 'password': password},
+                        environ_base={'REMOTE_ADDR': ip})
+
+
+@pytest.fixture
+def vecino(limpia, sql):
+    sql("INSERT INTO usuarios (usuario, password_hash, rol) VALUES ('vecino', %s, 'vecino')",
+        (limpia.hasher.hash('clave7'),))
+
+
+def test_login_correcto_e_incorrecto(cliente, vecino):
+    r = entrar(cliente, 'vecino', 'otra')
+    assert r.status_code == 200 and 'Usuario o contraseña incorrectos' in r.get_data(as_text=True)
+    assert entrar(cliente, 'nadie', 'clave7').status_code == 200
+
+    r = entrar(cliente, 'vecino', 'clave7')
+    assert r.status_code == 302 and r.headers['Location'] == '/'
+    with cliente.session_transaction() as sesion:
+        assert sesion['usuario'] == 'vecino' and sesion['rol'] == 'vecino' and sesion['version']
+
+
+def test_fallos_bloquean_usuario_e_ip(limpia, cliente, vecino):
+    for _ in range(limpia.LOGIN_INTENTOS):
+        assert entrar(cliente, 'vecino', 'mal').status_code == 200
+
+    # Ni con la contraseña correcta mientras dure la espera
+    r = entrar(cliente, 'vecino', 'clave7')
+    assert r.status_code == 429 and int(r.headers['Retry-After']) > 0
+    # Otro usuario desde la misma IP y el mismo usuario desde otra IP siguen
+    assert entrar(cliente, 'admin', 'admin123').status_code == 302
+    assert entrar(cliente, 'vecino', 'clave7', ip='10.0.0.2').status_code == 302
+
+
+def test_logins_correctos_no_gastan_fichas(limpia, cliente, vecino):
+    for _ in range(limpia.LOGIN_INTENTOS + 2):
+        assert entrar(cliente, 'vecino', 'clave7').status_code == 302
+
+
+def test_tope_por_ip(limpia, cliente, vecino, monkeypatch):
+    monkeypatch.setattr(limpia, 'intentos_ip', limpia.CubetaTokens(3, 600))
+    for usuario in ('a', 'b', 'c'):
+        assert entrar(cliente, usuario, 'x').status_code == 200
+    assert entrar(cliente, 'vecino', 'clave7').status_code == 429
+    assert entrar(cliente, 'vecino', 'clave7', ip='10.0.0.2').status_code == 302
+
+
+def test_cambiar_password_cierra_sesiones(limpia, admin):
+    assert admin.get('/admin/pago').status_code == 200
+    r = limpia.app.test_cli_runner().invoke(args=['cambiar-password', 'admin'],
+                                            input='nueva123\nnueva123\n')
+    assert r.exit_code == 0, r.output
+
+    r = admin.get('/admin/pago')
+    assert r.status_code == 302 and r.headers['Location'].endswith('/login')
+    with admin.session_transaction() as sesion:
+        assert 'usuario' not in sesion
+
+
+def test_cambio_de_rol_y_baja(limpia, admin, sql):
+    sql("UPDATE usuarios SET rol = 'vecino' WHERE usuario = 'admin'")
+    assert admin.get('/admin/pago').status_code == 302
+    with admin.session_transaction() as sesion:
+        assert sesion['rol'] == 'vecino'
+
+    sql("DELETE FROM usuarios WHERE usuario = 'admin'")
+    admin.get('/')
+    with admin.session_transaction() as sesion:
+        assert 'usuario' not in sesion
+
+
+def test_usuario_creado_por_sql_sin_invalidar(limpia, cliente):
+    # El mapa en memoria queda viejo: validar_sesion debe recargarlo
+    limpia.usuarios_sesion(recargar=True)
+    cur, conn = limpia.get_cursor()
+    try:
+        cur.execute("INSERT INTO usuarios (usuario, password_hash, rol) VALUES ('nuevo', %s, 'admin')",
+                    (limpia.hasher.hash('clave'),))
+        conn.commit()
+    finally:
+        limpia.release_conn(conn)
+
+    assert entrar(cliente, 'nuevo', 'clave').status_code == 302
+    assert cliente.get('/admin/pago').status_code == 200
+
+
+def test_sin_proxy_se_ignora_x_forwarded_for(limpia, cliente, vecino, monkeypatch):
+    monkeypatch.setattr(limpia, 'intentos_ip', limpia.CubetaTokens(2, 600))
+    for ip in ('1.1.1.1', '2.2.2.2'):
+        cliente.post('/login', data={'usuario': 'x', 'password': 'x'},
+                     headers={'X-Forwarded-For': ip}, environ_base={'REMOTE_ADDR': '10.0.0.9'})
+    assert entrar(cliente, 'vecino', 'clave7', ip='10.0.0.9').status_code == 429
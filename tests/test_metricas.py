@@ -0,0 +1,22 @@
+def test_metrics_solo_para_admin_sin_token(limpia, cliente, admin):
+    assert cliente.get('/metrics').status_code == 401
+    r = admin.get('/metrics')
+    assert r.status_code == 200 and r.mimetype == 'text/plain'
+    assert 'http_requests_total' in r.get_data(as_text=True)
+
+
+def test_metrics_con_token_exige_el_token(limpia, cliente, admin, monkeypatch):
+    monkeypatch.setattr(limpia, 'METRICS_TOKEN', 'secreto')
+    assert admin.get('/metrics').status_code == 401
+    assert cliente.get('/metrics', headers={'Authorization': 'Bearer otro'}).status_code == 401
+    assert cliente.get('/metrics', headers={'Authorization': 'Bearer secreto'}).status_code == 200
+
+
+def test_server_timing_no_va_a_anonimos(limpia, cliente, admin, monkeypatch):
+    assert 'Server-Timing' not in cliente.get('/minutas').headers
+    tiempos = admin.get('/minutas').headers['Server-Timing']
+    assert [t.split(';')[0] for t in tiempos.split(', ')] == ['pool', 'db', 'render', 'total']
+
+    monkeypatch.setattr(limpia, 'METRICS_TOKEN', 'secreto')
+    r = cliente.get('/minutas', headers={'Authorization': 'Bearer secreto'})
+    assert 'Server-Timing' in r.headers
@@ -0,0 +1,116 @@
+from decimal import Decimal
+
+import psycopg2
+import pytest
+from psycopg2.extensions import make_dsn
+
+ESQUEMA = 'prueba_migraciones'
+COMPROBANTE = ('https://proyecto.supabase.co/storage/v1/object/public/docs/'
+               'pagos/0f3c2a8e-5b1d-4c6e-9f7a-2d4b6c8e0a1f.pdf?t=1')
+
+
+def _en_esquema_aparte(base, sentencia):
+    conn = psycopg2.connect(base.DATABASE_URL)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sentencia)
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def legado(base, monkeypatch):
+    """Esquema de antes de las migraciones (el de init_db) con datos cargados.
+
+    Vive en un esquema aparte: migrar() lo ve a través de un pool cuyo
+    search_path apunta solo a ese esquema.
+    """
+    _en_esquema_aparte(base, f"DROP SCHEMA IF EXISTS {ESQUEMA} CASCADE; CREATE SCHEMA {ESQUEMA}")
+    pool = base.PoolConexiones(make_dsn(base.DATABASE_URL, options=f'-c search_path={ESQUEMA}'),
+                               minconn=1, maxconn=4, timeout=5, validar_tras=60)
+    monkeypatch.setattr(base, 'connection_pool', pool)
+    monkeypatch.setattr(base, 'SUPABASE_BUCKET', 'docs')
+
+    cur, conn = base.get_cursor()
+    try:
+        cur.execute(base.MIGRACIONES[0][2])
+        cur.execute("""
+            INSERT INTO usuarios (usuario, password, rol) VALUES
+                ('admin', 'secreta', 'admin'), ('vecino', 'clave7', 'vecino');
+            INSERT INTO cuotas (descripcion, monto, fecha_vencimiento, activa) VALUES
+                ('Enero', 10, '2026-01-31', TRUE), ('Febrero', 15, '2026-02-28', TRUE),
+                ('Vieja', 99, '2020-01-31', FALSE);
+            INSERT INTO pagos (casa, monto, fecha, comprobante) VALUES
+                ('07', 10, '2026-01-05', %(comprobante)s), ('7', 15, '2026-02-03', NULL),
+                ('12', 5, '2026-01-10', NULL), ('A1', 3, '2026-01-11', NULL);
+            INSERT INTO gastos (descripcion, monto, fecha) VALUES ('luz', 4, '2026-01-20');
+            INSERT INTO minutas (titulo, resumen, fecha) VALUES
+                ('Asamblea', 'Corte de agua en la calle principal', '2026-01-15');
+        """, {'comprobante': COMPROBANTE})
+        conn.commit()
+    finally:
+        base.release_conn(conn)
+
+    yield base
+    pool.closeall()
+    _en_esquema_aparte(base, f"DROP SCHEMA IF EXISTS {ESQUEMA} CASCADE")
+
+
+def test_migrar_base_con_datos(legado):
+    legado.migrar()
+    sql = legado.consultar
+
+    versiones = [f['version'] for f in sql("SELECT version FROM schema_migraciones ORDER BY 1")]
+    assert versiones == [m[0] for m in legado.MIGRACIONES]
+
+    usuarios = {f['usuario']: f['password_hash'] for f in sql("SELECT * FROM usuarios")}
+    assert legado.hasher.verify(usuarios['admin'], 'secreta')
+    assert legado.hasher.verify(usuarios['vecino'], 'clave7')
+
+    # Casas canónicas y saldos rehechos sobre ellas
+    saldos = {f['casa']: (f['total_pagado'], f['num_pagos'])
+              for f in sql("SELECT * FROM saldos_casa")}
+    assert saldos == {'7': (Decimal('25'), 2), '12': (Decimal('5'), 1), 'A1': (Decimal('3'), 1)}
+    assert sql("SELECT ingresos, egresos FROM totales_finanzas")[0] == {
+        'ingresos': Decimal('33'), 'egresos': Decimal('4')}
+
+    resumen = {f['descripcion']: (f['pagadas'], f['parciales'], f['pendientes']) for f in sql("""
+        SELECT c.descripcion, r.* FROM cuota_resumen r JOIN cuotas c ON c.id = r.cuota_id
+    """)}
+    assert resumen == {'Enero': (1, 1, 248), 'Febrero': (1, 0, 249)}
+
+    pago = sql("SELECT comprobante FROM pagos WHERE fecha = '2026-01-05'")[0]
+    nombre = 'pagos/0f3c2a8e-5b1d-4c6e-9f7a-2d4b6c8e0a1f.pdf'
+    assert pago['comprobante'] == f'/files/{nombre}'
+    assert sql("SELECT url, backend FROM archivos WHERE nombre = %s", (nombre,)) == [
+        {'url': COMPROBANTE, 'backend': 'supabase'}]
+
+    assert sql("SELECT count(*) AS n FROM minutas WHERE busqueda @@ plainto_tsquery('spanish', 'agua')")[0]['n'] == 1
+
+
+def test_migrar_dos_veces_no_cambia_nada(legado):
+    legado.migrar()
+    antes = legado.consultar("SELECT version, aplicada FROM schema_migraciones ORDER BY 1")
+    hashes = legado.consultar("SELECT password_hash FROM usuarios ORDER BY id")
+    legado.migrar()
+    assert legado.consultar("SELECT version, aplicada FROM schema_migraciones ORDER BY 1") == antes
+    assert legado.consultar("SELECT password_hash FROM usuarios ORDER BY id") == hashes
+
+
+def test_invalida_caches_despues_del_commit(legado, monkeypatch):
+    vistas = []
+
+    def invalidar(*tablas):
+        # Desde otra conexión: lo que se ve es lo que ya se confirmó
+        conn = psycopg2.connect(make_dsn(legado.DATABASE_URL, options=f'-c search_path={ESQUEMA}'))
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT to_regclass('schema_migraciones') IS NOT NULL")
+                vistas.append((tablas, cur.fetchone()[0]))
+        finally:
+            conn.close()
+
+    monkeypatch.setattr(legado, 'invalidar', invalidar)
+    legado.migrar()
+    assert vistas == [(('pagos', 'usuarios'), True)]
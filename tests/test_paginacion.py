@@ -0,0 +1,49 @@
+def paginas(cliente, ruta, limite):
+    """Recorre el listado siguiendo 'siguiente' y devuelve las páginas."""
+    resultado = []
+    token = None
+    while True:
+        consulta = {'limite': limite, **({'before': token} if token else {})}
+        r = cliente.get(ruta, query_string=consulta)
+        assert r.status_code == 200
+        datos = r.get_json()
+        resultado.append([(f['id'], f['fecha']) for f in datos['items']])
+        token = datos['siguiente']
+        if token is None:
+            return resultado
+
+
+def test_recorre_todo_con_fechas_nulas_al_final(limpia, cliente, sql):
+    sql("""
+        INSERT INTO minutas (titulo, fecha) VALUES
+            ('a', '2026-01-10'), ('b', NULL), ('c', '2026-01-12'), ('d', '2026-01-10'),
+            ('e', NULL), ('f', '2026-01-11'), ('g', '2026-01-12')
+    """)
+    vistas = paginas(cliente, '/api/minutas', 2)
+
+    assert [len(p) for p in vistas] == [2, 2, 2, 1]
+    assert sum(vistas, []) == [
+        (7, '2026-01-12'), (3, '2026-01-12'), (6, '2026-01-11'), (4, '2026-01-10'),
+        (1, '2026-01-10'), (5, None), (2, None)]
+
+
+def test_pagina_exacta_no_deja_token(cliente, sql):
+    sql("INSERT INTO sugerencias (texto, fecha) VALUES ('x', now()), ('y', NULL)")
+    assert [len(p) for p in paginas(cliente, '/api/sugerencias', 2)] == [2]
+
+
+def test_token_o_limite_invalidos_dan_400(limpia, cliente):
+    import base64
+    malos = ['%%%', 'bm8tZXMtdW4tY3Vyc29y',
+             base64.urlsafe_b64encode(b'2026-13-40|1').decode(),
+             base64.urlsafe_b64encode(b'-infinity|x').decode()]
+    for token in malos:
+        assert cliente.get('/api/minutas', query_string={'before': token}).status_code == 400
+    assert cliente.get('/api/minutas', query_string={'limite': 'diez'}).status_code == 400
+
+
+def test_token_de_fecha_nula_se_acepta(limpia, cliente, sql):
+    sql("INSERT INTO minutas (titulo, fecha) VALUES ('a', NULL), ('b', NULL)")
+    token = limpia.codificar_cursor({'fecha': None, 'id': 2})
+    r = cliente.get('/api/minutas', query_string={'before': token})
+    assert [f['id'] for f in r.get_json()['items']] == [1]
@@ -0,0 +1,50 @@
+import threading
+
+
+def test_conexion_nueva_se_abre_fuera_del_lock(base):
+    pool = base.PoolConexiones(base.DATABASE_URL, minconn=1, maxconn=3, timeout=5, validar_tras=0)
+    try:
+        abierta = pool.getconn()
+        abrir = pool._abrir
+        en_connect = threading.Event()
+        seguir = threading.Event()
+
+        def abrir_lento():
+            en_connect.set()
+            seguir.wait(5)
+            return abrir()
+
+        pool._abrir = abrir_lento
+        nuevas = []
+        hilo = threading.Thread(target=lambda: nuevas.append(pool.getconn()))
+        hilo.start()
+        assert en_connect.wait(5)
+        # Mientras el otro hilo conecta, devolver y volver a tomar no espera
+        pool.putconn(abierta)
+        assert pool.stats()['ociosas'] == 1
+        pool.putconn(pool.getconn())
+        seguir.set()
+        hilo.join(5)
+
+        assert nuevas and not nuevas[0].closed
+        # Con validar_tras=0 se validan las dos que salieron de las libres,
+        # no la recién abierta
+        assert pool.stats()['validaciones'] == 2
+        pool.putconn(nuevas[0])
+        assert pool.stats()['ociosas'] == 1 and pool.stats()['en_uso'] == 0
+    finally:
+        pool.closeall()
+
+
+def test_transaccion_abierta_se_deshace_al_devolver(base):
+    pool = base.PoolConexiones(base.DATABASE_URL, minconn=1, maxconn=2, timeout=5, validar_tras=60)
+    try:
+        conn = pool.getconn()
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        pool.putconn(conn)
+        assert pool.getconn() is conn
+        assert conn.info.transaction_status == base.psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    finally:
+        pool.closeall()
+    assert conn.closed and pool.closed
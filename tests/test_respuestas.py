@@ -0,0 +1,40 @@
+import gzip
+
+
+def test_revalidacion_con_etag(cliente, sql):
+    sql("INSERT INTO minutas (titulo, fecha) VALUES ('Asamblea', '2026-01-10')")
+    r = cliente.get('/minutas')
+    etag = r.headers['ETag']
+    assert r.status_code == 200 and etag.startswith('W/')
+    assert r.headers['Cache-Control'] == 'no-cache' and r.headers['X-Version-Datos']
+
+    r = cliente.get('/minutas', headers={'If-None-Match': etag})
+    assert r.status_code == 304 and r.data == b'' and r.headers['ETag'] == etag
+
+    # Un cambio en la tabla cambia el ETag y la página vuelve completa
+    sql("INSERT INTO minutas (titulo, fecha) VALUES ('Otra', '2026-01-11')")
+    r = cliente.get('/minutas', headers={'If-None-Match': etag})
+    assert r.status_code == 200 and r.headers['ETag'] != etag
+    assert 'Otra' in r.get_data(as_text=True)
+
+
+def test_etag_por_consulta(cliente):
+    assert cliente.get('/api/minutas').headers['ETag'] != \
+        cliente.get('/api/minutas?limite=1').headers['ETag']
+
+
+def test_variantes_comprimidas(limpia, cliente):
+    plano = cliente.get('/estado-cuenta', headers={'Accept-Encoding': 'identity'})
+    comprimido = cliente.get('/estado-cuenta', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in plano.headers
+    assert comprimido.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in comprimido.headers['Vary']
+    assert gzip.decompress(comprimido.data) == plano.data
+    assert comprimido.headers['ETag'] == plano.headers['ETag']
+
+
+def test_con_sesion_no_se_cachea(limpia, admin):
+    antes = limpia.cache_respuestas.stats()
+    r = admin.get('/minutas')
+    assert r.status_code == 200 and 'ETag' not in r.headers
+    assert limpia.cache_respuestas.stats() == antes
@@ -0,0 +1,78 @@
+import io
+from decimal import Decimal
+
+
+def registrar_gasto(admin, descripcion, monto):
+    return admin.post('/admin/gasto', data={
+        'descripcion': descripcion, 'monto': monto, 'factura': (io.BytesIO(b''), ''),
+    }, content_type='multipart/form-data')
+
+
+def saldos(sql):
+    return ([dict(f) for f in sql("SELECT * FROM saldos_casa ORDER BY casa")],
+            dict(sql("SELECT ingresos, egresos FROM totales_finanzas")[0]))
+
+
+def test_pagos_y_gastos_actualizan_saldos(admin, sql, pagar):
+    for casa, monto in [('1', '10'), ('1', '15'), ('2', '5')]:
+        assert pagar(casa, monto).status_code == 302
+    assert registrar_gasto(admin, 'luz', '4').status_code == 302
+
+    por_casa, totales = saldos(sql)
+    assert [(f['casa'], f['total_pagado'], f['num_pagos']) for f in por_casa] == [
+        ('1', Decimal('25'), 2), ('2', Decimal('5'), 1)]
+    assert totales == {'ingresos': Decimal('30'), 'egresos': Decimal('4')}
+
+
+def test_borrar_revierte_saldos(admin, sql, pagar):
+    pagar('3', '7.5')
+    pagar('3', '2.5')
+    registrar_gasto(admin, 'agua', '6')
+    assert admin.post('/admin/delete/pago/1').status_code == 302
+    assert admin.post('/admin/delete/gasto/1').status_code == 302
+
+    por_casa, totales = saldos(sql)
+    assert [(f['casa'], f['total_pagado'], f['num_pagos']) for f in por_casa] == [
+        ('3', Decimal('2.5'), 1)]
+    assert totales == {'ingresos': Decimal('2.5'), 'egresos': Decimal('0')}
+
+    admin.post('/admin/delete/pago/2')
+    assert saldos(sql)[0] == []
+
+
+def test_incremental_igual_a_reconstruir(admin, sql, limpia, pagar):
+    for casa, monto in [('4', '10'), ('5', '3'), ('4', '1'), ('250', '9')]:
+        pagar(casa, monto)
+    admin.post('/admin/delete/pago/2')
+    registrar_gasto(admin, 'poda', '12')
+    antes = saldos(sql)
+
+    cur, conn = limpia.get_cursor()
+    try:
+        limpia.reconstruir_saldos(cur)
+        conn.commit()
+    finally:
+        limpia.release_conn(conn)
+    assert saldos(sql) == antes
+
+
+def test_estado_cuenta_muestra_totales(admin, cliente, pagar):
+    pagar('1', '37.50')
+    registrar_gasto(admin, 'luz', '4')
+    html = cliente.get('/estado-cuenta').get_data(as_text=True)
+    assert '$37.50' in html and '$4.00' in html and '$33.50' in html
+
+
+def test_estado_cuenta_pagina_los_gastos(cliente, sql):
+    sql("""
+        INSERT INTO gastos (descripcion, monto, fecha)
+        SELECT 'gasto ' || g, 1, date '2026-01-01' + g FROM generate_series(1, 5) g
+    """)
+    html = cliente.get('/estado-cuenta?limite=2').get_data(as_text=True)
+    assert 'gasto 5' in html and 'gasto 4' in html and 'gasto 3' not in html
+    assert 'Más antiguos' in html
+
+    token = html.split('?before=', 1)[1].split('"', 1)[0]
+    html = cliente.get(f'/estado-cuenta?limite=2&before={token}').get_data(as_text=True)
+    assert 'gasto 3' in html and 'gasto 2' in html and 'gasto 5' not in html
+    assert cliente.get('/estado-cuenta?before=zzz').status_code == 400
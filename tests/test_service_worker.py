@@ -0,0 +1,79 @@
+import json
+import os
+import shutil
+
+import pytest
+
+
+@pytest.fixture
+def estaticos(limpia, tmp_path, monkeypatch):
+    """Copia de static/ sin dist para que el comando assets no toque el repo."""
+    origen = limpia.app.static_folder
+    destino = tmp_path / 'static'
+    destino.mkdir()
+    for nombre in (limpia.FUENTE_ICONOS, 'manifest.json'):
+        shutil.copy(os.path.join(origen, nombre), destino / nombre)
+    shutil.copytree(os.path.join(origen, 'vendor'), destino / 'vendor')
+
+    monkeypatch.setattr(limpia.app, 'static_folder', str(destino))
+    monkeypatch.setattr(limpia, 'ASSETS_DIR', str(destino / 'dist'))
+    monkeypatch.setattr(limpia, 'ASSETS_MAPA', str(destino / 'assets.json'))
+    monkeypatch.setattr(limpia, 'mapa_assets', {})
+    return destino
+
+
+def test_service_worker(limpia, cliente):
+    r = cliente.get('/sw.js')
+    cuerpo = r.get_data(as_text=True)
+    assert r.status_code == 200 and r.mimetype == 'application/javascript'
+    assert r.headers['Cache-Control'] == 'no-cache'
+    assert json.dumps(limpia.precarga_service_worker()) in cuerpo
+    assert json.dumps(sorted(limpia.PAGINAS_OFFLINE)) in cuerpo
+    assert cliente.get('/sw.js').data == r.data
+
+
+def test_version_cambia_solo_con_sus_tablas(limpia, cliente):
+    r = cliente.get('/api/version')
+    antes = r.get_json()
+    assert r.headers['Cache-Control'] == 'no-store'
+    assert set(antes) == set(limpia.PAGINAS_OFFLINE)
+    # La misma versión que trae la página: el service worker las compara
+    assert cliente.get('/minutas').headers['X-Version-Datos'] == antes['/minutas']
+
+    cur, conn = limpia.get_cursor()
+    try:
+        cur.execute("INSERT INTO minutas (titulo, fecha) VALUES ('Asamblea', '2026-01-10')")
+        conn.commit()
+    finally:
+        limpia.release_conn(conn)
+    limpia.invalidar('minutas')
+
+    despues = cliente.get('/api/version').get_json()
+    assert despues['/minutas'] != antes['/minutas']
+    assert {r: v for r, v in despues.items() if r != '/minutas'} == \
+        {r: v for r, v in antes.items() if r != '/minutas'}
+
+
+def test_assets_con_huella(limpia, cliente, estaticos):
+    assert limpia.asset_url('bootstrap.min.css') == '/static/bootstrap.min.css'
+
+    r = limpia.app.test_cli_runner().invoke(args=['assets'])
+    assert r.exit_code == 0, r.output
+
+    mapa = json.loads((estaticos / 'assets.json').read_text())
+    assert limpia.mapa_assets == mapa
+    assert sorted(os.listdir(estaticos / 'dist')) == sorted(mapa.values())
+    for base, _ in limpia.RENDICIONES_ICONOS:
+        assert f'{base}.png' in mapa and f'{base}.webp' in mapa
+    manifest = json.loads((estaticos / 'manifest.json').read_text())
+    assert [i['sizes'] for i in manifest['icons']] == ['192x192', '512x512']
+    assert all(i['src'].startswith('/static/dist/') for i in manifest['icons'])
+
+    url = limpia.asset_url('bootstrap.min.css')
+    assert url == f"/static/dist/{mapa['bootstrap.min.css']}"
+    assert url in cliente.get('/sw.js').get_data(as_text=True)
+    r = cliente.get(url)
+    assert r.status_code == 200
+    assert r.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    # Fuera de dist los archivos no llevan huella: nada de immutable
+    assert 'immutable' not in cliente.get('/static/manifest.json').headers.get('Cache-Control', '')
@@ -0,0 +1,99 @@
+import hashlib
+import io
+
+import pytest
+from PIL import Image
+
+
+def imagen(ancho, alto, formato='JPEG', exif=True):
+    im = Image.new('RGB', (ancho, alto), (200, 120, 40))
+    datos = io.BytesIO()
+    opciones = {}
+    if exif:
+        info = Image.Exif()
+        info[0x010F] = 'Camara'  # Make
+        opciones['exif'] = info
+    im.save(datos, formato, **opciones)
+    return datos.getvalue()
+
+
+def abrir(subidas, url):
+    return Image.open(io.BytesIO(subidas._almacen.objetos[url.removeprefix('/files/')]))
+
+
+def test_optimiza_y_genera_vista_previa_en_la_cola(subidas, pagar, sql, monkeypatch):
+    monkeypatch.setattr(subidas, 'IMAGEN_MAX_LADO', 300)
+    contenido = imagen(800, 600)
+    nombre = f"pagos/{hashlib.sha256(contenido).hexdigest()}.jpg"
+
+    pagar('3', '10', comprobante=contenido, nombre='foto.JPG')
+    # La petición solo deja la tarea: nada se procesó todavía
+    tarea = sql("SELECT nombre, procesada, ruta_local FROM subidas_pendientes")[0]
+    assert tarea['nombre'] == nombre and not tarea['procesada']
+    with open(tarea['ruta_local'], 'rb') as f:
+        assert f.read() == contenido
+
+    subidas.procesar_subidas()
+    pago = sql("SELECT comprobante, comprobante_miniatura FROM pagos")[0]
+    assert pago == {'comprobante': f'/files/{nombre}',
+                    'comprobante_miniatura': f'/files/{nombre[:-4]}-min.webp'}
+    with abrir(subidas, pago['comprobante']) as original:
+        assert original.size == (300, 225) and not original.getexif()
+    with abrir(subidas, pago['comprobante_miniatura']) as vista:
+        assert vista.format == 'WEBP' and max(vista.size) == subidas.VISTA_PREVIA_LADO
+    assert sql("SELECT count(*) AS n FROM subidas_pendientes")[0]['n'] == 0
+
+
+def test_vista_previa_de_pdf(subidas, pagar, sql):
+    datos = io.BytesIO()
+    Image.new('RGB', (600, 800), 'white').save(datos, 'PDF')
+    pagar('3', '10', comprobante=datos.getvalue(), nombre='c.pdf')
+    subidas.procesar_subidas()
+
+    pago = sql("SELECT comprobante, comprobante_miniatura FROM pagos")[0]
+    assert pago['comprobante'].endswith('.pdf')
+    with abrir(subidas, pago['comprobante_miniatura']) as vista:
+        assert vista.size == (120, 160)
+
+
+def test_reenvio_enlaza_original_y_vista_previa(subidas, pagar, sql):
+    contenido = imagen(200, 100, 'PNG', exif=False)
+    pagar('3', '10', comprobante=contenido, nombre='a.png')
+    subidas.procesar_subidas()
+    primero = sql("SELECT comprobante, comprobante_miniatura FROM pagos")[0]
+
+    pagar('4', '10', comprobante=contenido, nombre='b.png')
+    assert sql("SELECT comprobante, comprobante_miniatura FROM pagos WHERE casa = '4'")[0] == primero
+    assert sql("SELECT count(*) AS n FROM subidas_pendientes")[0]['n'] == 0
+
+
+@pytest.mark.parametrize('contenido, nombre', [(b'texto plano', 'nota.txt'),
+                                               (b'no es una imagen', 'roto.jpg')])
+def test_sin_vista_previa_se_sube_igual(subidas, pagar, sql, contenido, nombre):
+    pagar('3', '10', comprobante=contenido, nombre=nombre)
+    subidas.procesar_subidas()
+    pago = sql("SELECT comprobante, comprobante_miniatura FROM pagos")[0]
+    assert pago['comprobante'] and pago['comprobante_miniatura'] is None
+    assert subidas._almacen.objetos[pago['comprobante'].removeprefix('/files/')] == contenido
+
+
+def test_fallo_del_almacen_se_reintenta(subidas, pagar, sql, monkeypatch):
+    def caido(ruta, nombre, mime):
+        raise OSError('sin red')
+
+    monkeypatch.setattr(subidas._almacen, 'subir', caido)
+    pagar('3', '10', comprobante=b'comprobante', nombre='c.txt')
+    subidas.procesar_subidas()
+
+    tarea = sql("""
+        SELECT estado, intentos, ultimo_error, proximo_intento > now() AS espera
+        FROM subidas_pendientes
+    """)[0]
+    assert tarea == {'estado': 'pendiente', 'intentos': 1, 'ultimo_error': 'sin red', 'espera': True}
+    assert sql("SELECT comprobante FROM pagos")[0]['comprobante'] is None
+
+    # Agotados los intentos queda en error y no se vuelve a tomar
+    sql("UPDATE subidas_pendientes SET intentos = %s, proximo_intento = now()",
+        (subidas.UPLOAD_MAX_INTENTOS - 1,))
+    subidas.procesar_subidas()
+    assert sql("SELECT estado FROM subidas_pendientes")[0]['estado'] == 'error'